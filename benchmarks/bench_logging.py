@@ -0,0 +1,86 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Import time of the package modules in fresh interpreters, and per call cost
+of request logging with DEBUG disabled, sampled and fully enabled, against
+formatting the message eagerly as every call used to.
+
+    python -m benchmarks.bench_logging [-n 100000] [--imports 10]
+"""
+import argparse
+import logging
+import subprocess
+import sys
+import time
+
+from opensearch import log, reqlog
+
+MODULES = ('opensearch', 'opensearch.api', 'opensearch.asyncclient')
+
+
+def import_time(module, repeat):
+    code = "import time; t = time.time(); import %s; print time.time() - t" % module
+    return min(float(subprocess.check_output([sys.executable, '-c', code])) for _ in xrange(repeat))
+
+
+def eager(url, method, params, status, body, elapsed):
+    log.debug("[httplib] request url: %s, method: %s params: %s" % (url, method, params))
+    log.debug("[httplib] response status: %s body: %s" % (status, body))
+
+
+def measure(fn, number, args):
+    started = time.time()
+    for _ in xrange(number):
+        fn(*args)
+    return (time.time() - started) / number * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_logging')
+    parser.add_argument('-n', '--number', type=int, default=100000)
+    parser.add_argument('--imports', type=int, default=10, help='fresh interpreters per module')
+    args = parser.parse_args(argv)
+
+    for module in MODULES:
+        print "%-40s %8.2f ms" % ('import ' + module, import_time(module, args.imports) * 1000)
+
+    params = dict(('param%d' % i, 'value%d' % i) for i in xrange(12))
+    params['Signature'] = 'secret'
+    call = ('http://opensearch-cn-hangzhou.aliyuncs.com/search', 'GET', params, 200,
+            '{"status":"OK","result":{"items":[%s]}}' % ','.join(['{"id":"1"}'] * 500), 0.01)
+
+    class Discard(logging.Handler):
+        def emit(self, record):
+            self.format(record)
+
+    handler = Discard()
+    log.addHandler(handler)
+    try:
+        for level, sample_rate in ((logging.INFO, 1.0), (logging.DEBUG, 0.01), (logging.DEBUG, 1.0)):
+            log.setLevel(level)
+            reqlog.configure(sample_rate=sample_rate, max_body=256)
+            name = "%s sample %s" % (logging.getLevelName(level), sample_rate)
+            base = measure(eager, args.number, call)
+            lazy = measure(reqlog.log_exchange, args.number, ('httplib',) + call)
+            print "%-40s %8.2f us/call (eager %8.2f us/call)" % (name, lazy, base)
+    finally:
+        log.removeHandler(handler)
+        log.setLevel(logging.NOTSET)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Push throughput of Document.push_json chunks encoded on the calling thread
+against ParallelPusher with 1, 2, 4 ... worker processes. Encoded bodies go
+to an http client that discards them, so only the cpu work is measured.
+
+    python -m benchmarks.bench_parallel_push [--docs 100000] [--processes 1,2,4]
+"""
+import argparse
+import time
+
+from multiprocessing import cpu_count
+from opensearch.api import Document, OpenSearchClient
+from opensearch.bulk import ParallelPusher
+from opensearch.encoding import encode_form
+from opensearch.httpclient import HttpClient
+
+TITLE = u'科比布莱恩特职业生涯最后一场比赛砍下六十分'
+BODY = u'洛杉矶湖人队在主场迎战犹他爵士队，科比在告别战中全场出手五十次，带领球队逆转取胜。'
+
+
+class DiscardHttpClient(HttpClient):
+
+    form_encoding = 'urlencoded'
+
+    def request(self, url, method, params, timeout=None, trace=None):
+        encode_form(params, self.form_encoding)
+        return '{"status":"OK","result":""}'
+
+
+def make_records(n):
+    return [dict(id=str(i), title=TITLE, body=BODY * 4, price=i % 500, tags=[u'篮球', u'湖人'])
+            for i in xrange(n)]
+
+
+def serial(document, records, max_items):
+    for start in xrange(0, len(records), max_items):
+        items = [document.make_item('add', fields) for fields in records[start:start + max_items]]
+        document.push_json(document.jsonify(items))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_parallel_push')
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--max-items', type=int, default=1000)
+    parser.add_argument('--processes', default=None, help='comma separated, 1,2,4 up to the cpus by default')
+    args = parser.parse_args(argv)
+
+    levels = args.processes and [int(p) for p in args.processes.split(',')] or \
+        sorted(set([1, 2, 4, cpu_count()]))
+    records = make_records(args.docs)
+    document = Document(OpenSearchClient('http://discard', 'id', 'secret', httpclient=DiscardHttpClient()),
+                        'app', 'main')
+    print "%d documents, %d cpus" % (args.docs, cpu_count())
+
+    started = time.time()
+    serial(document, records, args.max_items)
+    base = time.time() - started
+    print "%-16s %10.0f docs/s" % ('calling thread', args.docs / base)
+
+    for processes in levels:
+        with ParallelPusher(document, processes=processes, threads=2, max_items=args.max_items) as pusher:
+            started = time.time()
+            results = pusher.push(records)
+            elapsed = time.time() - started
+        assert all(result.success for result in results)
+        print "%-16s %10.0f docs/s %6.2fx" % ('%d processes' % processes, args.docs / elapsed, base / elapsed)
+
+
+if __name__ == '__main__':
+    main()
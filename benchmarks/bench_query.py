@@ -0,0 +1,69 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Per request query building cost of SimpleQuery.build against binding a
+QueryTemplate compiled once.
+
+    python -m benchmarks.bench_query [-n 100000]
+"""
+import argparse
+import time
+
+from opensearch.query import Param, SimpleQuery
+
+
+def build_simple(i):
+    return SimpleQuery().query_by('title', "'kobe%d'" % (i % 100)).\
+        filter_by('price', '<', i % 500).\
+        config_by(start=(i % 10) * 10, hint=10).\
+        add_sort('price').add_sort('hot', False).\
+        set_kvpair('duniqfield', 'shop_id').\
+        add_aggregate('brand', ['count()'], '0~100').\
+        build()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_query')
+    parser.add_argument('-n', '--number', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    template = SimpleQuery().query_by('title', Param('keyword')).\
+        filter_by('price', '<', Param('max_price')).\
+        config_by(start=Param('start'), hint=10).\
+        add_sort('price').add_sort('hot', False).\
+        set_kvpair('duniqfield', 'shop_id').\
+        add_aggregate('brand', ['count()'], '0~100').\
+        compile()
+    assert template.bind(keyword='kobe1', max_price=1, start=10) == build_simple(1)
+
+    started = time.time()
+    for i in xrange(args.number):
+        build_simple(i)
+    base = time.time() - started
+    print "%-20s %8.2f us/query" % ('SimpleQuery.build', base / args.number * 1e6)
+
+    bind = template.bind
+    started = time.time()
+    for i in xrange(args.number):
+        bind(keyword='kobe%d' % (i % 100), max_price=i % 500, start=(i % 10) * 10)
+    elapsed = time.time() - started
+    print "%-20s %8.2f us/query %6.2fx" % ('QueryTemplate.bind', elapsed / args.number * 1e6,
+                                           base / elapsed)
+
+
+if __name__ == '__main__':
+    main()
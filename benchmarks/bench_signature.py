@@ -0,0 +1,92 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Signing throughput of Signature.sign, Signer.sign and Signer.sign_many against
+the original implementation, which imported hashlib/hmac/binascii and rebuilt
+the HMAC key on every call.
+
+    python -m benchmarks.bench_signature [-n 20000]
+"""
+import argparse
+import time
+import urllib
+
+from opensearch.signature import Signature, Signer
+
+SECRET = 'accesskeysecretfortesting0123456'
+
+
+class LegacySignature(object):
+
+    def sign(self, key, http_method, querys):
+        querys.pop('Signature')
+        canonicalized = urllib.urlencode(sorted(querys.iteritems(), key=lambda d: d[0]))
+        base_string = "%s&%%2F&%s" % (http_method, urllib.quote(canonicalized))
+        return self.hmac_sha1(key + '&', base_string)
+
+    def hmac_sha1(self, key, raw):
+        from hashlib import sha1
+        import hmac
+        import binascii
+
+        hashed = hmac.new(key, raw, sha1)
+        return binascii.b2a_base64(hashed.digest())[:-1]
+
+
+def make_params(i):
+    return {
+        'Version': 'v2',
+        'AccessKeyId': 'accesskeyid',
+        'Signature': '',
+        'SignatureMethod': 'HMAC-SHA1',
+        'Timestamp': '2015-11-18T08:00:00Z',
+        'SignatureVersion': '1.0',
+        'SignatureNonce': str(1447833600000000 + i),
+        'query': "query=title:'北京大学'&&config=start:0,hint:10,format:json&&sort=-hot",
+        'index_name': 'app',
+        'formula_name': 'hot',
+    }
+
+
+def run(name, fn, number):
+    batch = [make_params(i) for i in range(number)]
+    started = time.time()
+    fn(batch)
+    elapsed = time.time() - started
+    print "%-24s %10.0f signs/s %8.2f us/sign" % (name, number / elapsed, elapsed / number * 1e6)
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_signature')
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    legacy, signature, signer = LegacySignature(), Signature(), Signer(SECRET)
+    assert legacy.sign(SECRET, 'GET', make_params(0)) == signer.sign('GET', make_params(0))
+
+    base = run('legacy Signature.sign', lambda batch: [legacy.sign(SECRET, 'GET', q) for q in batch],
+               args.number)
+    for name, fn in (('Signature.sign', lambda batch: [signature.sign(SECRET, 'GET', q) for q in batch]),
+                     ('Signer.sign', lambda batch: [signer.sign('GET', q) for q in batch]),
+                     ('Signer.sign_many', lambda batch: signer.sign_many('GET', batch))):
+        elapsed = run(name, fn, args.number)
+        print "%-24s %10.2fx" % ('  speedup', base / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Enqueue latency of Spool.add with group commit and with wait_sync, then
+the drain rate of a SpoolConsumer pushing to the stub server.
+
+    python -m benchmarks.bench_spool [--docs 20000] [--dir /tmp/spool]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.stub import StubServer
+from opensearch.api import Document, OpenSearchClient
+from opensearch.spool import Spool, SpoolConsumer
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+def enqueue(document, directory, docs, wait_sync):
+    latencies = []
+    with Spool(document, directory, wait_sync=wait_sync) as spool:
+        for i in xrange(docs):
+            started = time.time()
+            spool.add(dict(id=str(i), title=u'北京大学', price=i % 500))
+            latencies.append(time.time() - started)
+        syncs = spool.syncs
+    latencies.sort()
+    print "%-12s p50 %8.1fus p99 %8.1fus max %8.1fus %6d fsyncs" % (
+        wait_sync and 'wait_sync' or 'group commit', percentile(latencies, 50) * 1e6,
+        percentile(latencies, 99) * 1e6, latencies[-1] * 1e6, syncs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_spool')
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--dir', default=None, help='spool directory, a temporary one by default')
+    args = parser.parse_args(argv)
+
+    directory = args.dir or tempfile.mkdtemp(prefix='opensearch-spool-')
+    try:
+        with StubServer() as server:
+            client = OpenSearchClient(server.url, server.access_key_id, server.access_key_secret)
+            document = Document(client, 'app', 'main')
+            enqueue(document, directory, args.docs, False)
+            enqueue(document, directory, args.docs / 10, True)
+
+            started = time.time()
+            pushed = SpoolConsumer(document, directory).drain()
+            elapsed = time.time() - started
+            print "drained %d operations in %.2fs, %.0f ops/s" % (pushed, elapsed, pushed / elapsed)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
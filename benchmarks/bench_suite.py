@@ -0,0 +1,256 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Throughput and p50/p99 latency of signing, query building, search and push,
+against the in-process stub server, for every transport and concurrency level.
+Runs offline; --json writes the results for comparison between runs.
+
+    python -m benchmarks.bench_suite [-n 2000] [--concurrency 1,4,16]
+        [--transports httplib,requests,async] [--latency 0.001] [--error-rate 0] [--json out.json]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from benchmarks.stub import StubServer
+from opensearch.api import Document, OpenSearchClient, Search
+from opensearch.asyncclient import AsyncOpenSearchClient
+from opensearch.exception import OpenSearchError
+from opensearch.httpclient import DefaultHttpClient, RequestsHttpClient
+from opensearch.query import Param, SimpleQuery
+from opensearch.signature import Signature, Signer
+
+TRANSPORTS = ('httplib', 'requests', 'async')
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class Result(object):
+
+    def __init__(self, name, transport, concurrency, latencies, errors, elapsed):
+        latencies = sorted(latencies)
+        self.name = name
+        self.transport = transport
+        self.concurrency = concurrency
+        self.count = len(latencies)
+        self.errors = errors
+        self.throughput = self.count / max(elapsed, 1e-9)
+        self.p50 = percentile(latencies, 50)
+        self.p99 = percentile(latencies, 99)
+
+    def to_dict(self):
+        return dict(name=self.name, transport=self.transport, concurrency=self.concurrency,
+                    count=self.count, errors=self.errors, throughput=self.throughput,
+                    p50=self.p50, p99=self.p99)
+
+    def __str__(self):
+        return "%-14s %-9s %4s %10.1f ops/s p50 %9.3f ms p99 %9.3f ms errors %d" % (
+            self.name, self.transport, self.concurrency, self.throughput,
+            (self.p50 or 0) * 1000, (self.p99 or 0) * 1000, self.errors)
+
+
+def run_local(name, fn, number):
+    """Time fn() number times on the calling thread.
+    """
+    latencies = []
+    started = time.time()
+    for i in xrange(number):
+        t = time.time()
+        fn(i)
+        latencies.append(time.time() - t)
+    return Result(name, '-', 1, latencies, 0, time.time() - started)
+
+
+def run_threads(name, transport, fn, number, concurrency):
+    """Call fn(i) number times from concurrency threads.
+    """
+    latencies = []
+    errors = [0]
+    counter = iter(xrange(number))
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            t = time.time()
+            try:
+                fn(i)
+            except OpenSearchError:
+                with lock:
+                    errors[0] += 1
+                continue
+            local.append(time.time() - t)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in xrange(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Result(name, transport, concurrency, latencies, errors[0], time.time() - started)
+
+
+def run_futures(name, fn, number, concurrency):
+    """Keep concurrency futures returned by fn(i) in flight until number are done.
+    """
+    latencies = []
+    errors = [0]
+    done = threading.Semaphore(0)
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def submit(i):
+        slots.acquire()
+        t = time.time()
+
+        def on_done(future):
+            if future.exception() is None:
+                latencies.append(time.time() - t)
+            else:
+                errors[0] += 1
+            slots.release()
+            done.release()
+        fn(i).add_done_callback(on_done)
+
+    started = time.time()
+    for i in xrange(number):
+        submit(i)
+    for _ in xrange(number):
+        done.acquire()
+    return Result(name, 'async', concurrency, latencies, errors[0], time.time() - started)
+
+
+def make_client(transport, stub, concurrency):
+    if transport == 'async':
+        return AsyncOpenSearchClient(stub.url, stub.access_key_id, stub.access_key_secret,
+                                     max_concurrency=concurrency)
+    if transport == 'requests':
+        httpclient = RequestsHttpClient()
+    else:
+        httpclient = DefaultHttpClient(max_size=concurrency)
+    return OpenSearchClient(stub.url, stub.access_key_id, stub.access_key_secret, httpclient=httpclient)
+
+
+def make_query(i):
+    return SimpleQuery().query_by('title', "'kobe%d'" % (i % 100)).\
+        filter_by('price', '<', i % 500).config_by(start=(i % 10) * 10, hint=10).\
+        add_sort('price').build()
+
+
+def bench_local(number):
+    params = dict(Version='v2', AccessKeyId='stub-id', SignatureMethod='HMAC-SHA1',
+                  SignatureVersion='1.0', Timestamp='2015-11-18T00:00:00Z', index_name='app',
+                  fetch_fields='id;title;price', query=make_query(0))
+    signer = Signer('stub-secret')
+    signature = Signature()
+    template = SimpleQuery().query_by('title', Param('keyword')).\
+        filter_by('price', '<', Param('max_price')).config_by(start=Param('start'), hint=10).\
+        add_sort('price').compile()
+
+    def querys(i):
+        return dict(params, SignatureNonce=str(i))
+
+    return [
+        run_local('sign', lambda i: signature.sign('stub-secret', 'GET', querys(i)), number),
+        run_local('sign_signer', lambda i: signer.sign('GET', querys(i)), number),
+        run_local('query_build', make_query, number),
+        run_local('query_template', lambda i: template.bind(keyword='kobe%d' % (i % 100),
+                                                            max_price=i % 500,
+                                                            start=(i % 10) * 10), number),
+    ]
+
+
+def bench_remote(stub, transport, concurrency, number, docs_per_push):
+    client = make_client(transport, stub, concurrency)
+    search = Search(client, 'app')
+    document = Document(client, 'app', 'main')
+    queries = [make_query(i) for i in xrange(100)]
+    items = document.jsonify([document.make_item('add', dict(id=str(i), title=u'科比 %d' % i, price=i))
+                              for i in xrange(docs_per_push)]).encode('utf8')
+    try:
+        if transport == 'async':
+            return [
+                run_futures('search', lambda i: search.search(queries[i % 100]), number, concurrency),
+                run_futures('push', lambda i: document.push_json(items), number, concurrency),
+            ]
+        return [
+            run_threads('search', transport, lambda i: search.search(queries[i % 100]), number, concurrency),
+            run_threads('push', transport, lambda i: document.push_json(items), number, concurrency),
+        ]
+    finally:
+        client.close()
+        client.httpclient.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_suite')
+    parser.add_argument('-n', '--number', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated levels')
+    parser.add_argument('--transports', default=','.join(TRANSPORTS))
+    parser.add_argument('--docs-per-push', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.001, help='stub latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0, help='stub max extra latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='stub api error rate')
+    parser.add_argument('--http-error-rate', type=float, default=0, help='stub http 503 rate')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    transports = [t for t in args.transports.split(',') if t]
+    for transport in transports:
+        if transport not in TRANSPORTS:
+            parser.error("unknown transport: %s" % transport)
+
+    results = bench_local(args.number * 10)
+    for result in results:
+        print result
+    with StubServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    http_error_rate=args.http_error_rate) as stub:
+        for transport in transports:
+            if transport == 'requests':
+                try:
+                    import requests
+                except ImportError:
+                    print "requests is not installed, skip"
+                    continue
+            for concurrency in levels:
+                for result in bench_remote(stub, transport, concurrency, args.number, args.docs_per_push):
+                    print result
+                    results.append(result)
+        failures = stub.counters.get('signature_failures', 0)
+    if failures:
+        print "stub rejected %d signatures" % failures
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([r.to_dict() for r in results], f, indent=2)
+    return failures and 1 or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Bytes on the wire and latency of pushing Chinese text documents and of
+reading search results, with the request body urlencoded or multipart and
+the response plain or gzip compressed. A local server sleeps as if every
+byte went through a link of the given bandwidth.
+
+    python -m benchmarks.bench_transport [--docs 200] [--bandwidth 20] [-n 20]
+"""
+import argparse
+import gzip
+import json
+import threading
+import time
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+from opensearch.api import Document
+from opensearch.encoding import encode_form
+from opensearch.httpclient import DefaultHttpClient
+
+TITLE = u'科比布莱恩特职业生涯最后一场比赛砍下六十分'
+BODY = u'洛杉矶湖人队在主场迎战犹他爵士队，科比在告别战中全场出手五十次，带领球队逆转取胜。'
+
+
+def make_docs(n):
+    return [dict(id=str(i), title=TITLE, body=BODY * 4, price=i % 500, tags=[u'篮球', u'湖人'])
+            for i in xrange(n)]
+
+
+def gzip_compress(data):
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _link(self, n):
+        time.sleep(n / self.server.bytes_per_second)
+
+    def do_GET(self):
+        body = self.server.search_body
+        headers = []
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = self.server.search_body_gzip
+            headers.append(('Content-Encoding', 'gzip'))
+        self._link(len(self.path) + len(body))
+        self._send(body, headers)
+
+    def do_POST(self):
+        n = int(self.headers['Content-Length'])
+        self.rfile.read(n)
+        self._link(n)
+        self._send('{"status":"OK","result":"","request_id":"1"}', [])
+
+    def _send(self, body, headers):
+        self.send_response(200)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, bandwidth, search_body):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.bytes_per_second = bandwidth * 1024 * 1024 / 8.0
+        self.search_body = search_body
+        self.search_body_gzip = gzip_compress(search_body)
+
+
+def latency(client, url, method, params, number):
+    started = time.time()
+    for _ in xrange(number):
+        client.request(url, method, params)
+    return (time.time() - started) / number * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_transport')
+    parser.add_argument('--docs', type=int, default=200, help='documents in one push')
+    parser.add_argument('--bandwidth', type=float, default=20, help='simulated link in Mbit/s')
+    parser.add_argument('-n', '--number', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    docs = make_docs(args.docs)
+    items = [dict(cmd='add', fields=doc) for doc in docs]
+    payloads = [
+        ('ensure_ascii urlencoded', json.dumps(items), 'urlencoded'),
+        ('utf8 urlencoded', json.dumps(items, ensure_ascii=False).encode('utf8'), 'urlencoded'),
+        ('compact urlencoded', Document(None, 'app', 'main').jsonify(items).encode('utf8'), 'urlencoded'),
+        ('compact multipart', Document(None, 'app', 'main').jsonify(items).encode('utf8'), 'multipart'),
+    ]
+    search_body = json.dumps(dict(status='OK', result=dict(items=docs[:50], num=50, total=1000)),
+                             ensure_ascii=False).encode('utf8')
+    server = Server(args.bandwidth, search_body)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    print "push of %d documents over %.0f Mbit/s" % (args.docs, args.bandwidth)
+    base = None
+    for name, items_json, form_encoding in payloads:
+        params = dict(action='push', table_name='main', items=items_json)
+        body, _ = encode_form(params, form_encoding)
+        client = DefaultHttpClient(form_encoding=form_encoding)
+        ms = latency(client, url + '/index/doc/app', 'POST', params, args.number)
+        client.close()
+        base = base or len(body)
+        print "  %-28s %9d bytes %5.2fx %8.2f ms" % (name, len(body), float(base) / len(body), ms)
+
+    print "search result of 50 documents"
+    for compress in (False, True):
+        client = DefaultHttpClient(compress=compress)
+        ms = latency(client, url + '/search', 'GET', dict(query="config=start:0,hit:50"), args.number)
+        client.close()
+        size = compress and len(server.search_body_gzip) or len(search_body)
+        print "  %-28s %9d bytes %5.2fx %8.2f ms" % (compress and 'gzip' or 'identity', size,
+                                                     float(len(search_body)) / size, ms)
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
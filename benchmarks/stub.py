@@ -0,0 +1,185 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+In-process stub of the OpenSearch api for offline benchmarks.
+
+It serves /search, /suggest, /index, /index/doc/<app> and /index/error/<app>,
+rejects requests whose signature does not match the one computed with
+opensearch.signature, and can add latency and fail requests on purpose.
+
+    with StubServer(latency=0.002, error_rate=0.01) as stub:
+        client = OpenSearchClient(stub.url, stub.access_key_id, stub.access_key_secret)
+"""
+import cgi
+import json
+import random
+import re
+import threading
+import time
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qsl, urlparse
+
+from opensearch.signature import Signature
+
+SIGNATURE_ERROR = (4003, 'signature not match')
+INJECTED_ERROR = (2001, 'injected error')
+NOT_FOUND_ERROR = (1000, 'api not found')
+
+_CONFIG_RE = re.compile(r'config=([^&]*)')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        self._handle(parsed.path, 'GET', dict(parse_qsl(parsed.query, keep_blank_values=True)))
+
+    def do_POST(self):
+        form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                environ={'REQUEST_METHOD': 'POST',
+                                         'CONTENT_TYPE': self.headers.get('Content-Type', '')},
+                                keep_blank_values=True)
+        params = dict((key, form.getfirst(key)) for key in form.keys())
+        self._handle(urlparse(self.path).path, 'POST', params)
+
+    def _handle(self, path, method, params):
+        server = self.server
+        server.count('requests')
+        delay = server.latency + (server.jitter and random.uniform(0, server.jitter) or 0)
+        if delay:
+            time.sleep(delay)
+        if server.http_error_rate and random.random() < server.http_error_rate:
+            server.count('http_errors')
+            return self._send(503, 'service unavailable')
+
+        signature = params.pop('Signature', None)
+        if params.get('AccessKeyId') != server.access_key_id or \
+                signature != Signature().sign(server.access_key_secret, method, dict(params)):
+            server.count('signature_failures')
+            return self._fail(SIGNATURE_ERROR)
+        if server.error_rate and random.random() < server.error_rate:
+            server.count('api_errors')
+            return self._fail(INJECTED_ERROR)
+
+        if path == '/search':
+            result = server.search_result(params)
+        elif path == '/suggest':
+            result = dict(suggestions=[dict(suggestion=params.get('query', '') + str(i))
+                                       for i in xrange(int(params.get('hint', 10)))])
+        elif path == '/index':
+            result = [dict(id=str(i), name='app%d' % i, description='') for i in xrange(3)]
+        elif path.startswith('/index/doc/'):
+            items = json.loads(params.get('items') or '[]')
+            server.count('documents', len(items))
+            result = ''
+        elif path.startswith('/index/error/'):
+            result = dict(count=0, items=[])
+        else:
+            return self._fail(NOT_FOUND_ERROR)
+        self._send(200, json.dumps(dict(status='OK', request_id=str(server.requests), result=result)))
+
+    def _fail(self, error):
+        code, message = error
+        self._send(200, json.dumps(dict(status='FAIL', request_id=str(self.server.requests),
+                                        errors=dict(code=code, message=message))))
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, access_key_id='stub-id', access_key_secret='stub-secret', latency=0, jitter=0,
+                 error_rate=0, http_error_rate=0, hits=10, host='127.0.0.1', port=0):
+        """
+        :param latency: seconds every request is delayed.
+        :param jitter: max extra random delay in seconds.
+        :param error_rate: fraction of requests answered with an api error.
+        :param http_error_rate: fraction of requests answered with http 503.
+        :param hits: search hits returned when the query config has no hit.
+        """
+        HTTPServer.__init__(self, (host, port), StubHandler)
+        self.access_key_id = access_key_id
+        self.access_key_secret = access_key_secret
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.hits = hits
+        self.requests = 0
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if name == 'requests':
+                self.requests += n
+
+    def search_result(self, params):
+        config = {}
+        match = _CONFIG_RE.search(params.get('query', ''))
+        if match:
+            for item in match.group(1).split(','):
+                key, _, value = item.partition(':')
+                config[key] = value
+        start = int(config.get('start', 0))
+        # config_by() of this sdk writes hint, the api documents hit
+        hit = int(config.get('hit', config.get('hint', self.hits)))
+        items = [dict(id=str(start + i), title='title %d' % (start + i), price=str(i), index_name='app')
+                 for i in xrange(hit)]
+        return dict(searchtime=0.001, total=10000, num=len(items), viewtotal=5000, items=items,
+                    facet=[])
+
+    def handle_error(self, request, client_address):
+        # clients that time out close their sockets before the response is written
+        pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='opensearch-stub')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
@@ -9,7 +9,6 @@ Created on 2015-11-18
 Copyright (c) 2015 infohold inc. All rights reserved.
 """
 import logging
-import logging.config
 
 
 # version is a human-readable version number.
@@ -47,5 +46,13 @@ LOGGING_CONFIG = {
 }
 
 
-logging.config.dictConfig(LOGGING_CONFIG)
 log = logging.getLogger('opensearch')
+# importing the package configures nothing, applications decide where the logs go
+log.addHandler(logging.NullHandler())
+
+
+def configure_logging(config=LOGGING_CONFIG):
+    """Apply a logging dict config, LOGGING_CONFIG prints debug logs to stderr.
+    """
+    import logging.config
+    logging.config.dictConfig(config)
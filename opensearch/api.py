@@ -15,13 +15,25 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import copy
 import json
+import threading
 import time
-
-from opensearch.entity import SearchSummary
-from opensearch.exception import ApiError, ArgumentError
+import urllib
+
+from collections import OrderedDict, deque
+from functools import partial
+from Queue import Queue, Empty
+from opensearch import jsonbackend, log
+from opensearch.encoding import EncodedForm
+from opensearch.entity import SearchItem, SearchResult, SearchSummary
+from opensearch.exception import ApiError, ArgumentError, CircuitOpenError, HTTPError, TimeoutError
+from opensearch.fingerprint import fingerprint
 from opensearch.httpclient import HttpClient
-from opensearch.signature import Signature
+from opensearch.metrics import RequestEvent, notify
+from opensearch.resilience import FailoverRouter, LatencyRouter, is_transient
+from opensearch.signature import Signer
+from opensearch.singleflight import SingleFlight
 
 
 class ApiResponse(object):
@@ -56,21 +68,375 @@ class ApiResponse(object):
 
 class OpenSearchClient(object):
 
-    def __init__(self, api_host, access_key_id, access_key_secret):
-        self.api_host = api_host
+    CACHEABLE_PATHS = ('/search', '/suggest')
+    READ_PATHS = ('/search', '/suggest')
+
+    def __init__(self, api_host, access_key_id, access_key_secret, httpclient=None, cache=None,
+                 coalesce=False, max_workers=16, timeout=None, retry_policy=None, hedge_policy=None,
+                 circuit_breaker=None, observers=None, rate_limiter=None, read_router=None, write_router=None):
+        """
+        :param api_host: the api host, or a list of api hosts serving the same apps.
+        :param httpclient: the HttpClient used to send requests, the shared one by default.
+        :param cache: an opensearch.cache.ResultCache for search and suggest responses, None disables it.
+        :param coalesce: share one http request between identical concurrent GET requests.
+        :param max_workers: size of the thread pool used by gather() and Search.multi_search()
+        :param timeout: deadline in seconds of one request() call including retries, None means no limit.
+        :param retry_policy: an opensearch.resilience.RetryPolicy, None disables retries.
+        :param hedge_policy: an opensearch.resilience.HedgePolicy, None disables hedged requests.
+        :param circuit_breaker: an opensearch.resilience.CircuitBreaker, None disables it.
+        :param observers: list of opensearch.metrics.Observer notified after every request() call.
+        :param rate_limiter: an opensearch.resilience.RateLimiter every request sent to the server
+                             waits for, None disables it.
+        :param read_router: an opensearch.resilience.Router choosing the host of search and suggest
+                            requests, a LatencyRouter over the api hosts when there are several.
+        :param write_router: a Router choosing the host of the other requests, a FailoverRouter over
+                             the api hosts when there are several.
+        """
+        self.api_hosts = isinstance(api_host, (list, tuple)) and list(api_host) or [api_host]
+        if not self.api_hosts or not all(self.api_hosts):
+            raise ArgumentError("api_host is required")
+        self.api_host = self.api_hosts[0]
+        if len(self.api_hosts) > 1:
+            read_router = read_router or LatencyRouter(self.api_hosts)
+            write_router = write_router or FailoverRouter(self.api_hosts)
+        self.read_router = read_router
+        self.write_router = write_router
         self.access_key_id = access_key_id
         self.access_key_secret = access_key_secret
+        self.httpclient = httpclient
+        self.cache = cache
+        self.singleflight = coalesce and SingleFlight() or None
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retry_policy = retry_policy
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        self.observers = list(observers or ())
+        self.rate_limiter = rate_limiter
+        self._signer = None
+        self._last_nonce = 0
+        self._nonce_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """The shared worker thread pool, created on first use.
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    from multiprocessing.pool import ThreadPool
+                    self._executor = ThreadPool(self.max_workers)
+        return self._executor
+
+    def gather(self, calls, timeout=None):
+        """Run calls concurrently on the worker pool.
+
+        Do not call it from a function that is itself running on the pool.
+
+        :param calls: list of callables without arguments, e.g. functools.partial(search.search, query)
+        :param timeout: seconds for the whole batch. calls not started before it are skipped and
+                        calls not finished by then are reported as TimeoutError.
+        :return: results -> list in the order of calls, a failed call holds its exception instead.
+        """
+        deadline = timeout is not None and time.time() + timeout or None
+        pending = [self.executor.apply_async(_invoke, (call, deadline)) for call in calls]
+        results = []
+        for async_result in pending:
+            if deadline is not None:
+                async_result.wait(max(0, deadline - time.time()))
+                if not async_result.ready():
+                    results.append(TimeoutError("call not finished in %s seconds" % timeout))
+                    continue
+            results.append(async_result.get()[1])
+        return results
+
+    def warmup(self, connections=2, timeout=None):
+        """Resolve api_host and open connections to it ahead of the first requests.
+
+        Call it when a worker process starts, so its first requests do not pay
+        the dns lookup, tcp connect and tls handshake.
+
+        :param connections: connections to open, bounded by the http client pool size.
+        :param timeout: seconds to wait for the connections, None means no limit.
+        :return: number of connections opened.
+        """
+        httpclient = self.httpclient or HttpClient.get_httpclient()
+        hosts = list(self.api_hosts)
+        for router in (self.read_router, self.write_router):
+            if router is not None:
+                hosts.extend(host for host in router.endpoints if host not in hosts)
+        return sum(httpclient.warmup(host, connections, timeout) for host in hosts)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.close()
+            self._executor = None
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
 
     def request(self, path, method='POST', **params):
+        return self._observed(self._request, path, method, params)
+
+    def send_encoded(self, path, body, content_type):
+        """POST a body that is already signed and form encoded.
+
+        Used by opensearch.bulk.ParallelPusher, whose worker processes sign and
+        encode pushes. The body is never retried since it carries one signature.
+
+        :param body: the encoded form, see opensearch.encoding.encode_form()
+        :param content_type: the Content-Type of body.
+        """
+        return self._observed(self._request_encoded, path, 'POST', EncodedForm(body, content_type))
+
+    def _observed(self, fn, path, method, params):
+        if not self.observers:
+            return fn(path, method, params, None)
+
+        event = RequestEvent(path, method)
+        try:
+            data = fn(path, method, params, event)
+        except Exception, e:
+            event.finish(e)
+            notify(self.observers, event)
+            raise
+        event.finish()
+        notify(self.observers, event)
+        return data
+
+    def _request(self, path, method, params, event):
+        request_key = None
+        if method == 'GET' and (self.cache is not None or self.singleflight is not None):
+            request_key = self._request_key(path, method, params)
+        cacheable = self.cache is not None and request_key is not None and path in self.CACHEABLE_PATHS
+        if cacheable:
+            text_body = self.cache.get(request_key)
+            if text_body is not None:
+                if event is not None:
+                    event.cache_hit = True
+                return self._parse_response(text_body, event)
+
+        if self.singleflight is not None and request_key is not None:
+            text_body = self.singleflight.do(request_key, self._send, path, method, params, event)
+        else:
+            text_body = self._send(path, method, params, event)
+        data = self._parse_response(text_body, event)
+
+        if cacheable:
+            self.cache.set(request_key, text_body, tuple(params.get('index_name', '').split(';')))
+        else:
+            self._invalidate(path)
+        return data
+
+    def _request_encoded(self, path, method, form, event):
+        deadline = self.timeout is not None and time.time() + self.timeout or None
+        data = self._parse_response(self._transmit(path, method, form, deadline, event), event)
+        self._invalidate(path)
+        return data
+
+    def _invalidate(self, path):
+        if self.cache is not None and self.cache.invalidate_on_write:
+            app_name = self._written_app_name(path)
+            if app_name:
+                self.cache.invalidate(app_name)
+
+    def _send(self, path, method, params, event=None):
+        deadline = self.timeout is not None and time.time() + self.timeout or None
+        attempts = self.retry_policy is not None and self.retry_policy.attempts(path, method) or 1
+        hedged = self.hedge_policy is not None and self.hedge_policy.applies(path, method)
+        for attempt in xrange(attempts):
+            try:
+                if hedged:
+                    return self._send_hedged(path, method, params, deadline, event)
+                return self._send_once(path, method, params, deadline, event)
+            except HTTPError, e:
+                if attempt + 1 >= attempts or not is_transient(e):
+                    raise
+                wait = self.retry_policy.wait_time(attempt)
+                if deadline is not None and time.time() + wait >= deadline:
+                    raise
+                self.retry_policy.retries += 1
+                log.debug("retry %s after %.3fs: %s", path, wait, e)
+                time.sleep(wait)
+
+    def _send_once(self, path, method, params, deadline=None, event=None):
+        # every attempt is signed again, so it gets a fresh Timestamp and SignatureNonce
+        req_params = self._sign_params(method, params, event)
+        return self._transmit(path, method, req_params, deadline, event)
+
+    def _transmit(self, path, method, req_params, deadline=None, event=None):
+        limiter = self.rate_limiter
+        if limiter is not None:
+            waited = limiter.acquire(limiter.classify(path), deadline)
+            if event is not None and waited:
+                event.add('queue', waited)
+        router = path in self.READ_PATHS and self.read_router or self.write_router
+        if router is None:
+            return self._transmit_to(self.api_host, path, method, req_params, deadline, event)
+
+        tried = []
+        while True:
+            host = router.choose(tried)
+            started = time.time()
+            recorded = False
+            try:
+                try:
+                    text_body = self._transmit_to(host, path, method, req_params, deadline, event)
+                except HTTPError, e:
+                    if is_transient(e) or isinstance(e, (CircuitOpenError, TimeoutError)):
+                        router.record_failure(host)
+                    else:
+                        router.record_success(host, time.time() - started)
+                    recorded = True
+                    # another host may answer a request that got no response, unless it is not a GET
+                    # and was sent: the app may have applied it already
+                    tried.append(host)
+                    if (e.status is not None or isinstance(e, TimeoutError) or (method != 'GET' and e.sent)
+                            or len(tried) >= len(router.endpoints)):
+                        raise
+                    log.warning("fail over %s from %s: %s", path, host, e)
+                    continue
+                router.record_success(host, time.time() - started)
+                recorded = True
+                return text_body
+            finally:
+                # every choose() is matched by a record, whatever _transmit_to raised
+                if not recorded:
+                    router.record_failure(host)
+
+    def _transmit_to(self, host, path, method, req_params, deadline=None, event=None):
+        limiter = self.rate_limiter
+        kwargs = {}
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError("request deadline exceeded")
+            kwargs['timeout'] = remaining
+        if event is not None:
+            kwargs['trace'] = event
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.allow(host)
+        httpclient = self.httpclient or HttpClient.get_httpclient()
+        recorded = False
+        try:
+            try:
+                text_body = httpclient.request(host + path, method, req_params, **kwargs)
+            except HTTPError, e:
+                if limiter is not None and e.status == 429:
+                    limiter.record_throttled()
+                if breaker is not None:
+                    if is_transient(e) or isinstance(e, TimeoutError):
+                        breaker.record_failure(host)
+                    else:
+                        breaker.record_success(host)
+                recorded = True
+                raise
+            if breaker is not None:
+                breaker.record_success(host)
+            recorded = True
+            return text_body
+        finally:
+            # a half open circuit waits for the result of its trial request
+            if breaker is not None and not recorded:
+                breaker.record_failure(host)
+
+    def _send_hedged(self, path, method, params, deadline, event=None):
+        # with an event, the phases of both attempts are added up
+        policy = self.hedge_policy
+        delay = policy.delay_for(path)
+        if delay is None:
+            return self._send_once(path, method, params, deadline, event)
+
+        outcomes = Queue()
+
+        def attempt(hedge):
+            started = time.time()
+            try:
+                text_body = self._send_once(path, method, params, deadline, event)
+            except Exception, e:
+                outcomes.put((False, e, hedge))
+                return
+            policy.record(path, time.time() - started)
+            outcomes.put((True, text_body, hedge))
+
+        def next_outcome(timeout=None):
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+                if timeout is None or remaining < timeout:
+                    timeout = remaining
+            return outcomes.get(timeout=timeout)
+
+        # the primary never waits behind the pool's queue, only the duplicate goes there.
+        # the calling thread can not run it itself: it must be free to return the duplicate's answer
+        primary = threading.Thread(target=attempt, args=(False,), name='opensearch-hedge-primary')
+        primary.daemon = True
+        primary.start()
+        launched = 1
+        try:
+            try:
+                outcome = next_outcome(delay)
+            except Empty:
+                if deadline is not None and time.time() >= deadline:
+                    raise
+                policy.hedged += 1
+                policy.executor.apply_async(attempt, (True,))
+                launched += 1
+                outcome = next_outcome()
+            launched -= 1
+            if not outcome[0] and launched:
+                other = next_outcome()
+                if other[0]:
+                    outcome = other
+        except Empty:
+            raise TimeoutError("request deadline exceeded")
+
+        ok, value, hedge = outcome
+        if not ok:
+            raise value
+        if hedge:
+            policy.hedge_wins += 1
+        return value
+
+    def _request_key(self, path, method, params):
+        # only business params, the common params change on every request
+        items = sorted((k, v) for k, v in params.iteritems() if v is not None)
+        return "%s %s?%s" % (method, path, urllib.urlencode(items))
+
+    def _written_app_name(self, path):
+        # Document pushes to /index/doc/<app>, Application changes /index/<app>
+        if path.startswith('/index/') and not path.startswith('/index/error'):
+            return path.rsplit('/', 1)[-1]
+        return None
+
+    def _sign_params(self, method, params, event=None):
+        if event is not None:
+            started = time.time()
         req_params = self._generate_common_params()
         req_params.update(params)
-        signature = Signature().sign(self.access_key_secret, method, req_params)
-        req_params['Signature'] = signature
-
-        httpclient = HttpClient.get_httpclient()
-        text_body = httpclient.request(self.api_host + path, method, req_params)
-        resp = ApiResponse(json.loads(text_body))
+        signer = self._signer
+        if signer is None or signer.access_key_secret != self.access_key_secret:
+            signer = self._signer = Signer(self.access_key_secret)
+        if event is not None:
+            signed = time.time()
+            event.add('build', signed - started)
+        req_params['Signature'] = signer.sign(method, req_params)
+        if event is not None:
+            event.add('sign', time.time() - signed)
+        return req_params
+
+    def _parse_response(self, text_body, event=None):
+        if event is not None:
+            started = time.time()
+        resp = ApiResponse(jsonbackend.loads(text_body))
+        if event is not None:
+            event.add('parse', time.time() - started)
+            event.error_code = resp.error_code()
         if not resp.is_success():
+            if self.rate_limiter is not None and resp.error_code() in self.rate_limiter.throttle_codes:
+                self.rate_limiter.record_throttled()
             raise ApiError(resp.error_code(), resp.error_message())
         else:
             return resp.data
@@ -78,7 +444,10 @@ class OpenSearchClient(object):
     def _generate_common_params(self):
         nowtime = time.time()
         timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(int(nowtime)))
-        nonce = str(int(nowtime * 1000000))
+        # retries and hedged requests may be signed within the same microsecond
+        with self._nonce_lock:
+            self._last_nonce = max(int(nowtime * 1000000), self._last_nonce + 1)
+            nonce = str(self._last_nonce)
 
         comm_params = {
             'Version': 'v2',
@@ -92,6 +461,15 @@ class OpenSearchClient(object):
         return comm_params
 
 
+def _invoke(call, deadline):
+    if deadline is not None and time.time() >= deadline:
+        return False, TimeoutError("deadline exceeded before call started")
+    try:
+        return True, call()
+    except Exception, e:
+        return False, e
+
+
 class Api(object):
 
     PATH_PREFIX = None
@@ -105,7 +483,7 @@ class Api(object):
         return self.PATH_PREFIX + '/' + self.app_name
 
     def jsonify(self, obj):
-        return json.dumps(obj, ensure_ascii=False)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
 
 
 class Application(Api):
@@ -154,14 +532,119 @@ class Application(Api):
                                    action='createtask', operate='import', table_name=table_name)
 
 
+class OperationBuffer(object):
+    """Pending document operations compacted per id, last write wins.
+
+    Operations of one id are folded in timestamp order, operations without
+    timestamp in the order they are added: an add replaces what was before,
+    updates merge their fields into the pending add or update, a delete
+    supersedes the earlier writes. An update after a delete is kept after it.
+    Ids are pushed in the order they were first added. Updates are merged only
+    by take(), so a late operation still lands between them.
+
+    compaction_ratio is the number of operations added per operation pushed.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.emitted = 0
+        self._ops = OrderedDict()
+        self._pending_received = 0
+        self._taken_received = 0
+
+    def append(self, item):
+        self._fold(item)
+        self.received += 1
+        self._pending_received += 1
+
+    def take(self):
+        """Remove and return the compacted items.
+        """
+        items = [item for ops in self._ops.itervalues() for item in self._merge(ops)]
+        self._ops = OrderedDict()
+        self.emitted += len(items)
+        self._taken_received, self._pending_received = self._pending_received, 0
+        return items
+
+    def restore(self, items):
+        """Put back the items of a failed take() before the operations added since.
+        """
+        ops, self._ops = self._ops, OrderedDict()
+        for item in items:
+            self._fold(item)
+        for later in ops.itervalues():
+            for item in later:
+                self._fold(item)
+        self.emitted -= len(items)
+        self._pending_received += self._taken_received
+        self._taken_received = 0
+
+    @property
+    def compaction_ratio(self):
+        pushed = self.received - self._pending_received
+        return self.emitted and float(pushed) / self.emitted or 1.0
+
+    def __len__(self):
+        return sum(len(ops) for ops in self._ops.itervalues())
+
+    def _fold(self, item):
+        # operations are kept in timestamp order, an add or a delete drops the ones before it
+        doc_id = item['fields']['id']
+        ops = self._ops.get(doc_id)
+        if ops is None:
+            self._ops[doc_id] = [item]
+            return
+        timestamp = item['timestamp']
+        position = len(ops)
+        if timestamp is not None:
+            while position > 0 and ops[position - 1]['timestamp'] > timestamp:
+                position -= 1
+        ops.insert(position, item)
+        for position in xrange(len(ops) - 1, 0, -1):
+            if ops[position]['cmd'] != 'update':
+                del ops[:position]
+                break
+
+    @staticmethod
+    def _merge(ops):
+        folded = []
+        for op in ops:
+            if op['cmd'] == 'update' and folded and folded[-1]['cmd'] != 'delete':
+                fields = dict(folded[-1]['fields'])
+                fields.update(op['fields'])
+                folded[-1] = dict(cmd=folded[-1]['cmd'], timestamp=op['timestamp'], fields=fields)
+            else:
+                folded.append(op)
+        return folded
+
+
 class Document(Api):
 
     PATH_PREFIX = '/index/doc'
 
-    def __init__(self, client, app_name, table_name):
+    def __init__(self, client, app_name, table_name, fingerprints=None, compact=False):
+        """
+        :param fingerprints: opensearch.fingerprint.FingerprintStore of the table, add() and update()
+                             of a document pushed before with the same fields are dropped then.
+        :param compact: buffer the operations in an OperationBuffer, so one push carries at most
+                        one operation per id (two for an update after a delete).
+        """
         super(Document, self).__init__(client, app_name)
         self.table_name = table_name
-        self._items = []
+        self.fingerprints = fingerprints
+        self.compact = compact
+        if compact:
+            self._items = OperationBuffer()
+        else:
+            self._items = []
+        self._pending = {}
+        self._dropped = False
+
+    @property
+    def compaction_ratio(self):
+        """Operations added per operation pushed, 1.0 without compaction.
+        """
+        return self.compact and self._items.compaction_ratio or 1.0
 
     def add(self, fields, timestamp=None):
         """Add Doucment fields
@@ -188,23 +671,127 @@ class Document(Api):
         self._op('delete', fields, timestamp)
 
     def _op(self, cmd, fields, timestamp=None):
+        item = self.make_item(cmd, fields, timestamp)
+        # a compacting buffer reorders operations by timestamp, its folded items are checked in push()
+        if self.compact or self.fingerprints is None or self.track(cmd, fields, self._pending):
+            self._items.append(item)
+        else:
+            self._dropped = True
+
+    def track(self, cmd, fields, pending):
+        """Tell whether an operation changes the document and must be pushed.
+
+        It's dropped only when the same command with the same fields was the
+        last operation pushed for the id. Record the fingerprint of a pushed
+        operation in pending, None for a delete.
+
+        :param pending: dict of id -> fingerprint of the operations not pushed yet.
+        """
+        doc_id = fields['id']
+        if cmd == 'delete':
+            pending[doc_id] = None
+            return True
+        # an add replaces the whole document, so it never matches a partial update with the same fields
+        hash_ = fingerprint([cmd, fields])
+        if doc_id in pending:
+            if pending[doc_id] == hash_:
+                return False
+        elif self.fingerprints.is_unchanged(doc_id, hash_):
+            return False
+        pending[doc_id] = hash_
+        return True
+
+    def _changed(self, items, pending):
+        # the folded items of a compacting buffer, ids are adjacent. an id with two items
+        # is a delete then an update, the update is pushed whatever its fingerprint
+        counts = {}
+        for item in items:
+            doc_id = item['fields']['id']
+            counts[doc_id] = counts.get(doc_id, 0) + 1
+        changed = []
+        for item in items:
+            fields = item['fields']
+            if counts[fields['id']] > 1:
+                pending[fields['id']] = item['cmd'] != 'delete' and fingerprint([item['cmd'], fields]) or None
+                changed.append(item)
+            elif self.track(item['cmd'], fields, pending):
+                changed.append(item)
+        return changed
+
+    def make_item(self, cmd, fields, timestamp=None):
+        """Build one document operation
+
+        :param cmd: 'add', 'update' or 'delete'
+        :param fields: the document fields, it must contain the 'id' key.
+        :param timestamp: the document update time.
+        :return: item -> dict
+        """
         if fields is None or not isinstance(fields, dict):
             raise ArgumentError("fields is required and it must be dict type")
-        if fields.has_key('id') or fields['id'] is None:
+        if not fields.has_key('id') or fields['id'] is None:
             raise ArgumentError("fields must contain 'id' key and it must be not None")
 
-        item = dict(cmd=cmd, timestamp=timestamp, fields=fields)
-        self._items.append(item)
+        return dict(cmd=cmd, timestamp=timestamp, fields=fields)
 
     def push(self):
         """Push document operation to server.
 
-        Before call this function. you should call add() or delete() or update() more than one times
+        Before call this function. you should call add() or delete() or update() more than one times.
+        The pushed operations are removed from the buffer, they are kept only if the push fails.
+        With fingerprints, None is returned without a request when every operation is unchanged.
+        With AsyncOpenSearchClient the Future is returned, the operations are restored if it fails.
         """
+        dropped, self._dropped = self._dropped, False
         if len(self._items) == 0:
+            if dropped:
+                return None
             raise ArgumentError("please call add() or update() or delete() first.")
+        if self.compact:
+            taken = items = self._items.take()
+            if self.fingerprints is not None:
+                items = self._changed(items, self._pending)
+                if not items:
+                    return None
+        else:
+            items, self._items = self._items, []
+        pending, self._pending = self._pending, {}
+
+        def restore():
+            if self.compact:
+                self._items.restore(taken)
+            else:
+                self._items[:0] = items
+            pending.update(self._pending)
+            self._pending = pending
+
+        try:
+            data = self.push_json(self.jsonify(items))
+        except Exception:
+            restore()
+            raise
+        if hasattr(data, 'add_done_callback'):
+            # AsyncOpenSearchClient returns a Future, restore or record once it is done
+            def on_done(future):
+                if future.exception() is not None:
+                    restore()
+                elif self.fingerprints is not None:
+                    self.fingerprints.update(pending)
+            data.add_done_callback(on_done)
+            return data
+        if self.fingerprints is not None:
+            self.fingerprints.update(pending)
+        return data
+
+    def push_json(self, items):
+        """Push already serialized document operations to server.
+
+        :param items: json array string of items built by make_item()
+        """
+        if isinstance(items, unicode):
+            # jsonify() returns unicode for non ascii fields, params are signed and sent as utf8
+            items = items.encode('utf8')
         return self.client.request(self.path, action='push', table_name=self.table_name,
-                                   items=self.jsonify(self._items))
+                                   items=items)
 
 
 class Search(Api):
@@ -216,10 +803,10 @@ class Search(Api):
         return self.PATH_PREFIX
 
     def search(self, query, index_names=None, fetch_fields=None, qp=None, disable=None,
-               first_formula_name=None, formula_name=None, summary=None):
+               first_formula_name=None, formula_name=None, summary=None, typed=False):
         """Search from server
 
-        :param query: the query string.
+        :param query: the query object, or a query string e.g. from QueryTemplate.bind()
         :param index_names:
         :param fetch_fields:
         :param qp:
@@ -227,6 +814,8 @@ class Search(Api):
         :param first_formula_name:
         :param formula_name:
         :param summary:
+        :param typed: return an opensearch.entity.SearchResult instead of the raw dict,
+                      ignored by clients that return a Future.
         :return:
         """
 
@@ -243,22 +832,95 @@ class Search(Api):
             raise ArgumentError("parameter 'fetch_fields' need 'opensearch.entity.SearchSummary' type")
 
         kwargs = dict(
-            query=query.build(),
+            query=isinstance(query, basestring) and query or query.build(),
             index_name=index_name,
             fetch_fields=fetch_fields,
             qp=qp,
             disable=disable,
             first_formula_name=first_formula_name,
             formula_name=formula_name,
-            summary=summary.to_string()
+            summary=summary and summary.to_string()
         )
-        return self.client.request(self.path, method='GET', **kwargs)
+        kwargs = dict((k, v) for k, v in kwargs.iteritems() if v is not None)
+        data = self.client.request(self.path, method='GET', **kwargs)
+        if typed and isinstance(data, dict):
+            return SearchResult().from_dict(data)
+        return data
+
+    def multi_search(self, specs, timeout=None):
+        """Run several searches concurrently on the client's worker pool.
+
+        :param specs: list of query objects, query strings or dicts of search() keyword arguments.
+        :param timeout: seconds for the whole batch, see OpenSearchClient.gather()
+        :return: results -> list in the order of specs, a failed search holds its exception instead.
+        """
+        calls = []
+        for spec in specs:
+            if isinstance(spec, dict):
+                calls.append(partial(self.search, **spec))
+            else:
+                calls.append(partial(self.search, spec))
+        return self.client.gather(calls, timeout)
+
+    def iter_results(self, query, page_size=100, prefetch=2, max_results=5000, typed=False, **kwargs):
+        """Iterate over the hits of a query page by page.
+
+        While the caller consumes one page, the next pages are fetched on the client's worker
+        pool, at most prefetch pages ahead, so memory stays bounded by prefetch + 1 pages.
+        Iteration stops at viewtotal (or total) hits, on a short page, or at max_results.
+
+        :param query: a RawQuery or SimpleQuery, its config statement is replaced for every page.
+        :param page_size: hits fetched by one request.
+        :param prefetch: max pages fetched ahead of the one being consumed.
+        :param max_results: max start + hint accepted by the server.
+        :param typed: yield opensearch.entity.SearchItem instead of the raw dict.
+        :param kwargs: other search() arguments.
+        """
+        if page_size < 1 or prefetch < 0:
+            raise ArgumentError("page_size must be greater than 0 and prefetch must not be negative")
+        limit = max_results
+        limit_known = False
+        next_start = 0
+        window = deque()
+        while True:
+            capacity = limit_known and prefetch + 1 or 1
+            while len(window) < capacity and next_start < limit:
+                hint = min(page_size, limit - next_start)
+                page = self._page_query(query, next_start, hint)
+                window.append((hint, self.client.executor.apply_async(self.search, (page,), kwargs)))
+                next_start += hint
+            if not window:
+                return
+
+            hint, async_result = window.popleft()
+            data = async_result.get()
+            total = data.get('viewtotal', data.get('total'))
+            if total is not None and not limit_known:
+                limit = min(limit, int(total))
+                limit_known = True
+            items = data.get('items') or ()
+            for item in items:
+                yield typed and SearchItem(item) or item
+            if len(items) < hint:
+                return
+
+    def _page_query(self, query, start, hint):
+        page = copy.copy(query)
+        page.stmts = dict(query.stmts)
+        return page.config("start:%s,hint:%s,format:json" % (start, hint))
 
 
 class Suggestion(Api):
 
     PATH_PREFIX = '/suggest'
 
+    def __init__(self, client, app_name, cache=None):
+        """
+        :param cache: an opensearch.cache.SuggestCache answering longer prefixes locally, None disables it.
+        """
+        super(Suggestion, self).__init__(client, app_name)
+        self.cache = cache
+
     @property
     def path(self):
         return self.PATH_PREFIX
@@ -271,7 +933,16 @@ class Suggestion(Api):
         }
         if isinstance(hint, int):
             kwargs['hint'] = hint
-        return self.client.request(self.path, method='GET', **kwargs)
+        else:
+            hint = None
+        if self.cache is not None:
+            result = self.cache.get(self.app_name, suggest_name, query_text, hint)
+            if result is not None:
+                return result
+        result = self.client.request(self.path, method='GET', **kwargs)
+        if self.cache is not None:
+            self.cache.set(self.app_name, suggest_name, query_text, hint, result)
+        return result
 
 
 class ApiLog(Api):
@@ -0,0 +1,642 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Non-blocking client. All sockets are driven by one event loop thread, so a
+single process can keep hundreds of requests in flight without a thread per
+request. The Api classes in opensearch.api work unchanged on top of
+AsyncOpenSearchClient, their methods return a Future instead of the data:
+
+    client = AsyncOpenSearchClient(api_host, access_key_id, access_key_secret)
+    future = Search(client, 'app').search(query)
+    data = future.result()
+"""
+import errno
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+import urllib
+
+from collections import deque
+from urlparse import urlparse
+from opensearch import log, reqlog
+from opensearch.api import OpenSearchClient
+from opensearch.encoding import ACCEPT_ENCODING, FORM_ENCODINGS, Decoder, encode_form
+from opensearch.exception import ArgumentError, CancelledError, HTTPError, TimeoutError
+from opensearch.httpclient import HttpClient
+
+_PENDING = 'PENDING'
+_CANCELLED = 'CANCELLED'
+_FINISHED = 'FINISHED'
+
+
+class Future(object):
+    """The result of an asynchronous request.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._state = _PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._cancel_hook = None
+
+    def cancel(self):
+        """Cancel the request. Returns False if it has already finished.
+        """
+        with self._cond:
+            if self._state != _PENDING:
+                return False
+            self._state = _CANCELLED
+            self._exception = CancelledError("request cancelled")
+            hook, self._cancel_hook = self._cancel_hook, None
+            self._cond.notify_all()
+        if hook is not None:
+            hook()
+        self._run_callbacks()
+        return True
+
+    def cancelled(self):
+        return self._state == _CANCELLED
+
+    def done(self):
+        return self._state != _PENDING
+
+    def result(self, timeout=None):
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """Call fn(future) once the future is done. Callbacks usually run in the
+        event loop thread and must not block.
+        """
+        with self._cond:
+            if self._state == _PENDING:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, result):
+        return self._finish(result, None)
+
+    def set_exception(self, exception):
+        return self._finish(None, exception)
+
+    def _wait(self, timeout):
+        with self._cond:
+            if self._state == _PENDING:
+                self._cond.wait(timeout)
+            if self._state == _PENDING:
+                raise TimeoutError("future is not done after %s seconds" % timeout)
+
+    def _finish(self, result, exception):
+        with self._cond:
+            if self._state != _PENDING:
+                return False
+            self._state = _FINISHED
+            self._result = result
+            self._exception = exception
+            self._cancel_hook = None
+            self._cond.notify_all()
+        self._run_callbacks()
+        return True
+
+    def _run_callbacks(self):
+        with self._cond:
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                log.exception("future done callback raised")
+
+
+class _ResponseParser(object):
+
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.body = None
+        self.keep_alive = True
+        self._buf = ''
+        self._chunks = []
+        self._length = None
+        self._chunked = False
+        self._until_close = False
+        self._decoder = None
+
+    def feed(self, data):
+        """Feed received bytes, return True once the whole response is parsed.
+        """
+        self._buf += data
+        if self.status is None:
+            end = self._buf.find('\r\n\r\n')
+            if end < 0:
+                return False
+            self._parse_head(self._buf[:end])
+            self._buf = self._buf[end + 4:]
+        if self._chunked:
+            return self._parse_chunks()
+        if self._until_close:
+            return False
+        if len(self._buf) >= self._length:
+            self.body = self._decode(self._buf[:self._length])
+            return True
+        return False
+
+    def feed_eof(self):
+        if self.status is not None and self._until_close:
+            self.body = self._decode(self._buf)
+            self.keep_alive = False
+            return True
+        return False
+
+    def _decode(self, data):
+        return self._decoder.decompress(data) + self._decoder.flush()
+
+    def _parse_head(self, head):
+        lines = head.split('\r\n')
+        parts = lines[0].split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise HTTPError("bad http status line: %r" % lines[0])
+        self.status = int(parts[1])
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        self._decoder = Decoder(self.headers.get('content-encoding'))
+
+        connection = self.headers.get('connection', '').lower()
+        if parts[0] == 'HTTP/1.0':
+            self.keep_alive = connection == 'keep-alive'
+        else:
+            self.keep_alive = connection != 'close'
+        if 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            self._chunked = True
+        elif 'content-length' in self.headers:
+            self._length = int(self.headers['content-length'])
+        elif self.status in (204, 304) or 100 <= self.status < 200:
+            self._length = 0
+        else:
+            self._until_close = True
+            self.keep_alive = False
+
+    def _parse_chunks(self):
+        while True:
+            end = self._buf.find('\r\n')
+            if end < 0:
+                return False
+            size = int(self._buf[:end].split(';', 1)[0], 16)
+            if size == 0:
+                # skip trailers, the body is complete after the empty line
+                if self._buf.find('\r\n\r\n', end) < 0:
+                    return False
+                self._chunks.append(self._decoder.flush())
+                self.body = ''.join(self._chunks)
+                return True
+            if len(self._buf) < end + 2 + size + 2:
+                return False
+            self._chunks.append(self._decoder.decompress(self._buf[end + 2:end + 2 + size]))
+            self._buf = self._buf[end + 2 + size + 2:]
+
+
+class _Transfer(object):
+
+    CONNECTING = 'connecting'
+    HANDSHAKE = 'handshake'
+    SENDING = 'sending'
+    RECEIVING = 'receiving'
+
+    def __init__(self, key, addrinfo, data, future, deadline):
+        self.key = key
+        self.addrinfo = addrinfo
+        self.data = data
+        self.future = future
+        self.deadline = deadline
+        self.sock = None
+        self.reused = False
+        self.state = None
+        self.want_write = False
+        self.parser = _ResponseParser()
+        self.exchange = None
+        self._sent = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def start(self, sock=None):
+        if sock is not None:
+            self.sock = sock
+            self.reused = True
+            self._sending()
+            return
+        family, socktype, proto, _, sockaddr = self.addrinfo
+        self.sock = socket.socket(family, socktype, proto)
+        self.sock.setblocking(0)
+        self.reused = False
+        err = self.sock.connect_ex(sockaddr)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise socket.error(err, os.strerror(err))
+        self.state = self.CONNECTING
+        self.want_write = True
+
+    def on_event(self):
+        """Make progress, return True once the response is complete.
+        """
+        if self.state == self.CONNECTING:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise socket.error(err, os.strerror(err))
+            if self.key[0] == 'https':
+                context = ssl.create_default_context()
+                self.sock = context.wrap_socket(self.sock, server_hostname=self.key[1],
+                                                do_handshake_on_connect=False)
+                self.state = self.HANDSHAKE
+            else:
+                self._sending()
+        if self.state == self.HANDSHAKE:
+            try:
+                self.sock.do_handshake()
+            except ssl.SSLWantReadError:
+                self.want_write = False
+                return False
+            except ssl.SSLWantWriteError:
+                self.want_write = True
+                return False
+            self._sending()
+        if self.state == self.SENDING:
+            while self._sent < len(self.data):
+                try:
+                    self._sent += self.sock.send(self.data[self._sent:self._sent + 65536])
+                except (ssl.SSLWantWriteError, ssl.SSLWantReadError):
+                    return False
+                except socket.error, e:
+                    if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return False
+                    raise
+            self.state = self.RECEIVING
+            self.want_write = False
+        if self.state == self.RECEIVING:
+            while True:
+                try:
+                    chunk = self.sock.recv(65536)
+                except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                    return False
+                except socket.error, e:
+                    if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return False
+                    raise
+                if not chunk:
+                    if self.parser.feed_eof():
+                        return True
+                    raise HTTPError("connection closed before response completed")
+                if self.parser.feed(chunk):
+                    return True
+        return False
+
+    def got_response_bytes(self):
+        return self.parser.status is not None or bool(self.parser._buf)
+
+    def replayable(self):
+        """A failed request on a reused connection may be sent again when it is a GET,
+        or when it was not completely written so the server cannot have applied it.
+        """
+        if not self.reused or self.got_response_bytes():
+            return False
+        return self.exchange[1] == 'GET' or self.state != self.RECEIVING
+
+    def _sending(self):
+        self.state = self.SENDING
+        self.want_write = True
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+
+class AsyncHttpClient(HttpClient):
+    """Non-blocking http client driven by a single event loop thread.
+
+    At most max_concurrency requests are on the wire at the same time, further
+    requests wait in a queue. Finished connections are kept alive for reuse.
+    """
+
+    def __init__(self, max_concurrency=100, max_idle=10, idle_timeout=60, timeout=None,
+                 compress=True, form_encoding='urlencoded'):
+        """
+        :param max_concurrency: max requests in flight, the rest are queued.
+        :param max_idle: max idle connections kept for each host.
+        :param idle_timeout: seconds an idle connection is kept before it is discarded.
+        :param timeout: seconds a request may take from submit to response, None means no limit.
+        :param compress: ask for gzip or deflate compressed responses.
+        :param form_encoding: 'urlencoded' or 'multipart' POST bodies.
+        """
+        if max_concurrency < 1:
+            raise ArgumentError("max_concurrency must be greater than 0")
+        if form_encoding not in FORM_ENCODINGS:
+            raise ArgumentError("form_encoding must be one of %s" % (FORM_ENCODINGS,))
+        self.compress = compress
+        self.form_encoding = form_encoding
+        self.max_concurrency = max_concurrency
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._calls = deque()
+        self._pending = deque()
+        self._active = set()
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._wakeup_r, self._wakeup_w = os.pipe()
+
+    def request(self, url, method, params, timeout=None, trace=None):
+        return self.request_async(url, method, params, timeout).result()
+
+    def request_async(self, url, method, params, timeout=None):
+        """Send the request in background.
+
+        :param timeout: overrides the client timeout for this request.
+        :return: Future -> the http body string
+        """
+        if method not in ('GET', 'POST'):
+            raise ArgumentError("method must be 'POST' or 'GET'")
+        if self._closed:
+            raise HTTPError("http client is closed", sent=False)
+
+        parse_result = urlparse(url)
+        scheme = parse_result.scheme
+        host = parse_result.hostname
+        port = parse_result.port or (scheme == 'https' and 443 or 80)
+        data = self._build_request(parse_result, host, port, method, params)
+        future = Future()
+        try:
+            addrinfo = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+        except socket.error, e:
+            future.set_exception(HTTPError("resolve host %s failed: %s" % (host, e), sent=False))
+            return future
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = timeout is not None and time.time() + timeout or None
+        transfer = _Transfer((scheme, host, port), addrinfo, data, future, deadline)
+        future._cancel_hook = lambda: self._call_soon(self._cancel, transfer)
+        transfer.exchange = (url, method, params, time.time())
+        self._call_soon(self._submit, transfer)
+        return future
+
+    def close(self):
+        self._closed = True
+        self._call_soon(self._shutdown)
+
+    def _build_request(self, parse_result, host, port, method, params):
+        path = parse_result.path or '/'
+        body = ''
+        headers = ['Host: %s' % (parse_result.port and '%s:%s' % (host, port) or host),
+                   'Accept-Encoding: %s' % (self.compress and ACCEPT_ENCODING or 'identity'),
+                   'Connection: keep-alive']
+        if method == 'GET':
+            path = path + '?' + urllib.urlencode(params)
+        else:
+            body, content_type = encode_form(params, self.form_encoding)
+            headers.append('Content-Type: %s' % content_type)
+        headers.append('Content-Length: %d' % len(body))
+        return '%s %s HTTP/1.1\r\n%s\r\n\r\n%s' % (method, path, '\r\n'.join(headers), body)
+
+    def _call_soon(self, fn, *args):
+        self._calls.append((fn, args))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='opensearch-async')
+                    self._thread.daemon = True
+                    self._thread.start()
+        try:
+            os.write(self._wakeup_w, 'x')
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            while self._calls:
+                fn, args = self._calls.popleft()
+                fn(*args)
+            if self._closed and not self._active and not self._pending:
+                break
+
+            rlist, wlist = [self._wakeup_r], []
+            deadline = None
+            for transfer in self._active:
+                (wlist if transfer.want_write else rlist).append(transfer)
+                if transfer.deadline is not None:
+                    deadline = min(deadline or transfer.deadline, transfer.deadline)
+            for transfer in self._pending:
+                if transfer.deadline is not None:
+                    deadline = min(deadline or transfer.deadline, transfer.deadline)
+            wait = None
+            if deadline is not None:
+                wait = max(0, deadline - time.time())
+            try:
+                readable, writable, _ = select.select(rlist, wlist, [], wait)
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for ready in readable + writable:
+                if ready is self._wakeup_r:
+                    os.read(self._wakeup_r, 4096)
+                elif ready in self._active:
+                    self._progress(ready)
+            self._expire()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def _submit(self, transfer):
+        if transfer.future.done():
+            return
+        if self._closed:
+            transfer.future.set_exception(HTTPError("http client is closed", sent=False))
+        elif len(self._active) < self.max_concurrency:
+            self._start(transfer)
+        else:
+            self._pending.append(transfer)
+
+    def _start(self, transfer):
+        self._active.add(transfer)
+        try:
+            transfer.start(self._idle_conn(transfer.key))
+        except (socket.error, ssl.SSLError), e:
+            self._fail(transfer, HTTPError("connect %s failed: %s" % (transfer.key[1], e), sent=False))
+
+    def _progress(self, transfer):
+        try:
+            complete = transfer.on_event()
+        except (socket.error, ssl.SSLError, HTTPError, ValueError), e:
+            if transfer.replayable():
+                # keep-alive connection was closed by server, retry once with a new one
+                transfer.close()
+                transfer.parser = _ResponseParser()
+                transfer._sent = 0
+                try:
+                    transfer.start()
+                    return
+                except socket.error, e:
+                    pass
+            self._fail(transfer, HTTPError("async request exception: %s" % e,
+                                             sent=transfer.state == transfer.RECEIVING))
+            return
+        if not complete:
+            return
+
+        parser = transfer.parser
+        self._active.discard(transfer)
+        if parser.keep_alive:
+            self._release_conn(transfer.key, transfer.sock)
+        else:
+            transfer.close()
+        url, method, params, sent = transfer.exchange
+        reqlog.log_exchange('async', url, method, params, parser.status, parser.body, time.time() - sent)
+        if parser.status == 200:
+            transfer.future.set_result(parser.body)
+        else:
+            transfer.future.set_exception(
+                HTTPError("server http response error code: %s body: %s" % (parser.status, parser.body),
+                          status=parser.status))
+        self._next()
+
+    def _fail(self, transfer, exception):
+        transfer.close()
+        self._active.discard(transfer)
+        transfer.future.set_exception(exception)
+        self._next()
+
+    def _cancel(self, transfer):
+        self._drop(transfer)
+        self._next()
+
+    def _drop(self, transfer):
+        if transfer in self._active:
+            transfer.close()
+            self._active.discard(transfer)
+        else:
+            try:
+                self._pending.remove(transfer)
+            except ValueError:
+                pass
+
+    def _expire(self):
+        now = time.time()
+        expired = [transfer for transfer in list(self._active) + list(self._pending)
+                   if transfer.deadline is not None and transfer.deadline <= now]
+        for transfer in expired:
+            self._drop(transfer)
+            transfer.future.set_exception(TimeoutError("request deadline exceeded"))
+        if expired:
+            self._next()
+
+    def _next(self):
+        while self._pending and len(self._active) < self.max_concurrency:
+            transfer = self._pending.popleft()
+            if not transfer.future.done():
+                self._start(transfer)
+
+    def _idle_conn(self, key):
+        conns = self._idle.get(key)
+        now = time.time()
+        while conns:
+            sock, released_at = conns.pop()
+            if now - released_at < self.idle_timeout:
+                try:
+                    readable, _, _ = select.select([sock], [], [], 0)
+                except (select.error, socket.error):
+                    readable = True
+                if not readable:
+                    return sock
+            sock.close()
+        return None
+
+    def _release_conn(self, key, sock):
+        conns = self._idle.setdefault(key, [])
+        if len(conns) < self.max_idle:
+            conns.append((sock, time.time()))
+        else:
+            sock.close()
+
+    def _shutdown(self):
+        for transfer in list(self._pending):
+            self._pending.remove(transfer)
+            transfer.future.set_exception(HTTPError("http client is closed", sent=False))
+        for conns in self._idle.values():
+            for sock, _ in conns:
+                sock.close()
+        self._idle = {}
+
+
+class AsyncOpenSearchClient(OpenSearchClient):
+    """OpenSearchClient whose request() returns a Future.
+
+    Parameters are signed and responses are checked exactly like OpenSearchClient,
+    only the http round trip runs on the AsyncHttpClient event loop.
+    """
+
+    def __init__(self, api_host, access_key_id, access_key_secret, httpclient=None,
+                 max_concurrency=100, timeout=None):
+        if httpclient is None:
+            httpclient = AsyncHttpClient(max_concurrency=max_concurrency, timeout=timeout)
+        elif not isinstance(httpclient, AsyncHttpClient):
+            raise ArgumentError("httpclient must be 'opensearch.asyncclient.AsyncHttpClient' type")
+        super(AsyncOpenSearchClient, self).__init__(api_host, access_key_id, access_key_secret,
+                                                    httpclient)
+
+    def request(self, path, method='POST', **params):
+        """Send the request in background.
+
+        :return: Future -> response data
+        """
+        req_params = self._sign_params(method, params)
+        inner = self.httpclient.request_async(self.api_host + path, method, req_params)
+        future = Future()
+        future._cancel_hook = inner.cancel
+
+        def on_done(f):
+            if f.cancelled():
+                future.cancel()
+                return
+            try:
+                future.set_result(self._parse_response(f.result()))
+            except Exception, e:
+                future.set_exception(e)
+        inner.add_done_callback(on_done)
+        return future
+
+    def close(self):
+        super(AsyncOpenSearchClient, self).close()
+        self.httpclient.close()
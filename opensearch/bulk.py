@@ -0,0 +1,442 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import cPickle
+import json
+import operator
+import threading
+import time
+
+from functools import partial
+from Queue import Queue, Empty
+from opensearch import log
+from opensearch.api import Document
+from opensearch.encoding import FORM_ENCODINGS, encode_form
+from opensearch.exception import ArgumentError, OpenSearchError
+from opensearch.signature import Signer
+
+
+class BulkResult(object):
+    """Report of one pushed chunk.
+
+    offset is the position of the chunk's first operation among all operations
+    added to the indexer, starting from 0.
+    """
+
+    def __init__(self, offset, num_items, num_bytes, data=None, error=None):
+        self.offset = offset
+        self.num_items = num_items
+        self.num_bytes = num_bytes
+        self.data = data
+        self.error = error
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def __str__(self):
+        return "offset: %s items: %s bytes: %s error: %s" % (self.offset, self.num_items,
+                                                             self.num_bytes, self.error)
+
+
+class _Chunk(object):
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.encoded = []
+        self.num_bytes = 2
+        self.created = None
+        self.pending = {}
+
+    def append(self, encoded, size):
+        if self.created is None:
+            self.created = time.time()
+        self.encoded.append(encoded)
+        self.num_bytes += size + (len(self.encoded) > 1 and 1 or 0)
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def to_json(self):
+        return '[' + ','.join(self.encoded) + ']'
+
+
+class BulkIndexer(object):
+    """Buffer document operations and push them in chunks from background threads.
+
+    Operations are serialized when they are added and grouped into chunks of at
+    most max_items operations and max_bytes bytes of json. A chunk is pushed when
+    it is full, when it is older than flush_interval seconds, or on flush().
+    When max_in_flight chunks are waiting or being pushed, adding operations
+    blocks until one of them completes. Operations dropped by the document's
+    fingerprints are not counted in offsets.
+
+        with BulkIndexer(Document(client, 'app', 'main'), callback=report) as indexer:
+            for row in rows:
+                indexer.add(row)
+    """
+
+    def __init__(self, document, max_items=1000, max_bytes=2 * 1024 * 1024, max_in_flight=4,
+                 flush_interval=1.0, workers=1, callback=None):
+        """
+        :param document: the opensearch.api.Document table to push to.
+        :param max_items: max operations in one chunk.
+        :param max_bytes: max json bytes of one chunk, a bigger single operation is sent alone.
+        :param max_in_flight: max chunks queued or being pushed before producers block.
+        :param flush_interval: seconds a partial chunk may wait before it is pushed, None means never.
+        :param workers: number of threads pushing chunks.
+        :param callback: called with a BulkResult after each chunk, from a worker thread.
+        """
+        if not isinstance(document, Document):
+            raise ArgumentError("document must be 'opensearch.api.Document' type")
+        if max_items < 1 or max_bytes < 1 or max_in_flight < 1 or workers < 1:
+            raise ArgumentError("max_items, max_bytes, max_in_flight and workers must be greater than 0")
+        self.document = document
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.callback = callback
+
+        self.chunks_succeeded = 0
+        self.chunks_failed = 0
+        self.items_succeeded = 0
+        self.items_failed = 0
+
+        self._chunk = _Chunk(0)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._queue = Queue()
+        self._closed = False
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name='opensearch-bulk-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def add(self, fields, timestamp=None):
+        self._op('add', fields, timestamp)
+
+    def update(self, fields, timestamp=None):
+        self._op('update', fields, timestamp)
+
+    def delete(self, fields, timestamp=None):
+        self._op('delete', fields, timestamp)
+
+    def _op(self, cmd, fields, timestamp=None):
+        if self._closed:
+            raise ArgumentError("bulk indexer is closed")
+        encoded = self.document.jsonify(self.document.make_item(cmd, fields, timestamp))
+        if isinstance(encoded, unicode):
+            encoded = encoded.encode('utf8')
+        with self._lock:
+            chunk = self._chunk
+            if len(chunk) > 0 and (len(chunk) >= self.max_items or
+                                   chunk.num_bytes + len(encoded) + 1 > self.max_bytes):
+                self._seal()
+            if self.document.fingerprints is not None and \
+                    not self.document.track(cmd, fields, self._chunk.pending):
+                return
+            self._chunk.append(encoded, len(encoded))
+
+    def flush(self):
+        """Push the buffered operations and wait until every chunk is completed.
+        """
+        with self._lock:
+            self._seal()
+        self._queue.join()
+
+    def close(self):
+        """Flush and stop the worker threads.
+        """
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _seal(self, blocking=True):
+        # caller holds self._lock
+        chunk = self._chunk
+        if len(chunk) == 0:
+            return
+        if not self._in_flight.acquire(blocking):
+            return
+        self._chunk = _Chunk(chunk.offset + len(chunk))
+        self._queue.put(chunk)
+
+    def _work(self):
+        while True:
+            try:
+                chunk = self._queue.get(timeout=self.flush_interval)
+            except Empty:
+                self._flush_stale()
+                continue
+            if chunk is None:
+                self._queue.task_done()
+                return
+            try:
+                self._push(chunk)
+            finally:
+                self._in_flight.release()
+                self._queue.task_done()
+
+    def _flush_stale(self):
+        if not self._is_stale(self._chunk):
+            return
+        if self._lock.acquire(False):
+            try:
+                if self._is_stale(self._chunk):
+                    self._seal(blocking=False)
+            finally:
+                self._lock.release()
+
+    def _is_stale(self, chunk):
+        return chunk.created is not None and chunk.created + self.flush_interval <= time.time()
+
+    def _push(self, chunk):
+        try:
+            data = self.document.push_json(chunk.to_json())
+            result = BulkResult(chunk.offset, len(chunk), chunk.num_bytes, data=data)
+        except Exception, e:
+            # anything raised here, e.g. ValueError of a non json body, would kill the worker
+            log.error("push %s items to table %s failed: %s", len(chunk), self.document.table_name, e)
+            result = BulkResult(chunk.offset, len(chunk), chunk.num_bytes, error=e)
+        if result.success and self.document.fingerprints is not None:
+            try:
+                self.document.fingerprints.update(chunk.pending)
+            except Exception:
+                log.exception("record fingerprints of table %s failed", self.document.table_name)
+
+        with self._stats_lock:
+            if result.success:
+                self.chunks_succeeded += 1
+                self.items_succeeded += result.num_items
+            else:
+                self.chunks_failed += 1
+                self.items_failed += result.num_items
+        if self.callback is not None:
+            try:
+                self.callback(result)
+            except Exception:
+                log.exception("bulk indexer callback raised")
+
+
+_worker_signer = None
+
+
+def _init_worker(access_key_secret):
+    global _worker_signer
+    _worker_signer = Signer(access_key_secret)
+
+
+def _pack(records):
+    # one tuple of field names and a tuple of values per record pickles much
+    # smaller than a list of dicts repeating the same keys
+    keys = records[0].keys()
+    keyset = records[0].viewkeys()
+    for fields in records:
+        if fields.viewkeys() != keyset:
+            return 'dicts', records
+    if len(keys) == 1:
+        return 'columns', keys, [(fields[keys[0]],) for fields in records]
+    getter = operator.itemgetter(*keys)
+    return 'columns', keys, [getter(fields) for fields in records]
+
+
+def _encode_chunk(task):
+    # runs in a worker process: build the items json, sign and form encode the push
+    try:
+        common_params, table_name, cmd, packed, form_encoding = cPickle.loads(task)
+        if packed[0] == 'columns':
+            keys = packed[1]
+            records = [dict(zip(keys, row)) for row in packed[2]]
+        else:
+            records = packed[1]
+        items = json.dumps([dict(cmd=cmd, timestamp=None, fields=fields) for fields in records],
+                           ensure_ascii=False, separators=(',', ':'))
+        if isinstance(items, unicode):
+            items = items.encode('utf8')
+        params = dict(common_params, action='push', table_name=table_name, items=items)
+        params['Signature'] = _worker_signer.sign('POST', params)
+        body, content_type = encode_form(params, form_encoding)
+        return True, (body, content_type, len(items))
+    except Exception, e:
+        return False, "%s: %s" % (e.__class__.__name__, e)
+
+
+class ParallelPusher(object):
+    """Push very large batches, encoding and signing chunks in worker processes.
+
+    Records are grouped into chunks on the calling thread and handed to a
+    process pool, which builds the items json, signs the push and form encodes
+    the body. A thread pool sends the encoded bodies. At most max_in_flight
+    chunks are being encoded or sent, so a lazy input is read as fast as it is
+    pushed.
+
+        with ParallelPusher(Document(client, 'app', 'main'), processes=4) as pusher:
+            results = pusher.push(read_jsonl(f))
+    """
+
+    def __init__(self, document, processes=None, threads=4, max_items=1000, max_in_flight=None,
+                 form_encoding=None, callback=None):
+        """
+        :param document: the opensearch.api.Document table to push to.
+        :param processes: worker processes encoding chunks, None means one per cpu.
+        :param threads: threads sending encoded chunks.
+        :param max_items: max operations in one chunk.
+        :param max_in_flight: max chunks being encoded or sent, twice processes plus threads by default.
+        :param form_encoding: 'urlencoded' or 'multipart', the form_encoding of the client's
+                              http client by default.
+        :param callback: called with a BulkResult after each chunk.
+        """
+        if not isinstance(document, Document):
+            raise ArgumentError("document must be 'opensearch.api.Document' type")
+        if threads < 1 or max_items < 1:
+            raise ArgumentError("threads and max_items must be greater than 0")
+        if form_encoding is None:
+            form_encoding = getattr(document.client.httpclient, 'form_encoding', 'urlencoded')
+        if form_encoding not in FORM_ENCODINGS:
+            raise ArgumentError("form_encoding must be one of %s" % (FORM_ENCODINGS,))
+        self.document = document
+        self.processes = processes
+        self.threads = threads
+        self.max_items = max_items
+        self.max_in_flight = max_in_flight
+        self.form_encoding = form_encoding
+        self.callback = callback
+        self._processes = None
+        self._senders = None
+
+    def push(self, records, cmd='add'):
+        """Push all records, return once every chunk is completed.
+
+        :param records: iterable of field dicts, each with an 'id'.
+        :param cmd: 'add', 'update' or 'delete'
+        :return: results -> list of BulkResult ordered by offset
+        """
+        if cmd not in ('add', 'update', 'delete'):
+            raise ArgumentError("cmd must be 'add', 'update' or 'delete'")
+        self._start()
+        client = self.document.client
+        results = []
+        done = threading.Condition()
+        pending = [0]
+
+        def finish(result):
+            if self.callback is not None:
+                try:
+                    self.callback(result)
+                except Exception:
+                    log.exception("parallel pusher callback raised")
+            with done:
+                results.append(result)
+                pending[0] -= 1
+                done.notify()
+            in_flight.release()
+
+        def on_encoded(offset, num_items, outcome):
+            # called on the process pool's result thread, the network I/O goes to a sender thread
+            ok, value = outcome
+            if not ok:
+                finish(BulkResult(offset, num_items, 0, error=OpenSearchError("encode failed: %s" % value)))
+                return
+            self._senders.apply_async(self._send, (offset, num_items, value, finish))
+
+        in_flight = threading.BoundedSemaphore(self.max_in_flight or 2 * self._num_processes + self.threads)
+        offset = 0
+        try:
+            for chunk in self._chunks(records):
+                in_flight.acquire()
+                with done:
+                    pending[0] += 1
+                try:
+                    # pickled here: Pool never calls back for a task it fails to pickle
+                    task = cPickle.dumps((client._generate_common_params(), self.document.table_name, cmd,
+                                          _pack(chunk), self.form_encoding), cPickle.HIGHEST_PROTOCOL)
+                except Exception, e:
+                    finish(BulkResult(offset, len(chunk), 0, error=OpenSearchError(
+                        "encode failed: %s: %s" % (e.__class__.__name__, e))))
+                    offset += len(chunk)
+                    continue
+                self._processes.apply_async(_encode_chunk, (task,),
+                                            callback=partial(on_encoded, offset, len(chunk)))
+                offset += len(chunk)
+        finally:
+            with done:
+                while pending[0]:
+                    done.wait(1)
+        results.sort(key=lambda result: result.offset)
+        return results
+
+    def close(self):
+        if self._processes is not None:
+            self._processes.close()
+            self._processes.join()
+            self._senders.close()
+            self._senders.join()
+            self._processes = self._senders = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start(self):
+        if self._processes is not None:
+            return
+        # imported here, most users of the package never start processes
+        from multiprocessing import Pool, cpu_count
+        from multiprocessing.pool import ThreadPool
+        self._num_processes = self.processes or cpu_count()
+        # fork the workers before starting threads in this process
+        self._processes = Pool(self._num_processes, _init_worker, (self.document.client.access_key_secret,))
+        self._senders = ThreadPool(self.threads)
+
+    def _chunks(self, records):
+        chunk = []
+        for fields in records:
+            if not isinstance(fields, dict) or fields.get('id') is None:
+                raise ArgumentError("records must be dicts containing a not None 'id' key")
+            chunk.append(fields)
+            if len(chunk) >= self.max_items:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _send(self, offset, num_items, encoded, finish):
+        body, content_type, num_bytes = encoded
+        try:
+            data = self.document.client.send_encoded(self.document.path, body, content_type)
+            result = BulkResult(offset, num_items, num_bytes, data=data)
+        except Exception, e:
+            # anything escaping here would leave push() waiting for this chunk forever
+            log.error("push %s items to table %s failed: %s", num_items, self.document.table_name, e)
+            result = BulkResult(offset, num_items, num_bytes, error=e)
+        finish(result)
@@ -0,0 +1,323 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from opensearch.exception import ArgumentError
+
+
+class ResultCache(object):
+    """In-process LRU cache of search and suggest responses.
+
+    Entries are response bodies keyed by the request path and business
+    parameters. The cache holds at most max_bytes of keys and bodies, the least
+    recently used entries are evicted first, and every entry expires ttl seconds
+    after it was stored.
+
+        client = OpenSearchClient(api_host, access_key_id, access_key_secret,
+                                  cache=ResultCache(max_bytes=32 * 1024 * 1024, ttl=30))
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60, invalidate_on_write=True):
+        """
+        :param max_bytes: memory bound of the cached keys and bodies.
+        :param ttl: seconds an entry stays valid.
+        :param invalidate_on_write: drop the entries of an app when documents are pushed to it
+                                    or the app is changed through Application.
+        """
+        if max_bytes <= 0 or ttl <= 0:
+            raise ArgumentError("max_bytes and ttl must be greater than 0")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.invalidate_on_write = invalidate_on_write
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the cached body, None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            body, expires_at, _ = entry
+            if expires_at <= time.time():
+                self._discard(key, entry)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return body
+
+    def set(self, key, body, tags=()):
+        """Store a body.
+
+        :param tags: app names of the entry, used by invalidate()
+        """
+        size = len(key) + len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._discard(key, old)
+            while self._entries and self._bytes + size > self.max_bytes:
+                old_key, old = self._entries.popitem(last=False)
+                self._discard(old_key, old)
+                self.evictions += 1
+            self._entries[key] = (body, time.time() + self.ttl, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tag):
+        """Drop all entries of an app.
+        """
+        with self._lock:
+            keys = self._tags.pop(tag, ())
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._discard(key, entry)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(entries=len(self._entries), bytes=self._bytes, hits=self.hits,
+                        misses=self.misses, evictions=self.evictions,
+                        expirations=self.expirations, invalidations=self.invalidations)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, key, entry):
+        # caller holds self._lock and has removed key from self._entries
+        body, _, tags = entry
+        self._bytes -= len(key) + len(body)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+DEFAULT_HINT = 10
+
+
+class _Node(object):
+
+    __slots__ = ('children', 'entry')
+
+    def __init__(self):
+        self.children = None
+        self.entry = None
+
+
+class _Suggestions(object):
+
+    __slots__ = ('key', 'suggestions', 'hint', 'complete', 'expires_at', 'size')
+
+    def __init__(self, key, suggestions, hint, ttl):
+        self.key = key
+        self.suggestions = suggestions
+        self.hint = hint
+        # fewer suggestions than asked for: every suggestion of the prefix is there
+        self.complete = len(suggestions) < hint
+        self.expires_at = time.time() + ttl
+        self.size = SuggestCache.NODE_BYTES * len(key[2]) + sum(
+            SuggestCache.ITEM_BYTES + len(item.get('suggestion') or '') for item in suggestions)
+
+
+class SuggestCache(object):
+    """Type-ahead cache of Suggestion.suggest responses in a prefix trie.
+
+    Responses are stored under their app, suggest_name and query_text. A
+    query is answered locally from its own response, or by filtering the
+    response of the longest shorter prefix that was not truncated by hint:
+    typing '北京大学' after '北京' returned fewer suggestions than asked for
+    needs no request. Derived answers keep the order of the cached response.
+
+    Entries are evicted least recently used first once their estimated size
+    exceeds max_bytes, and expire ttl seconds after they were stored.
+
+        suggestion = Suggestion(client, 'app', cache=SuggestCache(max_bytes=4 * 1024 * 1024, ttl=300))
+    """
+
+    NODE_BYTES = 120
+    ITEM_BYTES = 96
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=300, derive=True):
+        """
+        :param max_bytes: memory bound of the cached suggestions and trie nodes.
+        :param ttl: seconds a response stays valid.
+        :param derive: answer longer prefixes from shorter ones, disable it when
+                       suggestions may not start with the query (e.g. pinyin).
+        """
+        if max_bytes <= 0 or ttl <= 0:
+            raise ArgumentError("max_bytes and ttl must be greater than 0")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.derive = derive
+
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._roots = {}
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, app_name, suggest_name, query_text, hint=None):
+        """Answer a suggest request, None if it must be sent.
+        """
+        query = _text(query_text)
+        hint = hint or DEFAULT_HINT
+        now = time.time()
+        with self._lock:
+            node = self._roots.get((app_name, suggest_name))
+            shorter = None
+            expired = []
+            for char in query:
+                if node is None:
+                    break
+                entry = node.entry
+                if entry is not None:
+                    if entry.expires_at <= now:
+                        expired.append(entry)
+                    elif entry.complete and self.derive:
+                        shorter = entry
+                node = node.children is not None and node.children.get(char) or None
+
+            exact = node is not None and node.entry or None
+            if exact is not None and exact.expires_at <= now:
+                expired.append(exact)
+                exact = None
+            if exact is not None and (exact.complete or hint <= exact.hint):
+                self.hits += 1
+                used, found = exact, exact.suggestions
+            elif shorter is not None:
+                self.prefix_hits += 1
+                used, found = shorter, [item for item in shorter.suggestions
+                                        if _text(item.get('suggestion') or '').startswith(query)]
+            else:
+                self.misses += 1
+                used = found = None
+
+            for entry in expired:
+                self._remove(entry)
+                self.expirations += 1
+            if used is None:
+                return None
+            self._lru[used.key] = self._lru.pop(used.key)
+        return dict(suggestions=[dict(item) for item in found[:hint]])
+
+    def set(self, app_name, suggest_name, query_text, hint, result):
+        """Store the response of a suggest request.
+        """
+        suggestions = isinstance(result, dict) and result.get('suggestions')
+        if not isinstance(suggestions, list):
+            return
+        query = _text(query_text)
+        if not query:
+            return
+        entry = _Suggestions((app_name, suggest_name, query), [dict(item) for item in suggestions],
+                             hint or DEFAULT_HINT, self.ttl)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._lru.get(entry.key)
+            if old is not None:
+                self._remove(old)
+            while self._lru and self._bytes + entry.size > self.max_bytes:
+                self._remove(next(self._lru.itervalues()))
+                self.evictions += 1
+            node = self._roots.get(entry.key[:2])
+            if node is None:
+                node = self._roots[entry.key[:2]] = _Node()
+            for char in query:
+                if node.children is None:
+                    node.children = {}
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node()
+                node = child
+            node.entry = entry
+            self._lru[entry.key] = entry
+            self._bytes += entry.size
+
+    def clear(self):
+        with self._lock:
+            self._roots.clear()
+            self._lru.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.prefix_hits + self.misses
+            return dict(entries=len(self._lru), bytes=self._bytes, hits=self.hits,
+                        prefix_hits=self.prefix_hits, misses=self.misses, evictions=self.evictions,
+                        expirations=self.expirations,
+                        hit_rate=lookups and float(self.hits + self.prefix_hits) / lookups or 0.0)
+
+    def __len__(self):
+        return len(self._lru)
+
+    def _remove(self, entry):
+        # caller holds self._lock. unlink the entry and prune the nodes left empty
+        del self._lru[entry.key]
+        self._bytes -= entry.size
+        root_key, query = entry.key[:2], entry.key[2]
+        path = [self._roots[root_key]]
+        for char in query:
+            path.append(path[-1].children[char])
+        path[-1].entry = None
+        for i in xrange(len(query), 0, -1):
+            node = path[i]
+            if node.entry is not None or node.children:
+                return
+            del path[i - 1].children[query[i - 1]]
+        if path[0].entry is None and not path[0].children:
+            del self._roots[root_key]
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.decode('utf8')
+    return value
@@ -0,0 +1,893 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+In-memory emulation of the OpenSearch api for load tests.
+
+Every app is an Index: pushed fields are stored column by column, text is
+tokenized into posting lists of document numbers, the query clause is
+evaluated by merging posting lists, and filter, sort, aggregate and distinct
+read the columns of the matched documents only.
+
+    emulator = Emulator()
+    client = OpenSearchClient('http://emulator', 'id', 'secret', httpclient=EmulatorHttpClient(emulator))
+    Document(client, 'app', 'main').push_json(items)
+    Search(client, 'app').search(SimpleQuery().query_by('default', "'kobe'").filter_by('price', '<', 100))
+
+Text is split into lowercase ascii words and single CJK characters, a quoted
+term matches documents containing all of its tokens. Index names are field
+names, 'default' searches every indexed field. Ranking counts the matched
+terms weighted by their idf.
+"""
+import heapq
+import json
+import math
+import operator
+import re
+import threading
+import time
+
+from array import array
+from bisect import bisect_left
+from urlparse import urlparse
+from opensearch.encoding import EncodedForm
+from opensearch.exception import ArgumentError, OpenSearchError
+from opensearch.httpclient import HttpClient
+
+# error codes answered by the emulator
+APP_NOT_FOUND = 2002
+APP_EXISTS = 2003
+INVALID_ITEMS = 3001
+SYNTAX_ERROR = 6010
+NOT_SUPPORTED = 1000
+
+_TOKEN_RE = re.compile(u'[0-9a-z_]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]', re.UNICODE)
+_CLAUSE_RE = re.compile(r'&&(?=(?:query|filter|sort|aggregate|distinct|config|kvpair|kvpairs)=)')
+_AGG_SPLIT_RE = re.compile(r',(?=(?:group_key|agg_fun|range|agg_filter|agg_sampler_threshold|'
+                           r'agg_sampler_step|max_group):)')
+_DIST_SPLIT_RE = re.compile(r',(?=(?:dist_key|dist_times|dist_count|reserved|update_total_hit|'
+                            r'dist_filter|grade):)')
+_QUERY_TOKEN_RE = re.compile(
+    r"""\s*(?:(?P<paren>[()])|(?P<op>ANDNOT|AND|OR|RANK)(?=[\s(]|$)|"""
+    r"""(?:(?P<index>\w+):)?(?:'(?P<sq>[^']*)'|"(?P<dq>[^"]*)"|(?P<bare>[^\s()'"^]+))(?:\^(?P<boost>\d+))?)""",
+    re.UNICODE)
+_EXPR_TOKEN_RE = re.compile(
+    r"""\s*(?:(?P<number>\d+(?:\.\d*)?)|"(?P<string>(?:[^"\\]|\\.)*)"|"""
+    r"""(?P<op>!=|>=|<=|=|<|>|\+|-|\*|/|\(|\)|,)|(?P<name>[A-Za-z_]\w*))""",
+    re.UNICODE)
+
+
+class EmulatorError(OpenSearchError):
+
+    def __init__(self, code, message):
+        super(EmulatorError, self).__init__(message)
+        self.code = code
+
+
+def tokenize(text):
+    if isinstance(text, str):
+        text = text.decode('utf8', 'replace')
+    elif not isinstance(text, unicode):
+        text = unicode(text)
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.decode('utf8', 'replace')
+    if isinstance(value, unicode):
+        return value
+    return unicode(value)
+
+
+# sorted posting lists
+
+def _intersect(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) < 10 * len(a):
+        # similar sizes: hashing both lists beats a binary search per element
+        return sorted(set(a).intersection(b))
+    out = []
+    lo, n = 0, len(b)
+    for docno in a:
+        lo = bisect_left(b, docno, lo)
+        if lo == n:
+            break
+        if b[lo] == docno:
+            out.append(docno)
+            lo += 1
+    return out
+
+
+def _union(a, b):
+    if not a:
+        return b
+    if not b:
+        return a
+    return sorted(set(a).union(b))
+
+
+def _difference(a, b):
+    if not b:
+        return a
+    if len(b) < 10 * len(a):
+        b = set(b)
+        return [docno for docno in a if docno not in b]
+    out = []
+    lo, n = 0, len(b)
+    for docno in a:
+        lo = bisect_left(b, docno, lo)
+        if lo == n or b[lo] != docno:
+            out.append(docno)
+    return out
+
+
+class Index(object):
+    """Documents of one app.
+
+    Documents get increasing numbers, so posting lists stay sorted by
+    appending. Updates and deletes leave a dead number behind, dead numbers are
+    skipped when matching and dropped by compact().
+    """
+
+    def __init__(self, name, primary_key='id', index_fields=None, compact_ratio=1.0):
+        """
+        :param primary_key: the field identifying a document.
+        :param index_fields: fields tokenized into posting lists, None indexes every field.
+        :param compact_ratio: compact() when dead documents exceed this ratio of live ones.
+        """
+        self.name = name
+        self.primary_key = primary_key
+        self.index_fields = index_fields and frozenset(index_fields)
+        self.compact_ratio = compact_ratio
+        self.columns = {}
+        self.postings = {}
+        self.lock = threading.RLock()
+        self._ids = {}
+        self._alive = bytearray()
+        self._dead = 0
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def push(self, items):
+        """Apply a batch of add, update and delete operations.
+        """
+        with self.lock:
+            for item in items:
+                cmd = item.get('cmd')
+                fields = item.get('fields') or {}
+                if self.primary_key not in fields:
+                    raise EmulatorError(INVALID_ITEMS, "item has no primary key '%s'" % self.primary_key)
+                if cmd == 'add':
+                    self.add(fields)
+                elif cmd == 'update':
+                    self.update(fields)
+                elif cmd == 'delete':
+                    self.delete(fields[self.primary_key])
+                else:
+                    raise EmulatorError(INVALID_ITEMS, "invalid cmd: %s" % cmd)
+            if self._dead > 1000 and self._dead > len(self._ids) * self.compact_ratio:
+                self.compact()
+
+    def add(self, fields):
+        with self.lock:
+            key = _text(fields[self.primary_key])
+            self.delete(key)
+            docno = len(self._alive)
+            self._alive.append(1)
+            self._ids[key] = docno
+            self._vocabulary = None
+            for name, value in fields.iteritems():
+                if value is None:
+                    continue
+                if isinstance(value, list):
+                    value = tuple(value)
+                column = self.columns.get(name)
+                if column is None:
+                    column = self.columns[name] = []
+                if len(column) < docno:
+                    column.extend([None] * (docno - len(column)))
+                column.append(value)
+                if self.index_fields is None or name in self.index_fields:
+                    self._index(name, docno, value)
+            return docno
+
+    def update(self, fields):
+        with self.lock:
+            docno = self._ids.get(_text(fields[self.primary_key]))
+            if docno is None:
+                return self.add(fields)
+            row = self.row(docno)
+            row.update(fields)
+            return self.add(row)
+
+    def delete(self, key):
+        with self.lock:
+            docno = self._ids.pop(_text(key), None)
+            if docno is not None:
+                self._alive[docno] = 0
+                self._dead += 1
+
+    def row(self, docno, names=None):
+        row = {}
+        for name in names or self.columns:
+            column = self.columns.get(name)
+            if column is not None and docno < len(column) and column[docno] is not None:
+                value = column[docno]
+                row[name] = isinstance(value, tuple) and list(value) or value
+        return row
+
+    def compact(self):
+        """Renumber the live documents and rebuild the posting lists without dead ones.
+        """
+        with self.lock:
+            live = [docno for docno in self._ids.itervalues()]
+            live.sort()
+            rows = [self.row(docno) for docno in live]
+            self.columns = {}
+            self.postings = {}
+            self._ids = {}
+            self._alive = bytearray()
+            self._dead = 0
+            for row in rows:
+                self.add(row)
+
+    def _index(self, name, docno, value):
+        terms = set()
+        for v in isinstance(value, tuple) and value or (value,):
+            terms.update(tokenize(v))
+        if not terms:
+            return
+        field = self.postings.get(name)
+        if field is None:
+            field = self.postings[name] = {}
+        for term in terms:
+            posting = field.get(term)
+            if posting is None:
+                posting = field[term] = array('i')
+            posting.append(docno)
+
+    def posting(self, fields, term):
+        """Sorted numbers of the documents containing term in any of fields.
+        """
+        docs = None
+        for name in fields:
+            posting = self.postings.get(name, {}).get(term)
+            if posting:
+                docs = docs is None and posting or _union(docs, posting)
+        return docs or ()
+
+    def fields_of(self, index_name):
+        if index_name == 'default':
+            return self.postings.keys()
+        return (index_name,)
+
+    def doc_freq(self, fields, term):
+        return sum(len(self.postings.get(name, {}).get(term, ())) for name in fields)
+
+    def alive(self, docs):
+        alive = self._alive
+        if not self._dead:
+            return list(docs)
+        return [docno for docno in docs if alive[docno]]
+
+    def getter(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            return lambda docno: None
+        return lambda docno: column[docno] if docno < len(column) else None
+
+    def vocabulary(self):
+        if self._vocabulary is None:
+            terms = {}
+            for field in self.postings.itervalues():
+                for term, posting in field.iteritems():
+                    terms[term] = terms.get(term, 0) + len(posting)
+            self._vocabulary = (sorted(terms), terms)
+        return self._vocabulary
+
+
+# query clause
+
+class _Term(object):
+
+    def __init__(self, index_name, text, boost):
+        self.index_name = index_name
+        self.tokens = tokenize(text)
+        self.boost = boost
+
+    def evaluate(self, index, scored):
+        fields = index.fields_of(self.index_name)
+        docs = None
+        for token in self.tokens:
+            posting = index.posting(fields, token)
+            if scored is not None and posting:
+                idf = math.log(1 + float(len(index)) / (1 + index.doc_freq(fields, token)))
+                scored.append((posting, idf * self.boost))
+            docs = docs is None and posting or _intersect(docs, posting)
+            if not docs:
+                return ()
+        return docs or ()
+
+
+class _BinaryOp(object):
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def evaluate(self, index, scored):
+        left = self.left.evaluate(index, scored)
+        if self.op == 'RANK':
+            self.right.evaluate(index, scored)
+            return left
+        if self.op == 'ANDNOT':
+            return _difference(left, self.right.evaluate(index, None))
+        right = self.right.evaluate(index, scored)
+        if self.op == 'AND':
+            return _intersect(left, right)
+        return _union(left, right)
+
+
+class _QueryParser(object):
+    # () > ANDNOT > AND > OR > RANK
+
+    LEVELS = ('RANK', 'OR', 'AND', 'ANDNOT')
+
+    def __init__(self, text):
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = _QUERY_TOKEN_RE.match(text, pos)
+            if match is None or match.end() == pos:
+                raise EmulatorError(SYNTAX_ERROR, "invalid query near: %s" % text[pos:pos + 20])
+            self.tokens.append(match)
+            pos = match.end()
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+        self.pos = 0
+
+    def parse(self):
+        node = self._level(0)
+        if self.pos != len(self.tokens):
+            raise EmulatorError(SYNTAX_ERROR, "unexpected query token: %s" % self.tokens[self.pos].group(0))
+        return node
+
+    def _peek_op(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos].group('op')
+
+    def _level(self, level):
+        if level == len(self.LEVELS):
+            return self._primary()
+        node = self._level(level + 1)
+        while self._peek_op() == self.LEVELS[level]:
+            self.pos += 1
+            node = _BinaryOp(self.LEVELS[level], node, self._level(level + 1))
+        return node
+
+    def _primary(self):
+        if self.pos >= len(self.tokens):
+            raise EmulatorError(SYNTAX_ERROR, "query ends unexpectedly")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if token.group('paren') == '(':
+            node = self._level(0)
+            if self.pos >= len(self.tokens) or self.tokens[self.pos].group('paren') != ')':
+                raise EmulatorError(SYNTAX_ERROR, "missing ')' in query")
+            self.pos += 1
+            return node
+        if token.group('paren') or token.group('op'):
+            raise EmulatorError(SYNTAX_ERROR, "unexpected query token: %s" % token.group(0))
+        text = token.group('sq')
+        if text is None:
+            text = token.group('dq')
+        if text is None:
+            text = token.group('bare')
+        return _Term(token.group('index') or 'default', text, int(token.group('boost') or 1))
+
+
+# filter and sort expressions
+
+def _number(value):
+    if isinstance(value, (int, long, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _compare(op, left, right):
+    if left is None or right is None:
+        return False
+    if isinstance(left, tuple):
+        return any(_compare(op, v, right) for v in left)
+    if isinstance(left, basestring) != isinstance(right, basestring):
+        left, right = _number(left), _number(right)
+        if left is None or right is None:
+            return False
+    return op(left, right)
+
+
+def _arithmetic(op, left, right):
+    left, right = _number(left), _number(right)
+    if left is None or right is None:
+        return None
+    try:
+        return op(left, right)
+    except ZeroDivisionError:
+        return None
+
+
+_COMPARISONS = {'=': operator.eq, '!=': operator.ne, '>': operator.gt, '<': operator.lt,
+                '>=': operator.ge, '<=': operator.le}
+_ARITHMETICS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+
+class _ExprParser(object):
+    """Compile a filter or sort expression into a function of the document number.
+    """
+
+    def __init__(self, text, index):
+        self.index = index
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = _EXPR_TOKEN_RE.match(text, pos)
+            if match is None or match.end() == pos:
+                raise EmulatorError(SYNTAX_ERROR, "invalid expression near: %s" % text[pos:pos + 20])
+            kind = match.lastgroup
+            self.tokens.append((kind, match.group(kind)))
+            pos = match.end()
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+        self.pos = 0
+
+    def parse(self):
+        fn = self._or()
+        if self.pos != len(self.tokens):
+            raise EmulatorError(SYNTAX_ERROR, "unexpected token: %s" % self.tokens[self.pos][1])
+        return fn
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None, None
+
+    def _accept(self, kind, value):
+        if self._peek() == (kind, value):
+            self.pos += 1
+            return True
+        return False
+
+    def _expect(self, value):
+        if not self._accept('op', value):
+            raise EmulatorError(SYNTAX_ERROR, "expected '%s'" % value)
+
+    def _or(self):
+        fn = self._and()
+        while self._accept('name', 'OR'):
+            left, right = fn, self._and()
+            fn = lambda d, left=left, right=right: bool(left(d)) or bool(right(d))
+        return fn
+
+    def _and(self):
+        fn = self._comparison()
+        while self._accept('name', 'AND'):
+            left, right = fn, self._comparison()
+            fn = lambda d, left=left, right=right: bool(left(d)) and bool(right(d))
+        return fn
+
+    def _comparison(self):
+        fn = self._sum()
+        kind, value = self._peek()
+        if kind == 'op' and value in _COMPARISONS:
+            self.pos += 1
+            op, left, right = _COMPARISONS[value], fn, self._sum()
+            column = getattr(left, 'column', None)
+            if column is not None and isinstance(getattr(right, 'constant', None), (int, long, float)):
+                fn = self._compare_column(op, column, right.constant)
+            else:
+                fn = lambda d: _compare(op, left(d), right(d))
+        return fn
+
+    @staticmethod
+    def _compare_column(op, column, constant):
+        # the common 'field op number' filter, without the generic value dispatch
+        numeric = (int, long, float)
+
+        def compare(d):
+            value = column[d] if d < len(column) else None
+            if value.__class__ in numeric:
+                return op(value, constant)
+            return _compare(op, value, constant)
+        return compare
+
+    def _sum(self):
+        fn = self._product()
+        while self._peek()[0] == 'op' and self._peek()[1] in ('+', '-'):
+            op = _ARITHMETICS[self._peek()[1]]
+            self.pos += 1
+            left, right = fn, self._product()
+            fn = lambda d, op=op, left=left, right=right: _arithmetic(op, left(d), right(d))
+        return fn
+
+    def _product(self):
+        fn = self._factor()
+        while self._peek()[0] == 'op' and self._peek()[1] in ('*', '/'):
+            op = _ARITHMETICS[self._peek()[1]]
+            self.pos += 1
+            left, right = fn, self._factor()
+            fn = lambda d, op=op, left=left, right=right: _arithmetic(op, left(d), right(d))
+        return fn
+
+    def _factor(self):
+        kind, value = self._peek()
+        self.pos += 1
+        if kind == 'number':
+            number = '.' in value and float(value) or int(value)
+            constant = lambda d: number
+            constant.constant = number
+            return constant
+        if kind == 'string':
+            string = value.replace('\\"', '"')
+            return lambda d: string
+        if (kind, value) == ('op', '-'):
+            fn = self._factor()
+            return lambda d: _arithmetic(operator.sub, 0, fn(d))
+        if (kind, value) == ('op', '('):
+            fn = self._or()
+            self._expect(')')
+            return fn
+        if kind == 'name':
+            if self._accept('op', '('):
+                return self._function(value)
+            getter = self.index.getter(value)
+            getter.column = self.index.columns.get(value)
+            return getter
+        raise EmulatorError(SYNTAX_ERROR, "unexpected token: %s" % value)
+
+    def _function(self, name):
+        args = [self._or()]
+        while self._accept('op', ','):
+            args.append(self._or())
+        self._expect(')')
+        if name in ('in', 'notin') and len(args) == 2:
+            field, values = args
+            choices = frozenset(values(None).split('|'))
+            numbers = frozenset(_number(v) for v in choices)
+
+            def contains(d):
+                value = field(d)
+                for v in isinstance(value, tuple) and value or (value,):
+                    if v in choices or _number(v) in numbers:
+                        return True
+                return False
+            if name == 'in':
+                return contains
+            return lambda d: not contains(d)
+        raise EmulatorError(SYNTAX_ERROR, "unsupported function: %s" % name)
+
+
+# search
+
+def _parse_args(text, splitter):
+    args = {}
+    for part in splitter.split(text):
+        key, _, value = part.partition(':')
+        args[key.strip()] = value.strip()
+    return args
+
+
+class _Search(object):
+
+    def __init__(self, index, query_string):
+        self.index = index
+        self.clauses = {}
+        for clause in _CLAUSE_RE.split(_text(query_string)):
+            name, sep, value = clause.partition('=')
+            if not sep:
+                raise EmulatorError(SYNTAX_ERROR, "invalid clause: %s" % clause)
+            self.clauses[name.strip()] = value.strip()
+        if 'query' not in self.clauses:
+            raise EmulatorError(SYNTAX_ERROR, "query clause required")
+        config = _parse_args(self.clauses.get('config', ''), re.compile(','))
+        self.start = int(config.get('start') or 0)
+        self.hit = int(config.get('hit') or config.get('hint') or 10)
+
+    def run(self, fetch_fields=None):
+        index = self.index
+        sort = self._sort_keys()
+        ranked = any(name == 'RANK' for name, _ in sort)
+        scored = None
+        if ranked:
+            scored = []
+        docs = index.alive(_QueryParser(self.clauses['query']).parse().evaluate(index, scored))
+
+        if 'filter' in self.clauses:
+            match = _ExprParser(self.clauses['filter'], index).parse()
+            docs = [docno for docno in docs if match(docno)]
+        facet = [self._aggregate(docs, spec) for spec in self.clauses.get('aggregate', '').split(';')
+                 if spec.strip()]
+
+        scores = ranked and self._scores(docs, scored) or {}
+        wanted = self.start + self.hit
+        distinct = 'distinct' in self.clauses and _parse_args(self.clauses['distinct'], _DIST_SPLIT_RE)
+        if distinct:
+            ordered = self._distinct(self._sorted(docs, sort, scores, None), distinct)
+        else:
+            ordered = self._sorted(docs, sort, scores, wanted)
+        page = ordered[self.start:wanted]
+
+        names = fetch_fields and [n for n in fetch_fields.split(';') if n] or None
+        items = []
+        for docno in page:
+            item = index.row(docno, names)
+            item['index_name'] = index.name
+            items.append(item)
+        return dict(total=len(docs), num=len(items), viewtotal=min(len(docs), 5000),
+                    items=items, facet=facet)
+
+    def _sort_keys(self):
+        keys = []
+        for key in (self.clauses.get('sort') or '-RANK').split(';'):
+            key = key.strip()
+            if not key:
+                continue
+            desc = key[0] == '-'
+            if key[0] in '+-':
+                key = key[1:]
+            keys.append((key, desc))
+        return keys
+
+    @staticmethod
+    def _scores(docs, scored):
+        scores = dict.fromkeys(docs, 0.0)
+        for posting, weight in scored:
+            for docno in _intersect(docs, posting):
+                scores[docno] += weight
+        return scores
+
+    def _sorted(self, docs, sort, scores, limit):
+        getters = []
+        for name, desc in sort:
+            if name == 'RANK':
+                getters.append((scores.get, desc))
+            else:
+                getters.append((_ExprParser(name, self.index).parse(), desc))
+        if len(getters) == 1 and limit is not None and limit < len(docs):
+            getter, desc = getters[0]
+            # ties keep the document order like the stable sort below
+            if desc:
+                return [d for _, _, d in heapq.nlargest(limit, ((getter(d), -d, d) for d in docs))]
+            return [d for _, _, d in heapq.nsmallest(limit, ((getter(d), d, d) for d in docs))]
+        ordered = list(docs)
+        for getter, desc in reversed(getters):
+            ordered.sort(key=getter, reverse=desc)
+        return ordered
+
+    def _distinct(self, ordered, args):
+        key = self.index.getter(args.get('dist_key', ''))
+        limit = int(args.get('dist_count') or 1) * int(args.get('dist_times') or 1)
+        reserved = args.get('reserved', 'true') != 'false'
+        counts = {}
+        kept, rest = [], []
+        for docno in ordered:
+            value = key(docno)
+            n = counts[value] = counts.get(value, 0) + 1
+            if n <= limit:
+                kept.append(docno)
+            elif reserved:
+                rest.append(docno)
+        return kept + rest
+
+    def _aggregate(self, docs, spec):
+        args = _parse_args(spec, _AGG_SPLIT_RE)
+        group_key = args.get('group_key')
+        if not group_key:
+            raise EmulatorError(SYNTAX_ERROR, "aggregate needs group_key")
+        key = self.index.getter(group_key)
+        if args.get('agg_filter'):
+            match = _ExprParser(args['agg_filter'], self.index).parse()
+            docs = [docno for docno in docs if match(docno)]
+        # add_aggregate() writes range:None when no range is given
+        bounds = [b for b in (_number(b) for b in args.get('range', '').split('~')) if b is not None]
+        funs = []
+        for fun in (args.get('agg_fun') or 'count()').split('#'):
+            name, _, arg = fun.strip().rstrip(')').partition('(')
+            if name not in ('count', 'sum', 'max', 'min'):
+                raise EmulatorError(SYNTAX_ERROR, "unsupported agg_fun: %s" % fun)
+            funs.append((name, arg and _ExprParser(arg, self.index).parse()))
+
+        groups = {}
+        for docno in docs:
+            value = key(docno)
+            if value is None:
+                continue
+            for group in isinstance(value, tuple) and value or (value,):
+                if bounds:
+                    group = self._bucket(bounds, _number(group))
+                acc = groups.get(group)
+                if acc is None:
+                    acc = groups[group] = {}
+                for name, fn in funs:
+                    if name == 'count':
+                        acc['count'] = acc.get('count', 0) + 1
+                        continue
+                    v = _number(fn(docno))
+                    if v is None:
+                        continue
+                    if name == 'sum':
+                        acc['sum'] = acc.get('sum', 0) + v
+                    elif name not in acc:
+                        acc[name] = v
+                    else:
+                        acc[name] = (name == 'max' and max or min)(acc[name], v)
+        items = [dict(acc, value=group) for group, acc in groups.iteritems()]
+        items.sort(key=lambda item: (-item.get('count', 0), item['value']))
+        return dict(key=group_key, items=items[:int(args.get('max_group') or 1000)])
+
+    @staticmethod
+    def _bucket(bounds, value):
+        if value is None:
+            return None
+        if value < bounds[0]:
+            return '~%g' % bounds[0]
+        for lower, upper in zip(bounds, bounds[1:]):
+            if value < upper:
+                return '%g~%g' % (lower, upper)
+        return '%g~' % bounds[-1]
+
+
+class Emulator(object):
+    """Serves api requests from in-memory indexes, one Index per app.
+    """
+
+    def __init__(self, auto_create=True, primary_key='id', index_fields=None):
+        """
+        :param auto_create: create an app on its first push instead of answering APP_NOT_FOUND.
+        :param primary_key: primary key field of new apps.
+        :param index_fields: fields tokenized in new apps, None indexes every field.
+        """
+        self.auto_create = auto_create
+        self.primary_key = primary_key
+        self.index_fields = index_fields
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    def create_app(self, name, **kwargs):
+        with self._lock:
+            if name in self.indexes:
+                raise EmulatorError(APP_EXISTS, "app %s exists" % name)
+            kwargs.setdefault('primary_key', self.primary_key)
+            kwargs.setdefault('index_fields', self.index_fields)
+            index = self.indexes[name] = Index(name, **kwargs)
+            return index
+
+    def get_app(self, name, create=False):
+        index = self.indexes.get(name)
+        if index is None:
+            if not (create and self.auto_create):
+                raise EmulatorError(APP_NOT_FOUND, "app %s not found" % name)
+            try:
+                index = self.create_app(name)
+            except EmulatorError:
+                index = self.indexes[name]
+        return index
+
+    def handle(self, path, method, params):
+        """Answer one api request.
+
+        :return: response -> dict in the api response format
+        """
+        try:
+            result = self._dispatch(path.rstrip('/'), params)
+        except EmulatorError, e:
+            return dict(status='FAIL', errors=dict(code=e.code, message=str(e)))
+        except ValueError, e:
+            return dict(status='FAIL', errors=dict(code=SYNTAX_ERROR, message=str(e)))
+        return dict(status='OK', result=result)
+
+    def _dispatch(self, path, params):
+        action = params.get('action')
+        if path == '/search':
+            started = time.time()
+            names = [n for n in _text(params.get('index_name', '')).split(';') if n]
+            if len(names) != 1:
+                raise EmulatorError(NOT_SUPPORTED, "search one app at a time")
+            index = self.get_app(names[0])
+            with index.lock:
+                result = _Search(index, params.get('query', '')).run(params.get('fetch_fields'))
+            result['searchtime'] = time.time() - started
+            return result
+        if path == '/suggest':
+            return self._suggest(self.get_app(params.get('index_name', '')), params)
+        if path.startswith('/index/doc/'):
+            if action != 'push':
+                raise EmulatorError(NOT_SUPPORTED, "unsupported action: %s" % action)
+            try:
+                items = json.loads(params.get('items') or '[]')
+            except ValueError, e:
+                raise EmulatorError(INVALID_ITEMS, "items is not json: %s" % e)
+            self.get_app(path[len('/index/doc/'):], create=True).push(items)
+            return ''
+        if path.startswith('/index/error/'):
+            self.get_app(path[len('/index/error/'):])
+            return dict(count=0, items=[])
+        if path == '/index':
+            names = sorted(self.indexes)
+            page, size = int(params.get('page') or 1), int(params.get('page_size') or 10)
+            return [dict(id=name, name=name, description='') for name in names[(page - 1) * size:page * size]]
+        if path.startswith('/index/'):
+            name = path[len('/index/'):]
+            if action == 'create':
+                self.create_app(name)
+                return dict(id=name, name=name)
+            index = self.get_app(name)
+            if action == 'delete':
+                with self._lock:
+                    self.indexes.pop(name, None)
+                return ''
+            if action == 'status':
+                return dict(id=name, name=name, doc_count=len(index))
+            return ''
+        raise EmulatorError(NOT_SUPPORTED, "unsupported api: %s" % path)
+
+    @staticmethod
+    def _suggest(index, params):
+        # prefix matches over the indexed terms, the most frequent first
+        prefix = tokenize(params.get('query', ''))
+        if not prefix:
+            return dict(suggestions=[])
+        prefix = prefix[-1]
+        with index.lock:
+            terms, freqs = index.vocabulary()
+            matched = []
+            for i in xrange(bisect_left(terms, prefix), len(terms)):
+                if not terms[i].startswith(prefix):
+                    break
+                matched.append(terms[i])
+        matched.sort(key=lambda term: -freqs[term])
+        hint = int(params.get('hint') or 10)
+        return dict(suggestions=[dict(suggestion=term) for term in matched[:hint]])
+
+
+class EmulatorHttpClient(HttpClient):
+    """HttpClient answering from an Emulator instead of the network.
+    """
+
+    def __init__(self, emulator=None):
+        if emulator is not None and not isinstance(emulator, Emulator):
+            raise ArgumentError("emulator must be 'opensearch.emulator.Emulator' type")
+        self.emulator = emulator or Emulator()
+
+    def request(self, url, method, params, timeout=None, trace=None):
+        if method not in ('GET', 'POST'):
+            raise ArgumentError("method must be 'POST' or 'GET'")
+        if isinstance(params, EncodedForm):
+            params = params.decode()
+        body = json.dumps(self.emulator.handle(urlparse(url).path, method, params))
+        if trace is not None:
+            trace.status = 200
+            trace.bytes_received += len(body)
+        return body
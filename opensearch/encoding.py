@@ -0,0 +1,134 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Content codings of responses and form encodings of request bodies.
+"""
+import cgi
+import os
+import urllib
+import zlib
+
+from binascii import b2a_hex
+from cStringIO import StringIO
+from urlparse import parse_qsl
+from opensearch.exception import ArgumentError, HTTPError
+
+ACCEPT_ENCODING = 'gzip, deflate'
+FORM_ENCODINGS = ('urlencoded', 'multipart')
+
+
+class Decoder(object):
+    """Incremental decoder of a response Content-Encoding.
+
+    Feed the body as it is received and join the outputs, so a compressed
+    body is never held next to its whole decompressed copy.
+    """
+
+    def __init__(self, content_encoding=None):
+        content_encoding = (content_encoding or 'identity').strip().lower()
+        if content_encoding in ('gzip', 'x-gzip'):
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif content_encoding == 'deflate':
+            self._zlib = zlib.decompressobj()
+        elif content_encoding == 'identity':
+            self._zlib = None
+        else:
+            raise HTTPError("unsupported content encoding: %s" % content_encoding)
+        self._raw_deflate = content_encoding == 'deflate'
+        self._started = False
+
+    def decompress(self, data):
+        if self._zlib is None or not data:
+            return data
+        try:
+            return self._decompress(data)
+        except zlib.error, e:
+            raise HTTPError("decompress response failed: %s" % e)
+
+    def _decompress(self, data):
+        if not self._started and self._raw_deflate:
+            # some servers send raw deflate without the zlib header the spec asks for
+            self._started = True
+            try:
+                return self._zlib.decompress(data)
+            except zlib.error:
+                self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._started = True
+        return self._zlib.decompress(data)
+
+    def flush(self):
+        if self._zlib is None:
+            return ''
+        return self._zlib.flush()
+
+
+def decode_body(body, content_encoding=None):
+    decoder = Decoder(content_encoding)
+    return decoder.decompress(body) + decoder.flush()
+
+
+class EncodedForm(object):
+    """POST params that are already encoded, passed to HttpClient.request() in place of a dict.
+    """
+
+    __slots__ = ('body', 'content_type')
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+
+    def decode(self):
+        """Parse the body back into a params dict.
+        """
+        if self.content_type.startswith('multipart/form-data'):
+            boundary = self.content_type.partition('boundary=')[2]
+            fields = cgi.parse_multipart(StringIO(self.body), {'boundary': boundary})
+            return dict((key, values[0]) for key, values in fields.iteritems())
+        return dict(parse_qsl(self.body, keep_blank_values=True))
+
+    def __str__(self):
+        return "<%s body of %d bytes>" % (self.content_type.split(';', 1)[0], len(self.body))
+
+
+def _to_str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+    return str(value)
+
+
+def encode_form(params, form_encoding='urlencoded'):
+    """Encode POST params.
+
+    'multipart' sends utf8 values as they are, while 'urlencoded' percent-encodes
+    every non ascii byte into three bytes.
+
+    :return: (body, content_type) -> (str, str)
+    """
+    if isinstance(params, EncodedForm):
+        return params.body, params.content_type
+    if form_encoding == 'urlencoded':
+        return urllib.urlencode(params), 'application/x-www-form-urlencoded'
+    if form_encoding != 'multipart':
+        raise ArgumentError("form_encoding must be one of %s" % (FORM_ENCODINGS,))
+
+    boundary = b2a_hex(os.urandom(16))
+    parts = []
+    for key, value in params.iteritems():
+        parts.append('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (
+            boundary, _to_str(key), _to_str(value)))
+    parts.append('--%s--\r\n' % boundary)
+    return ''.join(parts), 'multipart/form-data; boundary=%s' % boundary
@@ -78,6 +78,63 @@ class SearchResult(Entity):
         self.num = None
         self.viewtotal = None
         self.facet = None
+        self.items = SearchItems(())
+
+    def from_dict(self, dicts, append=False):
+        super(SearchResult, self).from_dict(dicts, append)
+        self.items = SearchItems(dicts.get('items') or ())
+        return self
+
+
+class SearchItem(object):
+    """One hit of a search result.
+
+    fields holds the fetched fields, item['title'] is a shortcut for item.fields['title'].
+    """
+
+    __slots__ = ('index_name', 'fields', 'variable_value', 'sort_expr_values')
+
+    def __init__(self, raw):
+        fields = dict(raw)
+        self.index_name = fields.pop('index_name', None)
+        self.variable_value = fields.pop('variableValue', None)
+        self.sort_expr_values = fields.pop('sortExprValues', None)
+        self.fields = fields
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    def __str__(self):
+        return "index_name=%s,fields=%s" % (self.index_name, self.fields)
+
+
+class SearchItems(object):
+    """Sequence of SearchItem, each hit is converted only when it is accessed.
+    """
+
+    __slots__ = ('_raw', '_items')
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._items = [None] * len(raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self._raw)))]
+        item = self._items[index]
+        if item is None:
+            item = self._items[index] = SearchItem(self._raw[index])
+        return item
+
+    def __iter__(self):
+        for i in xrange(len(self._raw)):
+            yield self[i]
 
 
 class DocumentField(Entity):
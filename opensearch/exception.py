@@ -24,6 +24,30 @@ class OpenSearchError(Exception):
 
 class HTTPError(OpenSearchError):
     """HTTP request exception
+
+    status is the http response status, None if no response was received.
+    sent is False only when the request certainly did not reach the server,
+    e.g. the connection could not be made.
+    """
+
+    def __init__(self, message, status=None, sent=True):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+        self.sent = sent
+
+
+class TimeoutError(HTTPError):
+    """HTTP request did not complete in time
+    """
+
+
+class CircuitOpenError(HTTPError):
+    """Request rejected because the circuit breaker of the host is open
+    """
+
+
+class CancelledError(OpenSearchError):
+    """Asynchronous request was cancelled
     """
 
 
@@ -42,4 +66,5 @@ class ApiError(OpenSearchError):
     """
 
     def __init__(self, code, message):
-        super(ApiError, self).__init__("api response code: %s message: %s" % (code, message))
\ No newline at end of file
+        super(ApiError, self).__init__("api response code: %s message: %s" % (code, message))
+        self.code = code
\ No newline at end of file
@@ -0,0 +1,126 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import json
+import sqlite3
+import struct
+import threading
+
+from opensearch.exception import ArgumentError
+
+_INT64 = struct.Struct('>q')
+
+
+def fingerprint(fields):
+    """Stable 64 bit hash of document fields.
+
+    Equal dicts hash equally whatever their key order, str and unicode values
+    with the same text hash equally.
+    """
+    encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    if isinstance(encoded, unicode):
+        encoded = encoded.encode('utf8')
+    return _INT64.unpack(hashlib.md5(encoded).digest()[:8])[0]
+
+
+class FingerprintStore(object):
+    """Fingerprints of the documents last pushed to one table, keyed by id.
+
+    Kept in an SQLite file with one (id, hash) row per document, so tens of
+    millions of ids cost disk pages rather than memory.
+
+        store = FingerprintStore('main.fingerprints')
+        document = Document(client, 'app', 'main', fingerprints=store)
+        document.add(row)    # dropped when row was pushed before unchanged
+    """
+
+    def __init__(self, path, cache_kb=16 * 1024):
+        """
+        :param path: the SQLite file, ':memory:' keeps the store in memory.
+        :param cache_kb: SQLite page cache size in KiB.
+        """
+        if not path:
+            raise ArgumentError("path is required")
+        self.path = path
+        self.checked = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA cache_size=%d' % -int(cache_kb))
+        try:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS fingerprints '
+                               '(id TEXT PRIMARY KEY, hash INTEGER NOT NULL) WITHOUT ROWID')
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID needs SQLite 3.8.2
+            self._conn.execute('CREATE TABLE IF NOT EXISTS fingerprints '
+                               '(id TEXT PRIMARY KEY, hash INTEGER NOT NULL)')
+
+    def get(self, doc_id):
+        with self._lock:
+            row = self._conn.execute('SELECT hash FROM fingerprints WHERE id = ?',
+                                     (_key(doc_id),)).fetchone()
+        return row and row[0]
+
+    def is_unchanged(self, doc_id, hash_):
+        """Count a check and tell whether hash_ is the stored fingerprint of doc_id.
+        """
+        unchanged = self.get(doc_id) == hash_
+        with self._lock:
+            self.checked += 1
+            if unchanged:
+                self.skipped += 1
+        return unchanged
+
+    def update(self, hashes):
+        """Record pushed documents in one transaction.
+
+        :param hashes: dict of id -> hash, None removes the id (a pushed delete).
+        """
+        if not hashes:
+            return
+        stored = [(_key(doc_id), h) for doc_id, h in hashes.iteritems() if h is not None]
+        removed = [(_key(doc_id),) for doc_id, h in hashes.iteritems() if h is None]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany('INSERT OR REPLACE INTO fingerprints (id, hash) VALUES (?, ?)', stored)
+                self._conn.executemany('DELETE FROM fingerprints WHERE id = ?', removed)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM fingerprints')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+
+def _key(doc_id):
+    if isinstance(doc_id, str):
+        return doc_id.decode('utf8')
+    return unicode(doc_id)
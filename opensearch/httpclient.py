@@ -16,84 +16,501 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import httplib
+import select
+import socket
+import ssl
+import threading
+import time
 import urllib
-import requests
 
+from collections import deque
 from urlparse import urlparse
-from opensearch import log
-from opensearch.exception import HTTPError, ArgumentError
+from opensearch import log, reqlog
+from opensearch.encoding import ACCEPT_ENCODING, FORM_ENCODINGS, Decoder, EncodedForm, encode_form
+from opensearch.exception import HTTPError, ArgumentError, TimeoutError
+from opensearch.metrics import RequestEvent, notify
 
 
 class HttpClient(object):
 
-    def request(self, url, method, params):
+    _default = None
+    _default_lock = threading.Lock()
+
+    def request(self, url, method, params, timeout=None, trace=None):
+        """Send the request and return the response body.
+
+        :param timeout: seconds the whole request may take, None means no limit.
+        :param trace: an opensearch.metrics.RequestEvent to record http phases in.
+        """
         raise NotImplementedError
 
     @classmethod
     def get_httpclient(cls):
-        return DefaultHttpClient()
+        """Get the process wide shared http client.
+
+        The client is created once and keeps its keep-alive connections in a pool,
+        so every caller shares the same connections.
+        """
+        if HttpClient._default is None:
+            with HttpClient._default_lock:
+                if HttpClient._default is None:
+                    HttpClient._default = DefaultHttpClient()
+        return HttpClient._default
+
+    @classmethod
+    def set_httpclient(cls, httpclient):
+        """Replace the shared http client returned by get_httpclient()
+
+        :param httpclient: a HttpClient instance, e.g. DefaultHttpClient(max_size=50)
+        """
+        if not isinstance(httpclient, HttpClient):
+            raise ArgumentError("httpclient must be 'opensearch.httpclient.HttpClient' type")
+        with HttpClient._default_lock:
+            old, HttpClient._default = HttpClient._default, httpclient
+        if old is not None and old is not httpclient:
+            old.close()
+
+    def warmup(self, url, connections=1, timeout=None):
+        """Resolve the host of url and open connections to it ahead of the first requests.
+
+        :return: number of connections opened, 0 when the client can not keep them.
+        """
+        return 0
+
+    def close(self):
+        pass
+
+
+class DnsCache(object):
+    """Cache of resolved host addresses, each kept ttl seconds.
+
+    create_connection() is a socket.create_connection() resolving through the
+    cache. When no cached address accepts the connection the entry is dropped,
+    so a moved host is resolved again on the next attempt.
+    """
+
+    def __init__(self, ttl=60):
+        if ttl <= 0:
+            raise ArgumentError("ttl must be greater than 0")
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """socket.getaddrinfo() results of a tcp host and port.
+        """
+        key = (host, port)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (addresses, now + self.ttl)
+        return addresses
+
+    def invalidate(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        host, port = address
+        error = None
+        for family, socktype, proto, _, sockaddr in self.resolve(host, port):
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error, e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        self.invalidate(host, port)
+        raise error or socket.error("getaddrinfo returns an empty list")
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of persistent connections to one host.
+
+    At most max_size idle connections are kept, extra connections are closed
+    when they are released. Idle connections older than idle_timeout seconds, or
+    whose socket was closed by the server, are dropped instead of being reused.
+
+    https connections share one ssl context, so the trusted certificates are
+    loaded once. Python 2's ssl module can not resume TLS sessions, keeping
+    connections alive and warm() are what saves full handshakes.
+    """
+
+    def __init__(self, scheme, host, port=None, max_size=10, idle_timeout=60, timeout=None, resolver=None):
+        if scheme not in ('http', 'https'):
+            raise ArgumentError("scheme must be 'http' or 'https'")
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.resolver = resolver
+        self.connects = 0
+        self.reused = 0
+        self.warmed = 0
+        self.warm_hits = 0
+        self._context = None
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _new_conn(self):
+        kwargs = dict(port=self.port)
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        if self.scheme == 'http':
+            conn = httplib.HTTPConnection(self.host, **kwargs)
+        else:
+            if self._context is None:
+                self._context = ssl.create_default_context()
+            conn = httplib.HTTPSConnection(self.host, context=self._context, **kwargs)
+        if self.resolver is not None:
+            conn._create_connection = self.resolver.create_connection
+        with self._lock:
+            self.connects += 1
+        return conn
+
+    def get(self):
+        """Get a connection, reusing an idle one when possible.
+
+        :return: (conn, reused) -> (httplib.HTTPConnection, bool)
+        """
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if now - released_at < self.idle_timeout and not self._is_stale(conn):
+                with self._lock:
+                    self.reused += 1
+                    if getattr(conn, 'warm', False):
+                        conn.warm = False
+                        self.warm_hits += 1
+                return conn, True
+            conn.close()
+        return self._new_conn(), False
+
+    def warm(self, connections, timeout=None):
+        """Open connections in parallel and keep them idle, up to max_size idle connections.
+
+        :param timeout: seconds to wait for the connections, None means no limit.
+        :return: number of connections opened.
+        """
+        with self._lock:
+            missing = min(connections, self.max_size - len(self._idle))
+        opened = []
+
+        def connect():
+            conn = self._new_conn()
+            try:
+                conn.connect()
+            except (httplib.HTTPException, socket.error), e:
+                conn.close()
+                log.warning("warm up connection to %s failed: %s", self.host, e)
+                return
+            conn.warm = True
+            self.put(conn)
+            with self._lock:
+                self.warmed += 1
+            opened.append(conn)
+
+        threads = [threading.Thread(target=connect, name='opensearch-warmup-%d' % i) for i in xrange(missing)]
+        deadline = timeout is not None and time.time() + timeout or None
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            if deadline is None:
+                thread.join()
+            else:
+                thread.join(max(0, deadline - time.time()))
+        return len(opened)
+
+    def stats(self):
+        """Connections opened, requests on reused connections (handshakes avoided),
+        connections opened by warm() and the ones used by a request.
+        """
+        with self._lock:
+            return dict(idle=len(self._idle), connects=self.connects, reused=self.reused,
+                        warmed=self.warmed, warm_hits=self.warm_hits)
+
+    def put(self, conn):
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_size:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            conn.close()
+
+    def __len__(self):
+        return len(self._idle)
+
+    @staticmethod
+    def _is_stale(conn):
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            # an idle keep-alive socket must have nothing to read, otherwise the
+            # server has closed it (EOF) or sent garbage we can not use.
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
 
 
 class DefaultHttpClient(HttpClient):
 
-    def request(self, url, method, params):
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, max_size=10, idle_timeout=60, timeout=None, observers=None,
+                 compress=True, form_encoding='urlencoded', dns_ttl=60):
+        """
+        :param max_size: max idle connections kept for each host.
+        :param idle_timeout: seconds an idle connection is kept before it is discarded.
+        :param timeout: socket timeout in seconds, None means the global default.
+        :param observers: list of opensearch.metrics.Observer notified after every http request.
+        :param compress: ask for gzip or deflate compressed responses.
+        :param form_encoding: 'urlencoded' or 'multipart' POST bodies, multipart sends
+                              non ascii values such as pushed documents without escaping.
+        :param dns_ttl: seconds resolved host addresses are cached, None resolves on every connect.
+        """
+        if form_encoding not in FORM_ENCODINGS:
+            raise ArgumentError("form_encoding must be one of %s" % (FORM_ENCODINGS,))
+        self.observers = list(observers or ())
+        self.compress = compress
+        self.form_encoding = form_encoding
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.resolver = dns_ttl and DnsCache(dns_ttl) or None
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(scheme, host, port, max_size=self.max_size,
+                                          idle_timeout=self.idle_timeout, timeout=self.timeout,
+                                          resolver=self.resolver)
+                    self._pools[key] = pool
+        return pool
+
+    def add_observer(self, observer):
+        """Notify observer with a RequestEvent after every http request.
+        """
+        self.observers.append(observer)
+
+    def warmup(self, url, connections=1, timeout=None):
+        parse_result = urlparse(url)
+        pool = self.get_pool(parse_result.scheme, parse_result.hostname, parse_result.port)
+        if self.resolver is not None:
+            default_port = parse_result.scheme == 'https' and httplib.HTTPS_PORT or httplib.HTTP_PORT
+            try:
+                self.resolver.resolve(parse_result.hostname, parse_result.port or default_port)
+            except socket.error, e:
+                log.warning("warm up of %s failed: %s", parse_result.hostname, e)
+                return 0
+        return pool.warm(connections, timeout)
+
+    def stats(self):
+        """Connection counters summed over the hosts, and the dns cache hits and misses.
+        """
+        with self._lock:
+            pools = self._pools.values()
+        stats = dict(idle=0, connects=0, reused=0, warmed=0, warm_hits=0)
+        for pool in pools:
+            for key, value in pool.stats().iteritems():
+                stats[key] += value
+        if self.resolver is not None:
+            stats.update(dns_hits=self.resolver.hits, dns_misses=self.resolver.misses)
+        return stats
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.close()
+
+    def request(self, url, method, params, timeout=None, trace=None):
         if method not in ('GET', 'POST'):
             raise ArgumentError("method must be 'POST' or 'GET'")
+        if not self.observers:
+            return self._request(url, method, params, timeout, trace)
 
+        event = trace or RequestEvent(urlparse(url).path, method)
+        try:
+            http_body = self._request(url, method, params, timeout, event)
+        except Exception, e:
+            if trace is None:
+                event.finish(e)
+            notify(self.observers, event)
+            raise
+        if trace is None:
+            event.finish()
+        notify(self.observers, event)
+        return http_body
+
+    def _request(self, url, method, params, timeout, event):
+        deadline = timeout is not None and time.time() + timeout or None
         parse_result = urlparse(url)
-        host = parse_result.hostname
-        port = parse_result.port
-        path = parse_result.path
+        pool = self.get_pool(parse_result.scheme, parse_result.hostname, parse_result.port)
 
-        if parse_result.scheme == 'http':
-            conn = httplib.HTTPConnection(host, port=port)
+        req_url = parse_result.path
+        body = None
+        headers = {}
+        if self.compress:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if method == 'GET':
+            req_url = req_url + '?' + urllib.urlencode(params)
         else:
-            conn = httplib.HTTPSConnection(host, port=port)
+            body, headers['Content-type'] = encode_form(params, self.form_encoding)
 
-        try:
-            req_url = path
-            body = None
-            headers = {}
-            if method == 'GET':
-                req_url = req_url + '?' + urllib.urlencode(params)
-            else:
-                body = urllib.urlencode(params)
-                headers = {"Content-type": "application/x-www-form-urlencoded"}
-
-            log.debug("[httplib] request url: %s, method: %s params: %s" % (url, method, params))
-            conn.request(method, req_url, body, headers)
-            response = conn.getresponse()
-            http_status = response.status
-            http_body = response.read()
-            log.debug("[httplib] response status: %s body: %s" % (http_status, http_body))
-        except httplib.HTTPException, e:
-            raise HTTPError("httplib request exception: %s" % e.message)
-        finally:
+        sent = time.time()
+        retried = False
+        while True:
+            conn, reused = pool.get()
+            written = False
+            try:
+                if deadline is not None:
+                    self._set_timeout(conn, deadline)
+                if event is not None:
+                    started = time.time()
+                    if conn.sock is None:
+                        conn.connect()
+                        connected = time.time()
+                        event.add('connect', connected - started)
+                        started = connected
+                conn.request(method, req_url, body, headers)
+                written = True
+                if deadline is not None:
+                    self._set_timeout(conn, deadline)
+                response = conn.getresponse()
+                if event is not None:
+                    received = time.time()
+                    event.add('ttfb', received - started)
+                http_status = response.status
+                http_body, received_bytes = self._read_body(response, conn, deadline)
+                if event is not None:
+                    event.add('read', time.time() - received)
+            except socket.timeout:
+                conn.close()
+                raise TimeoutError("httplib request timeout after %s seconds" % timeout)
+            except (httplib.HTTPException, socket.error), e:
+                conn.close()
+                if reused and not retried and (method == 'GET' or not written):
+                    # the server may close a keep-alive connection at any time, retry once
+                    # unless a non GET request was written, the server may have applied it.
+                    retried = True
+                    continue
+                raise HTTPError("httplib request exception: %s" % (e.message or e), sent=written)
+            break
+
+        if response.will_close:
             conn.close()
+        else:
+            if deadline is not None:
+                conn.timeout = pool.timeout
+                conn.sock.settimeout(pool.timeout is None and socket.getdefaulttimeout() or pool.timeout)
+            pool.put(conn)
+        reqlog.log_exchange('httplib', url, method, params, http_status, http_body, time.time() - sent)
+        if event is not None:
+            event.status = http_status
+            event.bytes_sent += len(req_url) + len(body or '')
+            event.bytes_received += received_bytes
 
         if http_status == httplib.OK:
             return http_body
         else:
-            raise HTTPError("server http response error code: %s body: %s" % (http_status, http_body))
+            raise HTTPError("server http response error code: %s body: %s" % (http_status, http_body),
+                            status=http_status)
+
+    def _read_body(self, response, conn=None, deadline=None):
+        # decompress while reading, return the body and the number of bytes received
+        decoder = Decoder(response.getheader('content-encoding'))
+        chunks = []
+        received = 0
+        while True:
+            if deadline is not None:
+                self._set_timeout(conn, deadline)
+            data = response.read(self.READ_SIZE)
+            if not data:
+                break
+            received += len(data)
+            chunks.append(decoder.decompress(data))
+        chunks.append(decoder.flush())
+        return ''.join(chunks), received
+
+    @staticmethod
+    def _set_timeout(conn, deadline):
+        # bound the next connect, send or read by the time left to the deadline
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise socket.timeout("deadline exceeded")
+        conn.timeout = remaining
+        if conn.sock is not None:
+            conn.sock.settimeout(remaining)
 
 
 class RequestsHttpClient(HttpClient):
 
-    def request(self, url, method, params):
+    def __init__(self):
+        # imported here so that the package does not need requests unless this client is used
+        import requests
+        self._requests = requests
+
+    def request(self, url, method, params, timeout=None, trace=None):
         if method not in ('GET', 'POST'):
             raise ArgumentError("method must be 'POST' or 'GET'")
 
+        requests = self._requests
         try:
-            log.debug("[requests] request url:%s method: %s params:%s" % (url, method, params))
             if method == 'GET':
-                r = requests.get(url, params=params)
+                r = requests.get(url, params=params, timeout=timeout)
+            elif isinstance(params, EncodedForm):
+                r = requests.post(url, data=params.body, headers={'Content-Type': params.content_type},
+                                  timeout=timeout)
             else:
-                r = requests.post(url, data=params)
-            log.debug("[requests] response data:" + r.text)
-        except requests.HTTPError, e:
-            raise HTTPError("requests get exception: %s" % e.message)
+                r = requests.post(url, data=params, timeout=timeout)
+        except requests.Timeout, e:
+            raise TimeoutError("requests timeout: %s" % e)
+        except requests.RequestException, e:
+            raise HTTPError("requests get exception: %s" % e)
 
+        if trace is not None:
+            trace.add('ttfb', r.elapsed.total_seconds())
+            trace.status = r.status_code
+            trace.bytes_received += len(r.content)
+        reqlog.log_exchange('requests', url, method, params, r.status_code, r.text,
+                            r.elapsed.total_seconds())
         if r.status_code == 200:
             return r.text
         else:
-            raise HTTPError("server http response code: %s" % r.status_code)
+            raise HTTPError("server http response code: %s" % r.status_code, status=r.status_code)
@@ -0,0 +1,45 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from opensearch.exception import ArgumentError
+
+_BACKENDS = ('ujson', 'simplejson', 'json')
+
+loads = None
+backend = None
+
+
+def set_json_backend(name=None):
+    """Choose the module used to decode api responses.
+
+    :param name: 'ujson', 'simplejson' or 'json'. None picks the first one installed,
+                 the stdlib json module is always available.
+    """
+    global loads, backend
+    names = name and (name,) or _BACKENDS
+    for module_name in names:
+        try:
+            module = __import__(module_name)
+        except ImportError:
+            continue
+        loads = module.loads
+        backend = module_name
+        return
+    raise ArgumentError("json backend '%s' is not installed" % name)
+
+
+set_json_backend()
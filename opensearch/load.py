@@ -0,0 +1,241 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Stream JSONL or CSV files into a Document table:
+
+    python -m opensearch.load --api-host http://opensearch-cn-hangzhou.aliyuncs.com \\
+        --access-key-id ID --access-key-secret SECRET --app app --table main \\
+        --field product_id=id --field name=title --checkpoint load.ckpt data.jsonl
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from itertools import islice
+from opensearch import log
+from opensearch.api import Document, OpenSearchClient
+from opensearch.bulk import BulkIndexer
+from opensearch.exception import ArgumentError
+
+
+def read_jsonl(fileobj):
+    """Yield one dict per non-blank line.
+    """
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(fileobj, delimiter=','):
+    """Yield one dict per row, keyed by the header row.
+    """
+    for row in csv.DictReader(fileobj, delimiter=delimiter):
+        yield row
+
+
+def map_fields(records, mapping=None):
+    """Rename record columns to table fields.
+
+    :param records: iterable of dict.
+    :param mapping: dict of column -> field, columns not in mapping are dropped. None keeps all.
+    """
+    if not mapping:
+        for record in records:
+            yield record
+        return
+    for record in records:
+        yield dict((field, record[column]) for column, field in mapping.iteritems()
+                   if column in record)
+
+
+class LoadStats(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.failed_chunks = 0
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def throughput(self):
+        return self.succeeded / max(self.elapsed, 1e-6)
+
+    @property
+    def error_rate(self):
+        done = self.succeeded + self.failed
+        return done and float(self.failed) / done or 0.0
+
+    def __str__(self):
+        return "submitted: %d succeeded: %d failed: %d (%.2f%%) throughput: %.1f docs/s" % (
+            self.submitted, self.succeeded, self.failed, self.error_rate * 100, self.throughput)
+
+
+class Loader(object):
+    """Push a stream of records into a Document table with a pool of worker threads.
+
+    With a checkpoint file, the number of leading records that were pushed
+    successfully is saved while loading, and a later load() of the same input
+    skips them. A failed chunk stops the checkpoint from advancing, so records
+    after it may be pushed again when the load is resumed.
+    """
+
+    def __init__(self, document, workers=4, max_items=1000, max_bytes=2 * 1024 * 1024,
+                 checkpoint=None, progress_interval=10):
+        """
+        :param document: the opensearch.api.Document table to push to.
+        :param workers: number of threads signing and pushing chunks.
+        :param max_items: max records in one push.
+        :param max_bytes: max json bytes in one push.
+        :param checkpoint: path of the checkpoint file, None disables resuming.
+        :param progress_interval: seconds between progress logs and checkpoint saves.
+        """
+        if not isinstance(document, Document):
+            raise ArgumentError("document must be 'opensearch.api.Document' type")
+        self.document = document
+        self.workers = workers
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.checkpoint = checkpoint
+        self.progress_interval = progress_interval
+
+        self._lock = threading.Lock()
+        self._acked = {}
+        self._offset = 0
+
+    def load(self, records, cmd='add'):
+        """Push all records, return LoadStats once every chunk is completed.
+
+        :param records: iterable of field dicts, e.g. map_fields(read_jsonl(f), mapping)
+        :param cmd: 'add', 'update' or 'delete'
+        """
+        if cmd not in ('add', 'update', 'delete'):
+            raise ArgumentError("cmd must be 'add', 'update' or 'delete'")
+        start = self.read_checkpoint()
+        if start:
+            log.info("resume from checkpoint offset %d", start)
+        self._offset = start
+        self._acked = {}
+        stats = LoadStats()
+
+        indexer = BulkIndexer(self.document, max_items=self.max_items, max_bytes=self.max_bytes,
+                              max_in_flight=self.workers * 2, workers=self.workers,
+                              callback=lambda result: self._on_chunk(stats, start, result))
+        op = getattr(indexer, cmd)
+        next_report = time.time() + self.progress_interval
+        try:
+            for fields in islice(records, start, None):
+                op(fields)
+                stats.submitted += 1
+                if time.time() >= next_report:
+                    self._report(stats)
+                    next_report = time.time() + self.progress_interval
+        finally:
+            indexer.close()
+        self._report(stats)
+        return stats
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            return int(f.read().strip() or 0)
+
+    def _on_chunk(self, stats, start, result):
+        with self._lock:
+            if result.success:
+                stats.succeeded += result.num_items
+                self._acked[start + result.offset] = result.num_items
+                while self._offset in self._acked:
+                    self._offset += self._acked.pop(self._offset)
+            else:
+                stats.failed += result.num_items
+                stats.failed_chunks += 1
+
+    def _report(self, stats):
+        log.info("[load] table %s %s", self.document.table_name, stats)
+        if self.checkpoint:
+            with self._lock:
+                offset = self._offset
+            tmp = self.checkpoint + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(str(offset))
+            os.rename(tmp, self.checkpoint)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m opensearch.load',
+                                     description='Stream JSONL or CSV records into an opensearch table.')
+    parser.add_argument('path', help="input file, '-' for stdin")
+    parser.add_argument('--api-host', required=True)
+    parser.add_argument('--access-key-id', default=os.environ.get('OPENSEARCH_ACCESS_KEY_ID'))
+    parser.add_argument('--access-key-secret', default=os.environ.get('OPENSEARCH_ACCESS_KEY_SECRET'))
+    parser.add_argument('--app', required=True)
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None,
+                        help='input format, guessed from the file extension by default')
+    parser.add_argument('--delimiter', default=',', help='csv delimiter')
+    parser.add_argument('--field', action='append', default=[], metavar='COLUMN=FIELD',
+                        help='map an input column to a table field, repeatable')
+    parser.add_argument('--cmd', choices=('add', 'update', 'delete'), default='add')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-items', type=int, default=1000)
+    parser.add_argument('--max-bytes', type=int, default=2 * 1024 * 1024)
+    parser.add_argument('--checkpoint', help='checkpoint file used to resume an interrupted load')
+    parser.add_argument('--progress-interval', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    if not args.access_key_id or not args.access_key_secret:
+        parser.error('--access-key-id and --access-key-secret are required')
+    mapping = {}
+    for pair in args.field:
+        column, sep, field = pair.partition('=')
+        if not sep:
+            parser.error("--field must be COLUMN=FIELD: %s" % pair)
+        mapping[column] = field
+    fmt = args.format or (args.path.endswith('.csv') and 'csv' or 'jsonl')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    client = OpenSearchClient(args.api_host, args.access_key_id, args.access_key_secret)
+    loader = Loader(Document(client, args.app, args.table), workers=args.workers,
+                    max_items=args.max_items, max_bytes=args.max_bytes,
+                    checkpoint=args.checkpoint, progress_interval=args.progress_interval)
+    fileobj = args.path == '-' and sys.stdin or open(args.path, 'rb')
+    try:
+        if fmt == 'csv':
+            records = read_csv(fileobj, args.delimiter)
+        else:
+            records = read_jsonl(fileobj)
+        stats = loader.load(map_fields(records, mapping), cmd=args.cmd)
+    finally:
+        if fileobj is not sys.stdin:
+            fileobj.close()
+    return stats.failed and 1 or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
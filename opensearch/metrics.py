@@ -0,0 +1,209 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import bisect
+import threading
+import time
+
+from opensearch import log
+
+PHASES = ('build', 'sign', 'queue', 'connect', 'ttfb', 'read', 'parse', 'total')
+
+
+class RequestEvent(object):
+    """Timings and outcome of one request.
+
+    phases maps a phase name to seconds:
+        build: common params generation, sign: Signature computing,
+        queue: waiting for the rate limiter,
+        connect: tcp connect and tls handshake, ttfb: send until the response headers,
+        read: response body reading, parse: json decoding and ApiResponse checking,
+        total: the whole call.
+    Phases that did not happen (e.g. connect on a reused connection) are missing.
+    """
+
+    __slots__ = ('path', 'method', 'started', 'phases', 'status', 'error_code', 'error',
+                 'bytes_sent', 'bytes_received', 'cache_hit')
+
+    def __init__(self, path, method):
+        self.path = path
+        self.method = method
+        self.started = time.time()
+        self.phases = {}
+        self.status = None
+        self.error_code = None
+        self.error = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.cache_hit = False
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def finish(self, error=None):
+        self.phases['total'] = time.time() - self.started
+        if error is not None:
+            self.error = error.__class__.__name__
+            if self.status is None:
+                self.status = getattr(error, 'status', None)
+            if self.error_code is None:
+                self.error_code = getattr(error, 'code', None)
+
+    def __str__(self):
+        phases = ",".join("%s=%.6f" % (p, self.phases[p]) for p in PHASES if p in self.phases)
+        return "path=%s,method=%s,status=%s,error_code=%s,error=%s,sent=%s,received=%s,%s" % (
+            self.path, self.method, self.status, self.error_code, self.error,
+            self.bytes_sent, self.bytes_received, phases)
+
+
+class Observer(object):
+    """Receives a RequestEvent when a request completes.
+
+    on_request() runs on the requesting thread and must be fast and thread-safe.
+    """
+
+    def on_request(self, event):
+        raise NotImplementedError
+
+
+def notify(observers, event):
+    for observer in observers:
+        try:
+            observer.on_request(event)
+        except Exception:
+            log.exception("observer %s raised", observer)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, p):
+        """Estimate the p-th percentile by linear interpolation inside its bucket.
+        """
+        if self.count == 0:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = i and self.buckets[i - 1] or 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class HistogramObserver(Observer):
+    """In-process aggregation of request events.
+
+    Keeps a latency histogram per path and phase, request counts per path,
+    status and error code, and byte counters per path.
+
+        metrics = HistogramObserver()
+        client = OpenSearchClient(api_host, access_key_id, access_key_secret, observers=[metrics])
+        metrics.percentile('/search', 'total', 99)
+        metrics.to_prometheus()
+    """
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}
+        self._requests = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def on_request(self, event):
+        with self._lock:
+            for phase, seconds in event.phases.iteritems():
+                key = (event.path, phase)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.buckets)
+                histogram.observe(seconds)
+            key = (event.path, event.status, event.error_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for direction, n in (('sent', event.bytes_sent), ('received', event.bytes_received)):
+                key = (event.path, direction)
+                self._bytes[key] = self._bytes.get(key, 0) + n
+
+    def percentile(self, path, phase, p):
+        """Latency percentile in seconds, None if nothing was recorded.
+        """
+        with self._lock:
+            histogram = self._histograms.get((path, phase))
+            return histogram and histogram.percentile(p)
+
+    def percentiles(self, ps=(50, 90, 99)):
+        """Latency percentiles of every path and phase.
+
+        :return: dict -> {(path, phase): {p: seconds}}
+        """
+        with self._lock:
+            return dict((key, dict((p, histogram.percentile(p)) for p in ps))
+                        for key, histogram in self._histograms.iteritems())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+            self._bytes.clear()
+
+    def to_prometheus(self, prefix='opensearch'):
+        """Export in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            name = prefix + '_request_phase_seconds'
+            lines.append('# TYPE %s histogram' % name)
+            for (path, phase), histogram in sorted(self._histograms.iteritems()):
+                labels = 'path="%s",phase="%s"' % (_escape(path), phase)
+                cumulative = 0
+                for bound, n in zip(self.buckets, histogram.counts):
+                    cumulative += n
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, histogram.count))
+                lines.append('%s_sum{%s} %.6f' % (name, labels, histogram.sum))
+                lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+
+            name = prefix + '_requests_total'
+            lines.append('# TYPE %s counter' % name)
+            for (path, status, code), n in sorted(self._requests.iteritems()):
+                lines.append('%s{path="%s",status="%s",error_code="%s"} %d' % (
+                    name, _escape(path), status or '', code or '', n))
+
+            name = prefix + '_bytes_total'
+            lines.append('# TYPE %s counter' % name)
+            for (path, direction), n in sorted(self._bytes.iteritems()):
+                lines.append('%s{path="%s",direction="%s"} %d' % (name, _escape(path), direction, n))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
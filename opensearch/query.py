@@ -21,6 +21,92 @@ RELATION_OPERATOR = ('>', '<', '=', '<=', '>=', '!=')
 
 ARITHMETIC_OPERATOR = ('+', '-', '*', '/', '&', '^', '|')
 
+PARAM_KINDS = ('keyword', 'string', 'number', 'raw')
+
+
+class Param(object):
+    """Named placeholder of a query compiled by RawQuery.compile()
+
+    The kind decides how a bound value is escaped:
+        keyword: quoted with ' for query statements, the default in query_by()
+        string: quoted with " for filter statements
+        number: int or float, the default in filter_by() and config_by()
+        raw: inserted as is, it must not contain '&&'
+    """
+
+    def __init__(self, name, kind=None):
+        if kind is not None and kind not in PARAM_KINDS:
+            raise ArgumentError("param kind must be one of %s" % (PARAM_KINDS,))
+        self.name = name
+        self.kind = kind
+
+    def with_default(self, kind):
+        if self.kind is not None:
+            return self
+        return Param(self.name, kind)
+
+    def __str__(self):
+        return "\x00%s\x01%s\x00" % (self.name, self.kind or 'raw')
+
+
+def _escape(kind, value):
+    if kind == 'number':
+        if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+            raise QueryError("number param requires int or float value, got %r" % (value,))
+        return str(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf8')
+    elif not isinstance(value, str):
+        value = str(value)
+    if kind == 'keyword':
+        return "'%s'" % value.replace('\\', '\\\\').replace("'", "\\'")
+    if kind == 'string':
+        return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+    if '&&' in value:
+        raise QueryError("raw param value must not contain '&&'")
+    return value
+
+
+class QueryTemplate(object):
+    """Immutable query built once with Param placeholders.
+
+        query = SimpleQuery().query_by('title', Param('keyword'))
+        template = query.filter_by('price', '<', Param('max_price')).compile()
+        template.bind(keyword='北京大学', max_price=100)
+    """
+
+    __slots__ = ('_parts', '_slots', 'names')
+
+    def __init__(self, built):
+        parts = built.split('\x00')
+        if len(parts) % 2 == 0:
+            raise QueryError("broken param placeholder in query: %r" % built)
+        slots = []
+        for i in xrange(1, len(parts), 2):
+            name, kind = parts[i].split('\x01')
+            slots.append((i, name, kind))
+            parts[i] = None
+        self._parts = tuple(parts)
+        self._slots = tuple(slots)
+        self.names = frozenset(name for _, name, _ in slots)
+
+    def bind(self, **values):
+        """Build the final query string with escaped values.
+        """
+        parts = list(self._parts)
+        for i, name, kind in self._slots:
+            try:
+                value = values[name]
+            except KeyError:
+                raise QueryError("missing value of query param '%s'" % name)
+            parts[i] = _escape(kind, value)
+        return ''.join(parts)
+
+    def build(self):
+        if self._slots:
+            raise QueryError("query template has unbound params: %s" % ', '.join(sorted(self.names)))
+        return self._parts[0]
+
 
 class RawQuery(object):
 
@@ -32,6 +118,11 @@ class RawQuery(object):
             raise QueryError('query statement required.')
         return self._fmt_dict(self.stmts)
 
+    def compile(self):
+        """Build the query once into a QueryTemplate, Param placeholders are bound later.
+        """
+        return QueryTemplate(self.build())
+
     def _statement(self, stmt_type, stmt):
         self.stmts[stmt_type] = stmt
         return self
@@ -85,6 +176,8 @@ class SimpleQuery(RawQuery):
         return self.query_by('default', keyword)
 
     def query_by(self, field, keyword, boost=None):
+        if isinstance(keyword, Param):
+            keyword = keyword.with_default('keyword')
         if boost and isinstance(boost, int):
             stmt = "%s:%s^%d" % (field, keyword, boost)
         else:
@@ -92,11 +185,20 @@ class SimpleQuery(RawQuery):
         return self.query(stmt)
 
     def config_by(self, start=0, hint=10, format_='json', rerank_size=200):
+        if isinstance(start, Param):
+            start = start.with_default('number')
+        if isinstance(hint, Param):
+            hint = hint.with_default('number')
         stmt = "start:%s,hint:%s,format:%s,rerank_size:%s" % (start, hint, format_, rerank_size)
         return self.config(stmt)
 
     def filter_by(self, field, operator, value):
-        if isinstance(value, basestring):
+        if isinstance(value, Param):
+            value = value.with_default('number')
+            if operator not in ARITHMETIC_OPERATOR and operator not in RELATION_OPERATOR:
+                raise ArgumentError("invalid operator: %s" % operator)
+            stmt = "%s%s%s" % (field, operator, value)
+        elif isinstance(value, basestring):
             if operator not in ARITHMETIC_OPERATOR:
                 raise ArgumentError("only support arithmetic operator if value is string")
             stmt = "%s%s\"%s\"" % (field, operator, value)
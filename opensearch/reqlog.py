@@ -0,0 +1,102 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Debug logs of http exchanges.
+
+Nothing is formatted unless the 'opensearch' logger is enabled for DEBUG, the
+exchange is sampled and a handler actually emits the record. Every record
+carries the exchange in record.opensearch as a dict for structured handlers.
+
+    opensearch.configure_logging()
+    reqlog.configure(sample_rate=0.01, max_body=256)
+"""
+import logging
+import random
+
+from opensearch import log
+from opensearch.exception import ArgumentError
+
+SECRET_PARAMS = ('Signature', 'AccessKeyId')
+
+sample_rate = 1.0
+max_body = 1024
+
+
+def configure(sample_rate=None, max_body=None):
+    """
+    :param sample_rate: fraction of exchanges logged, in [0, 1].
+    :param max_body: max characters of a response body and of each param value in the message,
+        0 omits them.
+    """
+    g = globals()
+    if sample_rate is not None:
+        if not 0 <= sample_rate <= 1:
+            raise ArgumentError("sample_rate must be in [0, 1]")
+        g['sample_rate'] = sample_rate
+    if max_body is not None:
+        if max_body < 0:
+            raise ArgumentError("max_body must not be negative")
+        g['max_body'] = max_body
+
+
+class _Params(object):
+    # formatted only when the record is emitted
+
+    __slots__ = ('params', 'limit')
+
+    def __init__(self, params, limit):
+        self.params = params
+        self.limit = limit
+
+    def __str__(self):
+        if not isinstance(self.params, dict):
+            return str(_Body(str(self.params), self.limit))
+        # a push carries its items as a param, values are truncated like bodies
+        return "{%s}" % ", ".join("%s: %s" % (k, _Body(repr(k in SECRET_PARAMS and '***' or v), self.limit))
+                                  for k, v in sorted(self.params.iteritems()))
+
+
+class _Body(object):
+
+    __slots__ = ('body', 'limit')
+
+    def __init__(self, body, limit):
+        self.body = body
+        self.limit = limit
+
+    def __str__(self):
+        body = self.body or ''
+        if len(body) <= self.limit:
+            return body
+        return "%s...(%d more)" % (body[:self.limit], len(body) - self.limit)
+
+
+def log_exchange(transport, url, method, params, status, body, elapsed):
+    """Log one request and its response at DEBUG level.
+
+    :param transport: name of the http client, e.g. 'httplib'.
+    :param elapsed: seconds the exchange took.
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    exchange = dict(transport=transport, url=url, method=method, params=params,
+                    status=status, elapsed=elapsed, body_length=body is not None and len(body) or 0)
+    log.debug("[%s] %s %s params: %s status: %s elapsed: %.3fms body: %s",
+              transport, method, url, _Params(params, max_body), status, elapsed * 1000,
+              _Body(body, max_body), extra={'opensearch': exchange})
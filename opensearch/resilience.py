@@ -0,0 +1,469 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import random
+import threading
+import time
+
+from collections import deque
+from opensearch.exception import ArgumentError, CircuitOpenError, HTTPError, TimeoutError
+from opensearch.metrics import Histogram, HistogramObserver
+
+
+def is_transient(error):
+    """Whether an error may succeed when the request is sent again.
+    """
+    if isinstance(error, (CircuitOpenError, TimeoutError)) or not isinstance(error, HTTPError):
+        return False
+    return error.status is None or error.status >= 500 or error.status == 429
+
+
+class RetryPolicy(object):
+    """Retry idempotent requests that failed with a transient http error.
+
+    Waits between attempts grow exponentially with full jitter:
+    random(0, min(max_backoff, backoff * 2 ** attempt)).
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.05, max_backoff=1.0, paths=('/search', '/suggest')):
+        """
+        :param max_attempts: max attempts including the first one.
+        :param backoff: base wait in seconds.
+        :param max_backoff: max wait in seconds.
+        :param paths: api paths retried for GET requests, they must be idempotent.
+        """
+        if max_attempts < 1:
+            raise ArgumentError("max_attempts must be greater than 0")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.paths = paths
+        self.retries = 0
+
+    def attempts(self, path, method):
+        if method == 'GET' and path in self.paths:
+            return self.max_attempts
+        return 1
+
+    def wait_time(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+class HedgePolicy(object):
+    """Send a duplicate request when the first one is slower than usual.
+
+    The delay is the given percentile of recent latencies of the path. Until
+    min_samples latencies are known the fixed delay is used, None disables
+    hedging until then.
+    """
+
+    def __init__(self, percentile=95, delay=None, min_samples=20, window=1000, max_workers=16,
+                 paths=('/search', '/suggest')):
+        """
+        :param percentile: latency percentile after which the duplicate is sent.
+        :param delay: seconds used before enough latencies are recorded.
+        :param min_samples: latencies needed before the percentile is used.
+        :param window: number of recent latencies kept per path.
+        :param max_workers: threads sending hedged requests.
+        :param paths: api paths hedged for GET requests.
+        """
+        if not 0 < percentile <= 100:
+            raise ArgumentError("percentile must be in (0, 100]")
+        self.percentile = percentile
+        self.delay = delay
+        self.min_samples = min_samples
+        self.window = window
+        self.max_workers = max_workers
+        self.paths = paths
+        self.hedged = 0
+        self.hedge_wins = 0
+
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        # not the client's pool: hedged requests are often sent from that pool's threads
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    from multiprocessing.pool import ThreadPool
+                    self._executor = ThreadPool(self.max_workers)
+        return self._executor
+
+    def applies(self, path, method):
+        return method == 'GET' and path in self.paths
+
+    def record(self, path, latency):
+        with self._lock:
+            latencies = self._latencies.get(path)
+            if latencies is None:
+                latencies = self._latencies[path] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def delay_for(self, path):
+        with self._lock:
+            latencies = self._latencies.get(path)
+            if latencies is None or len(latencies) < self.min_samples:
+                return self.delay
+            ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))]
+
+
+class CircuitBreaker(object):
+    """Per host circuit breaker.
+
+    After failure_threshold consecutive transient failures the circuit of a
+    host opens and requests fail fast with CircuitOpenError. After
+    recovery_timeout seconds one trial request is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=10):
+        if failure_threshold < 1:
+            raise ArgumentError("failure_threshold must be greater than 0")
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.rejected = 0
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def state(self, host):
+        with self._lock:
+            return self._hosts.get(host, (self.CLOSED, 0, 0))[0]
+
+    def allow(self, host):
+        """Raise CircuitOpenError if requests to host must fail fast.
+        """
+        with self._lock:
+            state, failures, opened_at = self._hosts.get(host, (self.CLOSED, 0, 0))
+            if state == self.CLOSED:
+                return
+            if state == self.OPEN and time.time() - opened_at >= self.recovery_timeout:
+                self._hosts[host] = (self.HALF_OPEN, failures, opened_at)
+                return
+            self.rejected += 1
+        raise CircuitOpenError("circuit breaker of %s is %s" % (host, state), sent=False)
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def record_failure(self, host):
+        with self._lock:
+            state, failures, opened_at = self._hosts.get(host, (self.CLOSED, 0, 0))
+            failures += 1
+            if state == self.HALF_OPEN or failures >= self.failure_threshold:
+                self._hosts[host] = (self.OPEN, failures, time.time())
+            else:
+                self._hosts[host] = (self.CLOSED, failures, opened_at)
+
+
+class _Waiter(object):
+
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class RateLimiter(object):
+    """Token bucket in front of an app's QPS quota, shared by priority classes.
+
+    Every request sent to the server takes a token, tokens come back at rate
+    per second up to burst. When none is left, requests wait in a FIFO queue
+    per class and tokens are handed to the classes in proportion to their
+    weights, so pushes keep flowing under heavy search traffic but search
+    waits less. A request answered with HTTP 429 or one of throttle_codes
+    cuts the rate by decrease, it then grows back by recovery per second up
+    to max_rate.
+
+        limiter = RateLimiter(max_rate=100, throttle_codes=(...))
+        client = OpenSearchClient(api_host, access_key_id, access_key_secret, rate_limiter=limiter)
+    """
+
+    CLASSES = ('search', 'suggest', 'push', 'admin')
+    WEIGHTS = {'search': 8, 'suggest': 4, 'push': 2, 'admin': 1}
+
+    def __init__(self, max_rate, burst=None, min_rate=1.0, throttle_codes=(), decrease=0.7, recovery=None,
+                 weights=None):
+        """
+        :param max_rate: the quota in requests per second.
+        :param burst: max tokens saved while idle, max_rate by default.
+        :param min_rate: the rate is never cut below it.
+        :param throttle_codes: ApiError codes the server answers when the quota is exceeded.
+        :param decrease: the rate is multiplied by it when a request is throttled.
+        :param recovery: requests per second the rate grows each second, max_rate / 20 by default.
+        :param weights: dict of class -> share of the tokens when several classes wait.
+        """
+        if max_rate <= 0 or min_rate <= 0 or min_rate > max_rate:
+            raise ArgumentError("max_rate and min_rate must be greater than 0, min_rate not above max_rate")
+        if not 0 < decrease < 1:
+            raise ArgumentError("decrease must be in (0, 1)")
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min_rate)
+        self.burst = float(burst or max_rate)
+        self.throttle_codes = frozenset(throttle_codes)
+        self.decrease = decrease
+        self.recovery = recovery is None and self.max_rate / 20 or float(recovery)
+        self.weights = dict(self.WEIGHTS, **(weights or {}))
+
+        self.rate = self.max_rate
+        self.throttled = 0
+
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._queues = dict((cls, deque()) for cls in self.weights)
+        self._passes = dict((cls, 0.0) for cls in self.weights)
+        self._waits = dict((cls, Histogram(HistogramObserver.BUCKETS)) for cls in self.weights)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def classify(self, path):
+        """The priority class of an api path.
+        """
+        if path == '/search':
+            return 'search'
+        if path == '/suggest':
+            return 'suggest'
+        if path.startswith('/index/doc/'):
+            return 'push'
+        return 'admin'
+
+    def acquire(self, cls, deadline=None):
+        """Take a token, waiting behind the queued requests if none is left.
+
+        :param deadline: time.time() after which TimeoutError is raised.
+        :return: seconds waited.
+        """
+        started = time.time()
+        with self._lock:
+            self._refill(started)
+            if self._tokens >= 1 and not any(self._queues.itervalues()):
+                self._tokens -= 1
+                self._waits[cls].observe(0.0)
+                return 0.0
+
+            waiter = _Waiter()
+            queue = self._queues[cls]
+            if not queue:
+                # a class starting to wait gets no credit for the time it was idle
+                self._passes[cls] = max(self._passes[cls], min(
+                    self._passes[c] for c, q in self._queues.iteritems() if q or c == cls))
+            queue.append(waiter)
+            while True:
+                now = time.time()
+                self._refill(now)
+                self._grant()
+                if waiter.granted:
+                    break
+                if deadline is not None and now >= deadline:
+                    queue.remove(waiter)
+                    raise TimeoutError("request deadline exceeded waiting for the rate limiter")
+                wait = (1 - self._tokens) / self.rate
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+                self._changed.wait(max(wait, 0.001))
+            waited = time.time() - started
+            self._waits[cls].observe(waited)
+            return waited
+
+    def record_throttled(self):
+        """Cut the rate after the server rejected a request for exceeding the quota.
+        """
+        with self._lock:
+            self._refill(time.time())
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            self.throttled += 1
+
+    def stats(self):
+        """Current rate, and queue depth and wait time percentiles in seconds per class.
+        """
+        with self._lock:
+            classes = dict((cls, dict(depth=len(self._queues[cls]), granted=self._waits[cls].count,
+                                      wait_p50=self._waits[cls].percentile(50),
+                                      wait_p99=self._waits[cls].percentile(99)))
+                           for cls in self._queues)
+            return dict(rate=self.rate, throttled=self.throttled, classes=classes)
+
+    def _refill(self, now):
+        # caller holds self._lock
+        elapsed = max(0.0, now - self._updated)
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self.rate = min(self.max_rate, self.rate + elapsed * self.recovery)
+
+    def _grant(self):
+        # caller holds self._lock. stride scheduling: the waiting class with the lowest pass goes next
+        granted = False
+        while self._tokens >= 1:
+            waiting = [cls for cls, queue in self._queues.iteritems() if queue]
+            if not waiting:
+                break
+            cls = min(waiting, key=self._passes.get)
+            self._passes[cls] += 1.0 / self.weights[cls]
+            self._queues[cls].popleft().granted = True
+            self._tokens -= 1
+            granted = True
+        if granted:
+            self._changed.notify_all()
+
+
+class _EndpointState(object):
+
+    __slots__ = ('latency', 'inflight', 'failures', 'cooldown_until', 'probing')
+
+    def __init__(self):
+        self.latency = None
+        self.inflight = 0
+        self.failures = 0
+        self.cooldown_until = 0
+        self.probing = False
+
+
+class Router(object):
+    """Choose one of several endpoints serving the same apps for each request.
+
+    An endpoint that failed is put into cooldown for cooldown seconds, then a
+    single request probes it: success brings it back, failure starts another
+    cooldown. When every endpoint is cooling down, the one whose cooldown
+    ends first is tried anyway.
+    """
+
+    def __init__(self, endpoints, cooldown=10, decay=0.3):
+        """
+        :param endpoints: api hosts, e.g. ['http://opensearch-cn-hangzhou.aliyuncs.com', ...]
+        :param cooldown: seconds a failed endpoint is avoided.
+        :param decay: weight of the newest latency in the moving average.
+        """
+        if not endpoints:
+            raise ArgumentError("endpoints is required")
+        if not 0 < decay <= 1:
+            raise ArgumentError("decay must be in (0, 1]")
+        self.endpoints = list(endpoints)
+        self.cooldown = cooldown
+        self.decay = decay
+        self.failovers = 0
+        self._states = dict((endpoint, _EndpointState()) for endpoint in self.endpoints)
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        """Pick the endpoint of the next attempt, None when all are excluded.
+
+        Every chosen endpoint must be reported to record_success() or record_failure().
+        """
+        with self._lock:
+            now = time.time()
+            healthy = []
+            due = None
+            cooling = None
+            for endpoint in self.endpoints:
+                if endpoint in exclude:
+                    continue
+                state = self._states[endpoint]
+                if state.cooldown_until == 0:
+                    healthy.append(endpoint)
+                elif state.cooldown_until <= now and not state.probing:
+                    due = due or endpoint
+                elif cooling is None or state.cooldown_until < self._states[cooling].cooldown_until:
+                    cooling = endpoint
+            if due is not None:
+                self._states[due].probing = True
+                endpoint = due
+            elif healthy:
+                endpoint = self._pick(healthy)
+            else:
+                endpoint = cooling
+            if endpoint is None:
+                return None
+            if exclude:
+                self.failovers += 1
+            self._states[endpoint].inflight += 1
+            return endpoint
+
+    def record_success(self, endpoint, latency):
+        """The endpoint answered, whatever the answer.
+        """
+        with self._lock:
+            state = self._states[endpoint]
+            state.inflight -= 1
+            state.failures = 0
+            state.cooldown_until = 0
+            state.probing = False
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency += self.decay * (latency - state.latency)
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            state = self._states[endpoint]
+            state.inflight -= 1
+            state.failures += 1
+            state.cooldown_until = time.time() + self.cooldown
+            state.probing = False
+
+    def stats(self):
+        """Latency average in seconds, requests in flight, consecutive failures and cooldown of every endpoint.
+        """
+        with self._lock:
+            now = time.time()
+            return dict((endpoint, dict(latency=state.latency, inflight=state.inflight, failures=state.failures,
+                                        cooling=state.cooldown_until > now))
+                        for endpoint, state in self._states.iteritems())
+
+    def _pick(self, healthy):
+        # caller holds self._lock
+        raise NotImplementedError
+
+
+class LatencyRouter(Router):
+    """Send each request to the faster of two random healthy endpoints.
+
+    Endpoints are compared by their moving average latency times the
+    requests in flight plus one, an endpoint without latency yet wins so
+    every endpoint gets measured. Comparing two random endpoints instead of
+    taking the best one keeps a small share of the traffic on the others,
+    so their averages stay current.
+    """
+
+    def _pick(self, healthy):
+        if len(healthy) == 1:
+            return healthy[0]
+        first, second = random.sample(healthy, 2)
+        return min(first, second, key=self._score)
+
+    def _score(self, endpoint):
+        state = self._states[endpoint]
+        return (state.latency or 0.0) * (state.inflight + 1)
+
+
+class FailoverRouter(Router):
+    """Send every request to the first healthy endpoint in the given order.
+
+    Writes keep going to one endpoint, the next ones take over while it
+    cools down and it gets the traffic back once a probe succeeds.
+    """
+
+    def _pick(self, healthy):
+        return healthy[0]
@@ -15,8 +15,11 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import hmac
 import urllib
 
+from binascii import b2a_base64
+from hashlib import sha1
 from opensearch.exception import ArgumentError
 
 
@@ -33,18 +36,75 @@ class Signature(object):
         if not isinstance(querys, dict):
             raise ArgumentError("Invalid querys parameter. it must be a dict instance")
 
-        querys.pop('Signature')
+        querys.pop('Signature', None)
 
-        sorted_querys = sorted(querys.iteritems(), key=lambda d: d[0])
-        return urllib.urlencode(sorted_querys)
+        # keys of a dict are unique, so sorting the pairs sorts by key
+        return urllib.urlencode(sorted(querys.iteritems()))
 
     def prepare_base_string(self, http_method, canonicalized_query_string):
         return "%s&%%2F&%s" % (http_method, urllib.quote(canonicalized_query_string))
 
     def hmac_sha1(self, key, raw):
-        from hashlib import sha1
-        import hmac
-        import binascii
-
         hashed = hmac.new(key, raw, sha1)
-        return binascii.b2a_base64(hashed.digest())[:-1]
\ No newline at end of file
+        return b2a_base64(hashed.digest())[:-1]
+
+
+class Signer(object):
+    """Signature bound to one access key secret.
+
+    The HMAC key schedule is computed once and copied for every request, which
+    makes signing many requests with the same secret cheaper than Signature.sign().
+    """
+
+    MAX_CACHED_PAIRS = 4096
+    MAX_CACHED_VALUE = 256
+    # unique per request or too large to be worth keeping
+    UNCACHED_PARAMS = ('Timestamp', 'SignatureNonce', 'items')
+
+    def __init__(self, access_key_secret):
+        self.access_key_secret = access_key_secret
+        self._hmac = hmac.new(access_key_secret + '&', digestmod=sha1)
+        self._pairs = {}
+
+    def sign(self, http_method, querys):
+        """Sign the request params, the same result as Signature().sign(access_key_secret, ...)
+
+        :param http_method: 'GET' or 'POST'
+        :param querys: request params dict, the 'Signature' key is removed if present.
+        :return: signature -> string
+        """
+        if not isinstance(querys, dict):
+            raise ArgumentError("Invalid querys parameter. it must be a dict instance")
+        querys.pop('Signature', None)
+
+        # quote(urlencode(pairs)) is built pair by pair, most pairs (Version,
+        # AccessKeyId, index_name, hot queries ...) repeat between requests.
+        pairs = self._pairs
+        encoded = []
+        for pair in sorted(querys.iteritems()):
+            k, v = pair
+            if (k in self.UNCACHED_PARAMS or not isinstance(v, (basestring, int, long, float))
+                    or isinstance(v, basestring) and len(v) > self.MAX_CACHED_VALUE):
+                encoded.append(urllib.quote(urllib.urlencode((pair,))))
+                continue
+            # 1, 1.0 and True are equal keys but quote differently
+            key = (k, type(v), v)
+            quoted = pairs.get(key)
+            if quoted is None:
+                quoted = urllib.quote(urllib.urlencode((pair,)))
+                if len(pairs) >= self.MAX_CACHED_PAIRS:
+                    pairs.clear()
+                pairs[key] = quoted
+            encoded.append(quoted)
+
+        hashed = self._hmac.copy()
+        hashed.update("%s&%%2F&%s" % (http_method, '%26'.join(encoded)))
+        return b2a_base64(hashed.digest())[:-1]
+
+    def sign_many(self, http_method, querys_list):
+        """Sign a batch of requests.
+
+        :return: signatures -> list of string, in the order of querys_list
+        """
+        sign = self.sign
+        return [sign(http_method, querys) for querys in querys_list]
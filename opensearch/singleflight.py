@@ -0,0 +1,72 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with the same key into one.
+
+    While a call for a key is running, other callers with the same key wait
+    for it and receive its result or exception instead of calling again.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.deduplicated = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.calls += 1
+            else:
+                call.waiters += 1
+                self.deduplicated += 1
+        if not leader:
+            call.event.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception, e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return dict(calls=self.calls, deduplicated=self.deduplicated, inflight=len(self._inflight))
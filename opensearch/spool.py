@@ -0,0 +1,480 @@
+# coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+
+from opensearch import log
+from opensearch.api import Document
+from opensearch.bulk import BulkResult
+from opensearch.exception import ArgumentError, OpenSearchError
+from opensearch.fingerprint import fingerprint
+
+SEGMENT_SUFFIX = '.log'
+CHECKPOINT = 'consumer.offset'
+
+
+def _segment_path(directory, seq):
+    return os.path.join(directory, '%020d%s' % (seq, SEGMENT_SUFFIX))
+
+
+def _segments(directory):
+    seqs = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+            seqs.append(int(name[:-len(SEGMENT_SUFFIX)]))
+    return sorted(seqs)
+
+
+def _frame(payload):
+    # one operation per line: crc32 of the json, a space, the json. json has no raw newline
+    return '%08x %s\n' % (zlib.crc32(payload) & 0xffffffff, payload)
+
+
+def _scan(data, max_items=None, max_bytes=None):
+    """Parse the complete records at the start of data.
+
+    :return: (payloads, end offset of the last parsed record, offset of a corrupt record or None)
+    """
+    payloads = []
+    size = 0
+    end = 0
+    while max_items is None or len(payloads) < max_items:
+        newline = data.find('\n', end)
+        if newline < 0:
+            break
+        line = data[end:newline]
+        crc, _, payload = line.partition(' ')
+        try:
+            valid = len(crc) == 8 and int(crc, 16) == zlib.crc32(payload) & 0xffffffff
+        except ValueError:
+            valid = False
+        if not valid:
+            return payloads, end, end
+        if payloads and max_bytes is not None and size + len(payload) > max_bytes:
+            break
+        payloads.append(payload)
+        size += len(payload) + 1
+        end = newline + 1
+    return payloads, end, None
+
+
+def _recover(path):
+    # cut a torn or corrupt tail left by a crash, the operations before it are kept
+    with open(path, 'rb') as f:
+        data = f.read()
+    _, end, corrupt = _scan(data)
+    if end < len(data):
+        log.warning("spool segment %s: dropped %d bytes of %s tail", path, len(data) - end,
+                    corrupt is None and 'torn' or 'corrupt')
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Spool(object):
+    """Durable append-only log of document operations in front of a SpoolConsumer.
+
+    add(), update() and delete() append the operation to the current segment
+    file of directory and return, a background thread fsyncs what was
+    appended every sync_interval seconds, so one fsync commits a whole group
+    of operations. With wait_sync the producers wait for the fsync covering
+    their operation instead. A segment is closed when it reaches
+    segment_bytes and the next one is started. Once an fsync failed, sync(),
+    the waiting producers and later appends raise OpenSearchError.
+
+    Operations dropped by the document's fingerprints are not spooled, the
+    SpoolConsumer records the fingerprints of the operations it pushed.
+    Only one Spool may write to a directory.
+
+        with Spool(Document(client, 'app', 'main'), '/var/spool/main') as spool:
+            for row in rows:
+                spool.add(row)
+    """
+
+    def __init__(self, document, directory, segment_bytes=16 * 1024 * 1024, sync_interval=0.005,
+                 wait_sync=False):
+        """
+        :param document: the opensearch.api.Document table the operations are for.
+        :param directory: the segments directory, it's created if missing.
+        :param segment_bytes: size after which a new segment is started.
+        :param sync_interval: seconds between two group fsyncs.
+        :param wait_sync: wait until the operation is on disk before returning.
+        """
+        if not isinstance(document, Document):
+            raise ArgumentError("document must be 'opensearch.api.Document' type")
+        if segment_bytes < 1:
+            raise ArgumentError("segment_bytes must be greater than 0")
+        self.document = document
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync_interval = sync_interval
+        self.wait_sync = wait_sync
+
+        self.appended = 0
+        self.syncs = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        segments = _segments(directory)
+        if segments:
+            _recover(_segment_path(directory, segments[-1]))
+        # a restarted spool never appends to an old segment
+        self._seq = segments and segments[-1] + 1 or 0
+        self._file = open(_segment_path(directory, self._seq), 'ab')
+        self._size = 0
+        self._retired = []
+        self._synced = 0
+        self._sync_error = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._has_data = threading.Condition(self._lock)
+        self._has_synced = threading.Condition(self._lock)
+        self._syncer = threading.Thread(target=self._sync_loop, name='opensearch-spool-sync')
+        self._syncer.daemon = True
+        self._syncer.start()
+
+    def add(self, fields, timestamp=None):
+        self._op('add', fields, timestamp)
+
+    def update(self, fields, timestamp=None):
+        self._op('update', fields, timestamp)
+
+    def delete(self, fields, timestamp=None):
+        self._op('delete', fields, timestamp)
+
+    def _op(self, cmd, fields, timestamp=None):
+        document = self.document
+        item = document.make_item(cmd, fields, timestamp)
+        if document.fingerprints is not None and not document.track(cmd, fields, {}):
+            return
+        self.append(document.jsonify(item))
+
+    def append(self, encoded):
+        """Append one json encoded operation built by Document.make_item().
+        """
+        if isinstance(encoded, unicode):
+            encoded = encoded.encode('utf8')
+        line = _frame(encoded)
+        with self._lock:
+            if self._closed:
+                raise ArgumentError("spool is closed")
+            self._check_sync()
+            if self._size > 0 and self._size + len(line) > self.segment_bytes:
+                self._roll()
+            self._file.write(line)
+            self._size += len(line)
+            self.appended += 1
+            ticket = self.appended
+            self._has_data.notify()
+            if self.wait_sync:
+                self._wait_synced(ticket)
+
+    def sync(self):
+        """Wait until every operation appended so far is on disk.
+        """
+        with self._lock:
+            self._has_data.notify()
+            self._wait_synced(self.appended)
+
+    def close(self):
+        """Sync and close the current segment.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._has_data.notify()
+        self._syncer.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _roll(self):
+        # caller holds self._lock. the syncer fsyncs and closes the retired segment,
+        # flushing it first makes it complete for a consumer that sees the next one
+        self._file.flush()
+        self._retired.append(self._file)
+        self._seq += 1
+        self._file = open(_segment_path(self.directory, self._seq), 'ab')
+        self._size = 0
+
+    def _wait_synced(self, ticket):
+        # caller holds self._lock
+        while self._synced < ticket and self._sync_error is None and self._syncer.is_alive():
+            self._has_synced.wait(1.0)
+        if self._synced < ticket:
+            self._check_sync()
+
+    def _check_sync(self):
+        # caller holds self._lock. after a failed fsync the kernel may have dropped the dirty
+        # pages, a later fsync would not tell, so the spool refuses to go on
+        if self._sync_error is not None:
+            raise OpenSearchError("spool sync of %s failed: %s" % (self.directory, self._sync_error))
+
+    def _sync_loop(self):
+        while True:
+            with self._lock:
+                while self._synced == self.appended and not self._closed:
+                    self._has_data.wait()
+                if self._synced == self.appended and self._closed:
+                    return
+                target = self.appended
+                self._file.flush()
+                files, self._retired = self._retired + [self._file], []
+            # fsync outside the lock, producers keep appending to the python buffer meanwhile
+            error = None
+            try:
+                for f in files:
+                    os.fsync(f.fileno())
+                if len(files) > 1:
+                    _fsync_dir(self.directory)
+            except (IOError, OSError), e:
+                log.exception("spool sync of %s failed", self.directory)
+                error = e
+            for f in files[:-1]:
+                f.close()
+            with self._lock:
+                if error is not None:
+                    self._sync_error = error
+                    self._has_synced.notify_all()
+                    return
+                self._synced = target
+                self.syncs += 1
+                self._has_synced.notify_all()
+            if self.sync_interval:
+                time.sleep(self.sync_interval)
+
+
+class SpoolConsumer(object):
+    """Push the operations of a Spool directory in order.
+
+    Batches of at most max_items operations and max_bytes bytes are pushed
+    with Document.push_json(). The position after the last pushed batch is
+    saved in the directory, consumed segments are removed, so a restarted
+    consumer replays only what was not pushed. A batch is pushed at least
+    once: one that failed is retried every retry_interval seconds, after
+    max_attempts failures it's dropped.
+
+    The consumer may run in another process than the Spool. Only one
+    consumer may read a directory.
+
+        consumer = SpoolConsumer(Document(client, 'app', 'main'), '/var/spool/main', callback=report)
+        consumer.start()
+    """
+
+    def __init__(self, document, directory, max_items=1000, max_bytes=2 * 1024 * 1024, poll_interval=0.05,
+                 retry_interval=1.0, max_attempts=None, callback=None):
+        """
+        :param document: the opensearch.api.Document table to push to.
+        :param directory: the segments directory of the Spool.
+        :param max_items: max operations in one push.
+        :param max_bytes: max json bytes of one push, a bigger single operation is sent alone.
+        :param poll_interval: seconds to wait for new operations when the spool is drained.
+        :param retry_interval: seconds to wait after a failed push.
+        :param max_attempts: attempts before a batch is dropped, None means retry forever.
+        :param callback: called with a BulkResult after each push, from the consumer thread.
+        """
+        if not isinstance(document, Document):
+            raise ArgumentError("document must be 'opensearch.api.Document' type")
+        if max_items < 1 or max_bytes < 1:
+            raise ArgumentError("max_items and max_bytes must be greater than 0")
+        self.document = document
+        self.directory = directory
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.callback = callback
+
+        self.items_succeeded = 0
+        self.items_dropped = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._seq, self._offset = self._load_checkpoint()
+        self._consumed = 0
+        self._attempts = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='opensearch-spool-consumer')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the consumer thread, the operations left stay spooled.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def drain(self):
+        """Push on the calling thread until nothing is left or a push fails.
+
+        :return: number of operations pushed.
+        """
+        pushed = 0
+        while True:
+            result = self.run_once()
+            if result is None or not result.success:
+                return pushed
+            pushed += result.num_items
+
+    def run_once(self):
+        """Push the next batch.
+
+        :return: BulkResult, None if there is nothing to push.
+        """
+        payloads, end = self._next_batch()
+        if not payloads:
+            return None
+        body = '[' + ','.join(payloads) + ']'
+        try:
+            data = self.document.push_json(body)
+            result = BulkResult(self._consumed, len(payloads), len(body), data=data)
+        except Exception, e:
+            log.error("push %s spooled items to table %s failed: %s", len(payloads),
+                      self.document.table_name, e)
+            result = BulkResult(self._consumed, len(payloads), len(body), error=e)
+            self._attempts += 1
+
+        if result.success:
+            self.items_succeeded += len(payloads)
+            if self.document.fingerprints is not None:
+                self._record(payloads)
+        elif self.max_attempts is not None and self._attempts >= self.max_attempts:
+            log.error("drop %s spooled items of table %s after %s attempts", len(payloads),
+                      self.document.table_name, self._attempts)
+            self.items_dropped += len(payloads)
+        else:
+            return self._report(result)
+
+        self._attempts = 0
+        self._consumed += len(payloads)
+        self._offset = end
+        self._save_checkpoint()
+        return self._report(result)
+
+    def _record(self, payloads):
+        # fingerprints of the pushed operations, as Document.track() computes them
+        pending = {}
+        for payload in payloads:
+            item = json.loads(payload)
+            fields = item['fields']
+            pending[fields['id']] = item['cmd'] != 'delete' and fingerprint([item['cmd'], fields]) or None
+        self.document.fingerprints.update(pending)
+
+    def _report(self, result):
+        if self.callback is not None:
+            try:
+                self.callback(result)
+            except Exception:
+                log.exception("spool consumer callback raised")
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                result = self.run_once()
+            except Exception:
+                log.exception("spool consumer of %s failed", self.directory)
+                result = None
+            if result is None:
+                self._stop.wait(self.poll_interval)
+            elif not result.success:
+                self._stop.wait(self.retry_interval)
+
+    def _next_batch(self):
+        while True:
+            segments = [seq for seq in _segments(self.directory) if seq >= self._seq]
+            if not segments:
+                return [], None
+            if segments[0] != self._seq:
+                self._seq, self._offset = segments[0], 0
+            path = _segment_path(self.directory, self._seq)
+            with open(path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(self.max_bytes)
+                if len(data) == self.max_bytes and '\n' not in data:
+                    data += f.read()
+            payloads, end, corrupt = _scan(data, self.max_items, self.max_bytes)
+            if payloads:
+                return payloads, self._offset + end
+            sealed = len(segments) > 1
+            if corrupt is not None:
+                newline = data.find('\n', corrupt)
+                if newline >= 0 or sealed:
+                    skipped = newline >= 0 and newline + 1 - corrupt or len(data) - corrupt
+                    log.error("spool segment %s: skipped %d corrupt bytes at %d", path, skipped,
+                              self._offset + corrupt)
+                    self._offset += corrupt + skipped
+                    self._save_checkpoint()
+                    continue
+            if not sealed:
+                # the writer may still append to the last segment
+                return [], None
+            # the writer started a later segment after flushing this one, so it's complete
+            if data:
+                log.error("spool segment %s: dropped %d bytes of torn tail", path, len(data))
+            os.remove(path)
+            self._seq, self._offset = segments[1], 0
+            self._save_checkpoint()
+
+    def _load_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT)
+        try:
+            with open(path, 'rb') as f:
+                seq, offset = f.read().split()
+            return int(seq), int(offset)
+        except (IOError, ValueError):
+            # missing or torn: replay from the first segment
+            return 0, 0
+
+    def _save_checkpoint(self):
+        # a checkpoint lost in a crash only means replaying pushed operations, no fsync needed
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'wb') as f:
+            f.write('%d %d\n' % (self._seq, self._offset))
+        os.rename(path + '.tmp', path)
@@ -0,0 +1,101 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import time
+import unittest
+
+from opensearch.api import OpenSearchClient, Search
+from opensearch.exception import ApiError, TimeoutError
+from opensearch.httpclient import HttpClient
+from opensearch.query import SimpleQuery
+
+
+class SleepHttpClient(HttpClient):
+    """Sleeps the number of milliseconds given as the query keyword.
+    """
+
+    def request(self, url, method, params):
+        keyword = params['query'].split(':')[-1]
+        if keyword == 'error':
+            return json.dumps({'status': 'FAIL', 'errors': {'code': 2001, 'message': 'error'}})
+        time.sleep(int(keyword) / 1000.0)
+        return json.dumps({'status': 'OK', 'result': {'keyword': keyword}})
+
+
+class MultiSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = OpenSearchClient('http://localhost', 'id', 'secret',
+                                       httpclient=SleepHttpClient(), max_workers=4)
+        self.search = Search(self.client, 'app')
+
+    def tearDown(self):
+        self.client.close()
+
+    def query(self, keyword):
+        return SimpleQuery().query_by_keyword(keyword)
+
+    def test_concurrent_in_order(self):
+        started = time.time()
+        results = self.search.multi_search([self.query('200'), self.query('error'),
+                                            {'query': self.query('100'), 'formula_name': 'hot'}])
+        self.assertTrue(time.time() - started < 0.3)
+        self.assertEqual(results[0], {'keyword': '200'})
+        self.assertIsInstance(results[1], ApiError)
+        self.assertEqual(results[2], {'keyword': '100'})
+
+    def test_timeout(self):
+        started = time.time()
+        results = self.search.multi_search([self.query('10'), self.query('1000')], timeout=0.2)
+        self.assertTrue(time.time() - started < 0.5)
+        self.assertEqual(results[0], {'keyword': '10'})
+        self.assertIsInstance(results[1], TimeoutError)
+
+
+class PageHttpClient(HttpClient):
+
+    def __init__(self, total):
+        self.total = total
+        self.starts = []
+
+    def request(self, url, method, params):
+        config = dict(kv.split(':') for kv in params['query'].split('config=')[1].split('&&')[0].split(','))
+        start, hint = int(config['start']), int(config['hint'])
+        self.starts.append(start)
+        items = [{'id': str(i)} for i in range(start, min(start + hint, self.total))]
+        return json.dumps({'status': 'OK', 'result': {'total': self.total, 'viewtotal': min(self.total, 50),
+                                                      'items': items}})
+
+
+class IterResultsTest(unittest.TestCase):
+
+    def test_iter_results(self):
+        httpclient = PageHttpClient(total=1000)
+        client = OpenSearchClient('http://localhost', 'id', 'secret', httpclient=httpclient)
+        hits = Search(client, 'app').iter_results(SimpleQuery().query_by_keyword('kobe'), page_size=15)
+        self.assertEqual([hit['id'] for hit in hits], [str(i) for i in range(50)])
+        self.assertEqual(sorted(httpclient.starts), [0, 15, 30, 45])
+        client.close()
+
+    def test_short_page(self):
+        httpclient = PageHttpClient(total=23)
+        client = OpenSearchClient('http://localhost', 'id', 'secret', httpclient=httpclient)
+        hits = Search(client, 'app').iter_results(SimpleQuery().query_by_keyword('kobe'), page_size=10,
+                                                  max_results=20, typed=True)
+        self.assertEqual([hit['id'] for hit in hits], [str(i) for i in range(20)])
+        client.close()
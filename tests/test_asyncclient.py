@@ -0,0 +1,100 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import threading
+import time
+import unittest
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+
+from opensearch.api import Suggestion
+from opensearch.asyncclient import AsyncHttpClient, AsyncOpenSearchClient, Future
+from opensearch.exception import ApiError, CancelledError, TimeoutError
+
+
+class SuggestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if query['query'][0] == 'slow':
+            time.sleep(0.5)
+        if query['query'][0] == 'error':
+            body = json.dumps({'status': 'FAIL', 'errors': {'code': 2001, 'message': 'error'}})
+        else:
+            body = json.dumps({'status': 'OK', 'result': {'suggestions': query['query']}})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SuggestServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # cancelled requests close the socket before the response is written
+        pass
+
+
+class AsyncOpenSearchClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SuggestServer(('127.0.0.1', 0), SuggestHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        api_host = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.client = AsyncOpenSearchClient(api_host, 'id', 'secret', max_concurrency=4)
+        self.suggestion = Suggestion(self.client, 'app')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_suggest(self):
+        futures = [self.suggestion.suggest('q%d' % i, 'name') for i in range(20)]
+        for i, future in enumerate(futures):
+            self.assertIsInstance(future, Future)
+            self.assertEqual(future.result(), {'suggestions': ['q%d' % i]})
+
+    def test_api_error(self):
+        future = self.suggestion.suggest('error', 'name')
+        self.assertRaises(ApiError, future.result)
+
+    def test_cancel(self):
+        future = self.suggestion.suggest('slow', 'name')
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.cancelled())
+        self.assertRaises(CancelledError, future.result)
+        self.assertEqual(self.suggestion.suggest('fast', 'name').result(), {'suggestions': ['fast']})
+
+    def test_timeout(self):
+        client = AsyncOpenSearchClient(self.client.api_host, 'id', 'secret',
+                                       httpclient=AsyncHttpClient(timeout=0.1))
+        future = Suggestion(client, 'app').suggest('slow', 'name')
+        self.assertRaises(TimeoutError, future.result)
+        client.close()
@@ -0,0 +1,58 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+from benchmarks.stub import StubServer
+from opensearch.api import Document, OpenSearchClient, Search
+from opensearch.exception import ApiError, HTTPError
+from opensearch.httpclient import DefaultHttpClient
+
+
+class StubServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubServer().start()
+        self.httpclient = DefaultHttpClient()
+
+    def tearDown(self):
+        self.httpclient.close()
+        self.stub.stop()
+
+    def client(self, secret=None):
+        return OpenSearchClient(self.stub.url, self.stub.access_key_id,
+                                secret or self.stub.access_key_secret, httpclient=self.httpclient)
+
+    def test_signed_requests(self):
+        client = self.client()
+        result = Search(client, 'app').search("query=title:'kobe'&&config=start:0,hit:3")
+        self.assertEqual(result['num'], 3)
+        document = Document(client, 'app', 'main')
+        document.add({'id': '1', 'title': u'科比'})
+        document.push()
+        self.assertEqual(self.stub.counters['documents'], 1)
+
+    def test_bad_signature(self):
+        with self.assertRaises(ApiError) as cm:
+            Search(self.client('wrong'), 'app').search("query=title:'kobe'")
+        self.assertEqual(cm.exception.code, 4003)
+
+    def test_injected_errors(self):
+        self.stub.http_error_rate = 1
+        with self.assertRaises(HTTPError) as cm:
+            Search(self.client(), 'app').search("query=title:'kobe'")
+        self.assertEqual(cm.exception.status, 503)
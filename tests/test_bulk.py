@@ -0,0 +1,172 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import threading
+import unittest
+
+from benchmarks.stub import StubServer
+from opensearch.api import Document, OpenSearchClient
+from opensearch.bulk import BulkIndexer, BulkResult, ParallelPusher
+from opensearch.exception import ApiError
+from opensearch.httpclient import DefaultHttpClient
+
+
+class RecordClient(object):
+
+    def __init__(self, fail_ids=()):
+        self.pushed = []
+        self.fail_ids = fail_ids
+        self.lock = threading.Lock()
+
+    def request(self, path, method='POST', **params):
+        items = json.loads(params['items'])
+        with self.lock:
+            self.pushed.append(items)
+        if any(item['fields']['id'] in self.fail_ids for item in items):
+            raise ApiError(2001, 'push failed')
+        return 'OK'
+
+
+class DocumentTest(unittest.TestCase):
+
+    def test_push_clears_items(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main')
+        doc.add({'id': 1, 'title': '北京大学'})
+        doc.push()
+        doc.delete({'id': 2})
+        doc.push()
+        self.assertEqual([len(items) for items in client.pushed], [1, 1])
+        self.assertEqual(client.pushed[1][0]['cmd'], 'delete')
+
+    def test_compact(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', compact=True)
+        doc.add({'id': 1, 'title': 'a', 'price': 1})
+        doc.update({'id': 1, 'price': 2})
+        doc.update({'id': 2, 'title': 'b'})
+        doc.update({'id': 2, 'price': 3})
+        doc.add({'id': 3, 'title': 'c'}, timestamp=20)
+        doc.delete({'id': 3}, timestamp=10)
+        doc.delete({'id': 4})
+        doc.update({'id': 4, 'price': 4})
+        doc.push()
+        self.assertEqual([(item['cmd'], item['fields']) for item in client.pushed[0]], [
+            ('add', {'id': 1, 'title': 'a', 'price': 2}),
+            ('update', {'id': 2, 'title': 'b', 'price': 3}),
+            ('add', {'id': 3, 'title': 'c'}),
+            ('delete', {'id': 4}),
+            ('update', {'id': 4, 'price': 4})])
+        self.assertEqual(doc.compaction_ratio, 8 / 5.0)
+
+    def test_compact_failed_push(self):
+        client = RecordClient(fail_ids=(1,))
+        doc = Document(client, 'app', 'main', compact=True)
+        doc.add({'id': 1, 'title': 'a'})
+        self.assertRaises(ApiError, doc.push)
+        doc.delete({'id': 1})
+        client.fail_ids = ()
+        doc.push()
+        self.assertEqual([item['cmd'] for item in client.pushed[1]], ['delete'])
+
+    def test_compact_late_delete(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', compact=True)
+        doc.add({'id': 1, 'a': 1}, timestamp=1)
+        doc.update({'id': 1, 'b': 2}, timestamp=10)
+        doc.delete({'id': 1}, timestamp=5)
+        doc.push()
+        self.assertEqual([(item['cmd'], item['fields']) for item in client.pushed[0]], [
+            ('delete', {'id': 1}),
+            ('update', {'id': 1, 'b': 2})])
+
+
+class BulkIndexerTest(unittest.TestCase):
+
+    def test_chunk_by_count(self):
+        client = RecordClient()
+        with BulkIndexer(Document(client, 'app', 'main'), max_items=10, workers=2) as indexer:
+            for i in range(95):
+                indexer.add({'id': i})
+        self.assertEqual(sorted(len(items) for items in client.pushed), [5] + [10] * 9)
+        self.assertEqual(indexer.items_succeeded, 95)
+
+    def test_chunk_by_bytes(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main')
+        with BulkIndexer(doc, max_bytes=200) as indexer:
+            for i in range(20):
+                indexer.update({'id': i, 'title': 'x' * 50})
+        for items in client.pushed:
+            self.assertTrue(len(doc.jsonify(items)) <= 200)
+        self.assertEqual(sum(len(items) for items in client.pushed), 20)
+
+    def test_report_failure(self):
+        results = []
+        client = RecordClient(fail_ids=(3,))
+        with BulkIndexer(Document(client, 'app', 'main'), max_items=2, callback=results.append) as indexer:
+            for i in range(6):
+                indexer.add({'id': i})
+        self.assertEqual(len(results), 3)
+        self.assertEqual(indexer.chunks_failed, 1)
+        self.assertEqual(indexer.items_failed, 2)
+        self.assertIsInstance([r for r in results if not r.success][0].error, ApiError)
+
+    def test_unexpected_error_reported(self):
+        results = []
+
+        class HtmlClient(RecordClient):
+
+            def request(self, path, method='POST', **params):
+                RecordClient.request(self, path, method, **params)
+                if len(self.pushed) == 1:
+                    raise ValueError('No JSON object could be decoded')
+                return 'OK'
+
+        with BulkIndexer(Document(HtmlClient(), 'app', 'main'), max_items=2, callback=results.append) as indexer:
+            for i in range(4):
+                indexer.add({'id': i})
+        self.assertEqual([r.success for r in results], [False, True])
+        self.assertIsInstance(results[0].error, ValueError)
+
+
+class ParallelPusherTest(unittest.TestCase):
+
+    def test_push_signed_chunks(self):
+        with StubServer() as stub:
+            httpclient = DefaultHttpClient(form_encoding='multipart')
+            client = OpenSearchClient(stub.url, stub.access_key_id, stub.access_key_secret,
+                                      httpclient=httpclient)
+            records = [{'id': str(i), 'title': u'科比 %d' % i} for i in range(25)]
+            records[7]['extra'] = 1
+            with ParallelPusher(Document(client, 'app', 'main'), processes=2, max_items=10) as pusher:
+                results = pusher.push(iter(records))
+            httpclient.close()
+        self.assertEqual([(r.offset, r.num_items, r.success) for r in results],
+                         [(0, 10, True), (10, 10, True), (20, 5, True)])
+        self.assertEqual(stub.counters['documents'], 25)
+        self.assertEqual(stub.counters.get('signature_failures', 0), 0)
+
+    def test_unpicklable_chunk_reported(self):
+        client = OpenSearchClient('http://localhost', 'id', 'secret', httpclient=DefaultHttpClient())
+        records = [{'id': str(i)} for i in range(4)]
+        records[3]['lock'] = threading.Lock()
+        with ParallelPusher(Document(client, 'app', 'main'), processes=1, max_items=2) as pusher:
+            pusher._send = lambda offset, num_items, encoded, finish: finish(BulkResult(offset, num_items, 0))
+            results = pusher.push(records)
+        self.assertEqual([r.success for r in results], [True, False])
@@ -0,0 +1,132 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import time
+import unittest
+
+from opensearch.api import Document, OpenSearchClient, Search, Suggestion
+from opensearch.cache import ResultCache, SuggestCache
+from opensearch.httpclient import HttpClient
+from opensearch.query import SimpleQuery
+
+
+class CountHttpClient(HttpClient):
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, url, method, params):
+        self.requests.append((url, method, params))
+        return json.dumps({'status': 'OK', 'result': {'num': len(self.requests)}})
+
+
+class SuggestHttpClient(HttpClient):
+
+    TERMS = [u'北京', u'北京大学', u'北京大学生', u'北京路', u'北海']
+
+    def __init__(self):
+        self.queries = []
+
+    def request(self, url, method, params):
+        query = params['query'].decode('utf8')
+        self.queries.append(query)
+        matched = [term for term in self.TERMS if term.startswith(query)][:int(params.get('hint', 10))]
+        return json.dumps({'status': 'OK', 'result': {'suggestions': [{'suggestion': t} for t in matched]}})
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_bytes=25)
+        cache.set('a', 'x' * 9)
+        cache.set('b', 'x' * 9)
+        cache.get('a')
+        cache.set('c', 'x' * 9)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 'x' * 9)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.01)
+        cache.set('a', 'body')
+        time.sleep(0.02)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class ClientCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.httpclient = CountHttpClient()
+        self.client = OpenSearchClient('http://localhost', 'id', 'secret',
+                                       httpclient=self.httpclient, cache=ResultCache())
+
+    def test_search_cached(self):
+        search = Search(self.client, 'app')
+        query = SimpleQuery().query_by_keyword('kobe')
+        self.assertEqual(search.search(query), {'num': 1})
+        self.assertEqual(search.search(query), {'num': 1})
+        self.assertEqual(search.search(query, formula_name='hot'), {'num': 2})
+        self.assertEqual(self.client.cache.hits, 1)
+
+    def test_push_invalidates(self):
+        search = Search(self.client, 'app')
+        query = SimpleQuery().query_by_keyword('kobe')
+        search.search(query)
+        doc = Document(self.client, 'app', 'main')
+        doc.add({'id': 1})
+        doc.push()
+        self.assertEqual(search.search(query), {'num': 3})
+        self.assertEqual(self.client.cache.invalidations, 1)
+
+
+class SuggestCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.httpclient = SuggestHttpClient()
+        self.cache = SuggestCache()
+        client = OpenSearchClient('http://localhost', 'id', 'secret', httpclient=self.httpclient)
+        self.suggestion = Suggestion(client, 'app', cache=self.cache)
+
+    def suggest(self, query, hint=None):
+        return [item['suggestion'] for item in self.suggestion.suggest(query.encode('utf8'), 'name', hint)['suggestions']]
+
+    def test_longer_prefix_filtered(self):
+        self.assertEqual(self.suggest(u'北'), self.httpclient.TERMS)
+        self.assertEqual(self.suggest(u'北京大'), [u'北京大学', u'北京大学生'])
+        self.assertEqual(self.suggest(u'北京', hint=2), [u'北京', u'北京大学'])
+        self.assertEqual(self.httpclient.queries, [u'北'])
+        self.assertEqual(self.cache.stats()['prefix_hits'], 2)
+
+    def test_truncated_not_filtered(self):
+        self.assertEqual(self.suggest(u'北', hint=2), [u'北京', u'北京大学'])
+        self.assertEqual(self.suggest(u'北', hint=1), [u'北京'])
+        self.assertEqual(self.suggest(u'北京路'), [u'北京路'])
+        self.assertEqual(self.suggest(u'北', hint=3), [u'北京', u'北京大学', u'北京大学生'])
+        self.assertEqual(self.httpclient.queries, [u'北', u'北京路', u'北'])
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_eviction_prunes_trie(self):
+        cache = SuggestCache(max_bytes=700)
+        for query in (u'北', u'北京', u'北海'):
+            cache.set('app', 'name', query, None, {'suggestions': [{'suggestion': query}]})
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get('app', 'name', u'北'), None)
+        self.assertEqual(cache.get('app', 'name', u'北海'), {'suggestions': [{'suggestion': u'北海'}]})
+        cache.clear()
+        self.assertEqual(cache.stats()['bytes'], 0)
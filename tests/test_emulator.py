@@ -0,0 +1,73 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+from opensearch.api import Document, OpenSearchClient, Search
+from opensearch.emulator import SYNTAX_ERROR, Emulator, EmulatorHttpClient
+from opensearch.exception import ApiError
+from opensearch.query import SimpleQuery
+
+
+class EmulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.emulator = Emulator()
+        client = OpenSearchClient('http://emulator', 'id', 'secret',
+                                  httpclient=EmulatorHttpClient(self.emulator))
+        self.search = Search(client, 'app')
+        document = Document(client, 'app', 'main')
+        for i in range(20):
+            document.add({'id': str(i), 'title': i % 2 and u'科比 kobe %d' % i or u'james %d' % i,
+                          'price': i * 10, 'brand': i % 3 and 'nike' or 'adidas'})
+        document.push()
+        document.update({'id': '1', 'price': 999})
+        document.delete({'id': '3'})
+        document.push()
+
+    def ids(self, query):
+        return [item['id'] for item in self.search.search(query)['items']]
+
+    def test_query_filter_sort(self):
+        query = SimpleQuery().query_by('title', "'kobe'").filter_by('price', '<', 100).\
+            add_sort('price', False).config_by(0, 10)
+        self.assertEqual(self.ids(query), ['9', '7', '5'])
+        self.assertEqual(self.ids("query=title:'科比' ANDNOT title:'5'&&filter=brand=\"adidas\""
+                                  "&&sort=-price&&config=start:0,hit:10"), ['15', '9'])
+        self.assertEqual(self.ids("query=(title:'kobe' OR title:'james') AND title:'1'"), ['1'])
+
+    def test_aggregate_and_distinct(self):
+        query = SimpleQuery().query_by('default', "'kobe'").filter_by('price', '<', 100).\
+            add_aggregate('brand', ['count()', 'sum(price)'], None)
+        facet, = self.search.search(query)['facet']
+        self.assertEqual(facet['items'], [{'value': 'nike', 'count': 2, 'sum': 120},
+                                          {'value': 'adidas', 'count': 1, 'sum': 90}])
+        result = self.search.search("query=title:'kobe'&&sort=+price&&"
+                                    "distinct=dist_key:brand,dist_count:1,reserved:false")
+        self.assertEqual([item['id'] for item in result['items']], ['5', '9'])
+        self.assertEqual(result['total'], 9)
+
+    def test_compact(self):
+        index = self.emulator.get_app('app')
+        index.compact()
+        self.assertEqual(len(index), 19)
+        self.assertEqual(self.ids("query=title:'kobe'&&sort=-price&&config=start:0,hit:1"), ['1'])
+
+    def test_syntax_error(self):
+        with self.assertRaises(ApiError) as cm:
+            self.search.search("query=title:'kobe' AND")
+        self.assertEqual(cm.exception.code, SYNTAX_ERROR)
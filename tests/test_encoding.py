@@ -0,0 +1,131 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import cgi
+import gzip
+import threading
+import unittest
+import zlib
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+from opensearch.asyncclient import AsyncHttpClient
+from opensearch.encoding import Decoder, decode_body, encode_form
+from opensearch.httpclient import DefaultHttpClient
+
+BODY = '{"status":"OK","result":"%s"}' % ('科比' * 1000)
+
+
+def gzip_compress(data):
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    # answers with BODY compressed as the client accepts, or echoes the posted items field
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = BODY
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip_compress(body)
+            self.server.compressed += 1
+        self.send_response(200)
+        if body is not BODY:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                environ={'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': self.headers['Content-Type']})
+        body = form.getfirst('items')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class EchoServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), EchoHandler)
+        self.compressed = 0
+
+
+class DecoderTest(unittest.TestCase):
+
+    def test_gzip_incremental(self):
+        data = gzip_compress(BODY)
+        decoder = Decoder('gzip')
+        chunks = [decoder.decompress(data[i:i + 7]) for i in range(0, len(data), 7)]
+        self.assertEqual(''.join(chunks) + decoder.flush(), BODY)
+
+    def test_deflate(self):
+        self.assertEqual(decode_body(zlib.compress(BODY), 'deflate'), BODY)
+        raw = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.assertEqual(decode_body(raw.compress(BODY) + raw.flush(), 'deflate'), BODY)
+        self.assertEqual(decode_body(BODY, None), BODY)
+
+    def test_multipart_smaller(self):
+        params = {'items': '[{"title":"%s"}]' % ('科比' * 100), 'Signature': 'a+b/c='}
+        multipart, content_type = encode_form(params, 'multipart')
+        urlencoded, _ = encode_form(params)
+        self.assertTrue(content_type.startswith('multipart/form-data; boundary='))
+        self.assertTrue(len(multipart) * 2 < len(urlencoded))
+
+
+class CompressedTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EchoServer()
+        self.url = 'http://127.0.0.1:%d/index/doc/app' % self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_default_client(self):
+        client = DefaultHttpClient(form_encoding='multipart')
+        self.assertEqual(client.request(self.url, 'GET', {}), BODY)
+        self.assertEqual(self.server.compressed, 1)
+        items = '[{"title":"科比"}]'
+        self.assertEqual(client.request(self.url, 'POST', {'items': items}), items)
+        client.close()
+
+    def test_async_client(self):
+        client = AsyncHttpClient(form_encoding='multipart')
+        self.assertEqual(client.request(self.url, 'GET', {}), BODY)
+        self.assertEqual(self.server.compressed, 1)
+        items = '[{"title":"科比"}]'
+        self.assertEqual(client.request(self.url, 'POST', {'items': items}), items)
+        client.close()
@@ -0,0 +1,46 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+from opensearch import jsonbackend
+from opensearch.entity import SearchResult
+from opensearch.exception import ArgumentError
+
+
+class SearchResultTest(unittest.TestCase):
+
+    def test_from_dict(self):
+        data = jsonbackend.loads('{"searchtime": 0.01, "total": 2, "num": 2, "viewtotal": 2, '
+                                 '"facet": [], "items": [{"id": "1", "title": "北京大学", '
+                                 '"index_name": "app"}, {"id": "2", "index_name": "app"}]}')
+        result = SearchResult().from_dict(data)
+        self.assertEqual((result.total, result.num, result.viewtotal), (2, 2, 2))
+        self.assertEqual(len(result.items), 2)
+        self.assertEqual(result.items._items, [None, None])
+        item = result.items[0]
+        self.assertEqual(item['title'], u'北京大学')
+        self.assertEqual(item.index_name, 'app')
+        self.assertIs(result.items[0], item)
+        self.assertEqual(result.items._items[1], None)
+        self.assertEqual([i.get('id') for i in result.items], ['1', '2'])
+
+    def test_json_backend(self):
+        self.assertRaises(ArgumentError, jsonbackend.set_json_backend, 'nosuchjson')
+        jsonbackend.set_json_backend('json')
+        self.assertEqual(jsonbackend.backend, 'json')
+        jsonbackend.set_json_backend()
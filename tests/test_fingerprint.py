@@ -0,0 +1,157 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from opensearch.api import Document
+from opensearch.asyncclient import Future
+from opensearch.bulk import BulkIndexer
+from opensearch.exception import ApiError, ArgumentError
+from opensearch.fingerprint import FingerprintStore, fingerprint
+from tests.test_bulk import RecordClient
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_stable(self):
+        self.assertEqual(fingerprint({'id': 1, 'title': u'北京'}),
+                         fingerprint(dict([('title', '北京'), ('id', 1)])))
+        self.assertNotEqual(fingerprint({'id': 1, 'title': 'a'}), fingerprint({'id': 1, 'title': 'b'}))
+
+    def test_persisted(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'main.fingerprints')
+            store = FingerprintStore(path)
+            store.update({1: 10, 'a': 20})
+            store.close()
+            store = FingerprintStore(path)
+            self.assertEqual(store.get('1'), 10)
+            self.assertEqual(store.get(u'a'), 20)
+            store.update({1: None})
+            self.assertEqual(len(store), 1)
+            store.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+class DocumentFingerprintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = FingerprintStore(':memory:')
+
+    def test_unchanged_dropped(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', fingerprints=self.store)
+        doc.add({'id': 1, 'title': 'a'})
+        doc.add({'id': 1, 'title': 'a'})
+        doc.add({'id': 2, 'title': 'b'})
+        doc.push()
+        doc.add({'id': 1, 'title': 'a'})
+        doc.update({'id': 2, 'title': 'c'})
+        doc.push()
+        self.assertEqual([[item['fields']['id'] for item in items] for items in client.pushed], [[1, 2], [2]])
+        self.assertEqual((self.store.checked, self.store.skipped), (4, 1))
+
+    def test_add_after_same_update_pushed(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', fingerprints=self.store)
+        doc.update({'id': '1', 'title': 'u'})
+        doc.push()
+        doc.add({'id': '1', 'title': 'u'})
+        doc.push()
+        self.assertEqual([items[0]['cmd'] for items in client.pushed], ['update', 'add'])
+
+    def test_all_unchanged_push(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', fingerprints=self.store)
+        doc.add({'id': 1, 'title': 'a'})
+        doc.push()
+        doc.add({'id': 1, 'title': 'a'})
+        self.assertEqual(doc.push(), None)
+        self.assertRaises(ArgumentError, doc.push)
+        self.assertEqual(len(client.pushed), 1)
+
+    def test_compact_records_folded_items(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', fingerprints=self.store, compact=True)
+        doc.add({'id': 1, 'v': 'A'}, timestamp=2)
+        doc.add({'id': 1, 'v': 'B'}, timestamp=1)
+        doc.push()
+        doc.add({'id': 1, 'v': 'B'}, timestamp=3)
+        doc.push()
+        doc.add({'id': 1, 'v': 'B'}, timestamp=4)
+        self.assertEqual(doc.push(), None)
+        self.assertEqual([items[0]['fields']['v'] for items in client.pushed], ['A', 'B'])
+
+    def test_failed_push_not_recorded(self):
+        client = RecordClient(fail_ids=(1,))
+        doc = Document(client, 'app', 'main', fingerprints=self.store)
+        doc.add({'id': 1, 'title': 'a'})
+        self.assertRaises(ApiError, doc.push)
+        self.assertEqual(len(self.store), 0)
+        client.fail_ids = ()
+        doc.push()
+        self.assertEqual(len(self.store), 1)
+
+    def test_async_push_restored_on_failure(self):
+        futures = []
+
+        class AsyncClient(object):
+            def request(self, path, method='POST', **params):
+                futures.append(Future())
+                return futures[-1]
+
+        doc = Document(AsyncClient(), 'app', 'main', fingerprints=self.store)
+        doc.add({'id': 1, 'title': 'a'})
+        doc.push()
+        self.assertEqual(len(self.store), 0)
+        futures[0].set_exception(ApiError(2001, 'push failed'))
+        self.assertEqual(len(self.store), 0)
+        doc.push()
+        futures[1].set_result('OK')
+        self.assertEqual(len(self.store), 1)
+
+    def test_delete_forgets(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', fingerprints=self.store)
+        doc.add({'id': 1, 'title': 'a'})
+        doc.push()
+        doc.delete({'id': 1})
+        doc.push()
+        doc.add({'id': 1, 'title': 'a'})
+        doc.push()
+        self.assertEqual(len(client.pushed), 3)
+
+    def test_bulk_indexer(self):
+        client = RecordClient()
+        doc = Document(client, 'app', 'main', fingerprints=self.store)
+        with BulkIndexer(doc, max_items=2, flush_interval=None) as indexer:
+            for i in range(4):
+                indexer.add({'id': i})
+            indexer.flush()
+            for i in range(6):
+                indexer.add({'id': i})
+        self.assertEqual(sum(len(items) for items in client.pushed), 6)
+        self.assertEqual(len(self.store), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
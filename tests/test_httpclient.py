@@ -0,0 +1,131 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import socket
+import threading
+import unittest
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from opensearch.api import OpenSearchClient
+from opensearch.exception import HTTPError
+from opensearch.httpclient import DefaultHttpClient, DnsCache, HttpClient
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        body = '{"status":"OK"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # applies the request then drops the connection without a response
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self.server.posts += 1
+        self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+
+class KeepAliveServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), KeepAliveHandler)
+        self.connections = set()
+        self.posts = 0
+
+
+class DefaultHttpClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = KeepAliveServer()
+        self.url = 'http://127.0.0.1:%d/search' % self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        client = DefaultHttpClient()
+        for _ in range(5):
+            self.assertEqual(client.request(self.url, 'GET', {'q': 'kobe'}), '{"status":"OK"}')
+        self.assertEqual(len(self.server.connections), 1)
+        client.close()
+
+    def test_stale_connection_replaced(self):
+        client = DefaultHttpClient()
+        client.request(self.url, 'GET', {})
+        pool = client.get_pool('http', '127.0.0.1', self.server.server_address[1])
+        conn, _ = pool._idle[-1]
+        conn.sock.shutdown(2)
+        self.assertEqual(client.request(self.url, 'GET', {}), '{"status":"OK"}')
+        self.assertEqual(len(self.server.connections), 2)
+        client.close()
+
+    def test_written_post_not_retried(self):
+        client = DefaultHttpClient()
+        client.request(self.url, 'GET', {})
+        self.assertRaises(HTTPError, client.request, self.url, 'POST', {'items': '[]'})
+        self.assertEqual(self.server.posts, 1)
+        client.close()
+
+    def test_idle_timeout(self):
+        client = DefaultHttpClient(idle_timeout=0)
+        client.request(self.url, 'GET', {})
+        client.request(self.url, 'GET', {})
+        self.assertEqual(len(self.server.connections), 2)
+        client.close()
+
+    def test_warmup(self):
+        httpclient = DefaultHttpClient()
+        client = OpenSearchClient('http://127.0.0.1:%d' % self.server.server_address[1], 'id', 'secret',
+                                  httpclient=httpclient)
+        self.assertEqual(client.warmup(connections=3, timeout=5), 3)
+        for _ in range(3):
+            httpclient.request(self.url, 'GET', {})
+        stats = httpclient.stats()
+        self.assertEqual((stats['connects'], stats['warmed'], stats['reused'], stats['idle']), (3, 3, 3, 3))
+        self.assertEqual(stats['warm_hits'], 1)
+        self.assertEqual(stats['dns_misses'], 1)
+        httpclient.close()
+
+    def test_dns_cache_dropped_on_failure(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        resolver = DnsCache(ttl=60)
+        resolver.resolve('127.0.0.1', port)
+        self.assertRaises(socket.error, resolver.create_connection, ('127.0.0.1', port))
+        resolver.resolve('127.0.0.1', port)
+        self.assertEqual((resolver.hits, resolver.misses), (1, 2))
+
+    def test_get_httpclient_shared(self):
+        self.assertIs(HttpClient.get_httpclient(), HttpClient.get_httpclient())
@@ -0,0 +1,61 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from StringIO import StringIO
+from opensearch.api import Document
+from opensearch.load import Loader, map_fields, read_csv, read_jsonl
+from tests.test_bulk import RecordClient
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmpdir, 'load.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_and_map(self):
+        records = map_fields(read_csv(StringIO("pid,name,extra\n1,北京大学,x\n2,kobe,y\n")),
+                             {'pid': 'id', 'name': 'title'})
+        self.assertEqual(list(records), [{'id': '1', 'title': '北京大学'},
+                                         {'id': '2', 'title': 'kobe'}])
+
+    def test_resume_from_checkpoint(self):
+        lines = ''.join('{"id": %d}\n' % i for i in range(25))
+
+        client = RecordClient(fail_ids=(12,))
+        loader = Loader(Document(client, 'app', 'main'), workers=3, max_items=5,
+                        checkpoint=self.checkpoint)
+        stats = loader.load(read_jsonl(StringIO(lines)))
+        self.assertEqual((stats.succeeded, stats.failed), (20, 5))
+        self.assertEqual(loader.read_checkpoint(), 10)
+
+        client = RecordClient()
+        loader = Loader(Document(client, 'app', 'main'), workers=3, max_items=5,
+                        checkpoint=self.checkpoint)
+        stats = loader.load(read_jsonl(StringIO(lines)))
+        self.assertEqual(stats.succeeded, 15)
+        self.assertEqual(sorted(item['fields']['id'] for items in client.pushed for item in items),
+                         range(10, 25))
+        self.assertEqual(loader.read_checkpoint(), 25)
@@ -0,0 +1,57 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+from opensearch.api import OpenSearchClient, Suggestion
+from opensearch.metrics import Histogram, HistogramObserver
+from tests.test_httpclient import KeepAliveServer, DefaultHttpClient
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_percentile(self):
+        histogram = Histogram((1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(50), 1.5)
+        self.assertEqual(histogram.percentile(100), 4.0)
+
+
+class HistogramObserverTest(unittest.TestCase):
+
+    def test_observe_client(self):
+        import threading
+        server = KeepAliveServer()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        metrics = HistogramObserver()
+        client = OpenSearchClient('http://127.0.0.1:%d' % server.server_address[1], 'id', 'secret',
+                                  httpclient=DefaultHttpClient(), observers=[metrics])
+        suggestion = Suggestion(client, 'app')
+        suggestion.suggest('kobe', 'name')
+        suggestion.suggest('kobe', 'name')
+        server.shutdown()
+        server.server_close()
+
+        for phase in ('build', 'sign', 'connect', 'ttfb', 'read', 'parse', 'total'):
+            self.assertTrue(metrics.percentile('/suggest', phase, 50) is not None, phase)
+        text = metrics.to_prometheus()
+        self.assertTrue('opensearch_requests_total{path="/suggest",status="200",error_code=""} 2' in text)
+        self.assertTrue('opensearch_request_phase_seconds_count{path="/suggest",phase="connect"} 1' in text)
@@ -18,7 +18,8 @@ limitations under the License.
 import unittest
 
 from opensearch import log
-from opensearch.query import RawQuery, SimpleQuery
+from opensearch.exception import QueryError
+from opensearch.query import Param, RawQuery, SimpleQuery
 
 
 class RawQueryTest(unittest.TestCase):
@@ -40,3 +41,30 @@ class SimpleQueryTest(unittest.TestCase):
             filter_by('steal', '>', 2).\
             build()
         log.debug(stmt)
+
+
+class QueryTemplateTest(unittest.TestCase):
+
+    def test_bind(self):
+        q = SimpleQuery().query_by('title', Param('keyword')).\
+            filter_by('price', '<', Param('max_price')).\
+            config_by(start=Param('start'), hint=10).\
+            add_sort('price')
+        template = q.compile()
+        self.assertEqual(template.names, frozenset(['keyword', 'max_price', 'start']))
+
+        expected = SimpleQuery().query_by('title', "'北京大学'").\
+            filter_by('price', '<', 100).\
+            config_by(start=20, hint=10).\
+            add_sort('price').build()
+        self.assertEqual(template.bind(keyword='北京大学', max_price=100, start=20), expected)
+
+    def test_escape(self):
+        template = SimpleQuery().query_by('title', Param('keyword')).\
+            filter_by('city', '=', Param('city', 'string')).compile()
+        stmt = template.bind(keyword=u"it's", city='a"b')
+        self.assertTrue("title:'it\\'s'" in stmt)
+        self.assertTrue('city="a\\"b"' in stmt)
+        self.assertRaises(QueryError, template.bind, keyword='kobe')
+        self.assertRaises(QueryError, SimpleQuery().query_by('title', 'kobe').
+                          filter_by('price', '>', Param('price')).compile().bind, price='1 OR 1')
@@ -0,0 +1,75 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import unittest
+
+from opensearch import log, reqlog
+
+
+class RecordHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class ReqLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = RecordHandler()
+        log.addHandler(self.handler)
+
+    def tearDown(self):
+        log.removeHandler(self.handler)
+        log.setLevel(logging.NOTSET)
+        reqlog.configure(sample_rate=1.0, max_body=1024)
+
+    def test_disabled(self):
+        log.setLevel(logging.INFO)
+        reqlog.log_exchange('httplib', 'http://host/search', 'GET', {}, 200, 'body', 0.01)
+        self.assertEqual(self.handler.records, [])
+
+    def test_structured_and_truncated(self):
+        log.setLevel(logging.DEBUG)
+        reqlog.configure(max_body=4)
+        reqlog.log_exchange('httplib', 'http://host/search', 'GET',
+                            {'query': 'kobe', 'Signature': 'secret'}, 200, 'x' * 10, 0.01)
+        record, = self.handler.records
+        self.assertEqual(record.opensearch['status'], 200)
+        self.assertEqual(record.opensearch['body_length'], 10)
+        message = record.getMessage()
+        self.assertTrue('xxxx...(6 more)' in message)
+        self.assertTrue('secret' not in message)
+
+    def test_params_truncated(self):
+        log.setLevel(logging.DEBUG)
+        reqlog.configure(max_body=8)
+        reqlog.log_exchange('httplib', 'http://host/push', 'POST',
+                            {'items': 'y' * 100, 'action': 'push'}, 200, 'OK', 0.01)
+        message = self.handler.records[0].getMessage()
+        self.assertTrue("action: 'push'" in message)
+        self.assertTrue("items: 'yyyyyyy...(94 more)" in message)
+
+    def test_sampling(self):
+        log.setLevel(logging.DEBUG)
+        reqlog.configure(sample_rate=0)
+        reqlog.log_exchange('httplib', 'http://host/search', 'GET', {}, 200, 'body', 0.01)
+        self.assertEqual(self.handler.records, [])
@@ -0,0 +1,276 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import threading
+import time
+import unittest
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from opensearch.api import Document, OpenSearchClient, Suggestion
+from opensearch.exception import ApiError, CircuitOpenError, HTTPError, TimeoutError
+from opensearch.httpclient import DefaultHttpClient, HttpClient
+from opensearch.resilience import CircuitBreaker, FailoverRouter, HedgePolicy, LatencyRouter, RateLimiter, RetryPolicy
+
+OK_BODY = '{"status": "OK", "result": {"suggestions": []}}'
+
+
+class ScriptHttpClient(HttpClient):
+    """Each request pops the next step: an exception to raise or seconds to sleep.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.nonces = []
+        self.lock = threading.Lock()
+
+    def request(self, url, method, params, timeout=None):
+        with self.lock:
+            self.nonces.append(params['SignatureNonce'])
+            step = self.steps and self.steps.pop(0) or 0
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, basestring):
+            return step
+        time.sleep(step)
+        return OK_BODY
+
+
+class HostsHttpClient(HttpClient):
+    """Answer per host: an exception to raise or seconds to sleep.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.sent = []
+
+    def request(self, url, method, params, timeout=None):
+        host = url[:url.index('/', len('http://'))]
+        self.sent.append(host)
+        step = self.hosts[host]
+        if isinstance(step, Exception):
+            raise step
+        time.sleep(step)
+        return OK_BODY
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(0.5)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(OK_BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class ResilienceTest(unittest.TestCase):
+
+    def client(self, httpclient, **kwargs):
+        return OpenSearchClient('http://localhost', 'id', 'secret', httpclient=httpclient, **kwargs)
+
+    def test_retry(self):
+        httpclient = ScriptHttpClient([HTTPError('down', status=503), HTTPError('reset')])
+        retry = RetryPolicy(backoff=0.001)
+        client = self.client(httpclient, retry_policy=retry)
+        self.assertEqual(Suggestion(client, 'app').suggest('kobe', 'name'), {'suggestions': []})
+        self.assertEqual(retry.retries, 2)
+        self.assertEqual(len(set(httpclient.nonces)), 3)
+
+    def test_no_retry_on_client_error(self):
+        httpclient = ScriptHttpClient([HTTPError('bad request', status=400)])
+        client = self.client(httpclient, retry_policy=RetryPolicy(backoff=0.001))
+        self.assertRaises(HTTPError, Suggestion(client, 'app').suggest, 'kobe', 'name')
+        self.assertEqual(len(httpclient.nonces), 1)
+
+    def test_circuit_breaker(self):
+        httpclient = ScriptHttpClient([HTTPError('down')] * 2)
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.1)
+        suggestion = Suggestion(self.client(httpclient, circuit_breaker=breaker), 'app')
+        for _ in range(2):
+            self.assertRaises(HTTPError, suggestion.suggest, 'kobe', 'name')
+        self.assertRaises(CircuitOpenError, suggestion.suggest, 'kobe', 'name')
+        self.assertEqual(len(httpclient.nonces), 2)
+        time.sleep(0.1)
+        self.assertEqual(suggestion.suggest('kobe', 'name'), {'suggestions': []})
+        self.assertEqual(breaker.state('http://localhost'), CircuitBreaker.CLOSED)
+
+    def test_circuit_breaker_trial_error(self):
+        httpclient = ScriptHttpClient([HTTPError('down'), ValueError('bad response')])
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        suggestion = Suggestion(self.client(httpclient, circuit_breaker=breaker), 'app')
+        self.assertRaises(HTTPError, suggestion.suggest, 'kobe', 'name')
+        time.sleep(0.05)
+        self.assertRaises(ValueError, suggestion.suggest, 'kobe', 'name')
+        self.assertEqual(breaker.state('http://localhost'), CircuitBreaker.OPEN)
+        time.sleep(0.05)
+        self.assertEqual(suggestion.suggest('kobe', 'name'), {'suggestions': []})
+        self.assertEqual(breaker.state('http://localhost'), CircuitBreaker.CLOSED)
+
+    def test_hedge(self):
+        httpclient = ScriptHttpClient([0.5, 0])
+        hedge = HedgePolicy(delay=0.05)
+        suggestion = Suggestion(self.client(httpclient, hedge_policy=hedge), 'app')
+        started = time.time()
+        self.assertEqual(suggestion.suggest('kobe', 'name'), {'suggestions': []})
+        self.assertTrue(time.time() - started < 0.3)
+        self.assertEqual((hedge.hedged, hedge.hedge_wins), (1, 1))
+
+    def test_hedge_primaries_not_queued(self):
+        httpclient = ScriptHttpClient([0.1] * 16)
+        hedge = HedgePolicy(delay=1.0, max_workers=2)
+        suggestion = Suggestion(self.client(httpclient, hedge_policy=hedge), 'app')
+        threads = [threading.Thread(target=suggestion.suggest, args=('kobe', 'name')) for _ in range(16)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(time.time() - started < 0.5)
+        self.assertEqual(hedge.hedged, 0)
+
+    def test_deadline(self):
+        server = SlowServer(('127.0.0.1', 0), SlowHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        client = OpenSearchClient('http://127.0.0.1:%d' % server.server_address[1], 'id', 'secret',
+                                  httpclient=DefaultHttpClient(), timeout=0.1)
+        started = time.time()
+        self.assertRaises(TimeoutError, Suggestion(client, 'app').suggest, 'kobe', 'name')
+        self.assertTrue(time.time() - started < 0.4)
+        server.shutdown()
+        server.server_close()
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(max_rate=100, burst=5)
+        started = time.time()
+        waits = [limiter.acquire('search') for _ in range(15)]
+        self.assertEqual(waits[:5], [0.0] * 5)
+        self.assertTrue(0.08 <= time.time() - started < 0.5)
+        self.assertEqual(limiter.stats()['classes']['search']['granted'], 15)
+
+    def test_weighted_classes(self):
+        limiter = RateLimiter(max_rate=200, burst=1)
+        limiter.acquire('push')
+        order = []
+        lock = threading.Lock()
+
+        def take(cls):
+            limiter.acquire(cls)
+            with lock:
+                order.append(cls)
+
+        threads = [threading.Thread(target=take, args=(cls,)) for cls in ['push'] * 10 + ['search'] * 10]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # search takes 4 tokens for each push token while both wait
+        self.assertTrue(order[:10].count('search') >= 7, order)
+
+    def test_deadline(self):
+        limiter = RateLimiter(max_rate=1, burst=1)
+        limiter.acquire('admin')
+        self.assertRaises(TimeoutError, limiter.acquire, 'admin', time.time() + 0.05)
+        self.assertEqual(limiter.stats()['classes']['admin']['depth'], 0)
+
+    def test_throttled_cuts_rate(self):
+        throttled = '{"status": "FAIL", "errors": {"code": 9999, "message": "qps exceeded"}}'
+        limiter = RateLimiter(max_rate=50, throttle_codes=(9999,), recovery=0.001)
+        httpclient = ScriptHttpClient([throttled, HTTPError('too many requests', status=429)])
+        client = OpenSearchClient('http://localhost', 'id', 'secret', httpclient=httpclient, rate_limiter=limiter)
+        self.assertRaises(ApiError, Suggestion(client, 'app').suggest, 'kobe', 'name')
+        self.assertRaises(HTTPError, Suggestion(client, 'app').suggest, 'kobe', 'name')
+        self.assertEqual(limiter.throttled, 2)
+        self.assertTrue(limiter.rate < 50 * 0.7 * 0.7 + 0.1)
+
+
+class RouterTest(unittest.TestCase):
+
+    HOSTS = ['http://a', 'http://b']
+
+    def test_failover_and_cooldown(self):
+        httpclient = HostsHttpClient({'http://a': HTTPError('connection refused'), 'http://b': 0})
+        router = FailoverRouter(self.HOSTS, cooldown=0.05)
+        client = OpenSearchClient(self.HOSTS, 'id', 'secret', httpclient=httpclient, read_router=router)
+        suggestion = Suggestion(client, 'app')
+        suggestion.suggest('kobe', 'name')
+        suggestion.suggest('kobe', 'name')
+        self.assertEqual(httpclient.sent, ['http://a', 'http://b', 'http://b'])
+        self.assertTrue(router.stats()['http://a']['cooling'])
+        time.sleep(0.06)
+        httpclient.hosts['http://a'] = 0
+        suggestion.suggest('kobe', 'name')
+        suggestion.suggest('kobe', 'name')
+        self.assertEqual(httpclient.sent[3:], ['http://a', 'http://a'])
+        self.assertEqual(router.failovers, 1)
+
+    def test_status_error_not_failed_over(self):
+        httpclient = HostsHttpClient({'http://a': HTTPError('unavailable', status=503), 'http://b': 0})
+        client = OpenSearchClient(self.HOSTS, 'id', 'secret', httpclient=httpclient)
+        document = Document(client, 'app', 'main')
+        document.add({'id': 1})
+        self.assertRaises(HTTPError, document.push)
+        self.assertEqual(httpclient.sent, ['http://a'])
+        self.assertEqual(client.write_router.stats()['http://a']['failures'], 1)
+
+    def test_sent_write_not_failed_over(self):
+        httpclient = HostsHttpClient({'http://a': HTTPError('connection reset'), 'http://b': 0})
+        client = OpenSearchClient(self.HOSTS, 'id', 'secret', httpclient=httpclient)
+        document = Document(client, 'app', 'main')
+        document.add({'id': 1})
+        self.assertRaises(HTTPError, document.push)
+        self.assertEqual(httpclient.sent, ['http://a'])
+        httpclient = HostsHttpClient({'http://a': HTTPError('connection refused', sent=False), 'http://b': 0})
+        client = OpenSearchClient(self.HOSTS, 'id', 'secret', httpclient=httpclient)
+        document = Document(client, 'app', 'main')
+        document.add({'id': 1})
+        document.push()
+        self.assertEqual(httpclient.sent, ['http://a', 'http://b'])
+
+    def test_unexpected_error_recorded(self):
+        httpclient = HostsHttpClient({'http://a': ValueError('bad response'), 'http://b': 0})
+        client = OpenSearchClient(self.HOSTS, 'id', 'secret', httpclient=httpclient)
+        document = Document(client, 'app', 'main')
+        document.add({'id': 1})
+        self.assertRaises(ValueError, document.push)
+        stats = client.write_router.stats()['http://a']
+        self.assertEqual((stats['inflight'], stats['failures']), (0, 1))
+
+    def test_lowest_latency_preferred(self):
+        httpclient = HostsHttpClient({'http://a': 0.01, 'http://b': 0})
+        client = OpenSearchClient(self.HOSTS, 'id', 'secret', httpclient=httpclient)
+        self.assertTrue(isinstance(client.read_router, LatencyRouter))
+        suggestion = Suggestion(client, 'app')
+        for _ in range(20):
+            suggestion.suggest('kobe', 'name')
+        self.assertTrue(httpclient.sent.count('http://b') >= 15, httpclient.sent)
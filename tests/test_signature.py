@@ -17,7 +17,7 @@ limitations under the License.
 """
 import unittest
 
-from opensearch.signature import Signature
+from opensearch.signature import Signature, Signer
 
 
 class SignatureTest(unittest.TestCase):
@@ -32,3 +32,27 @@ class SignatureTest(unittest.TestCase):
         canonicalized = signature.canonicalize_query_string(querys)
         self.assertEqual(canonicalized, "age=36&name=kobe&team=Lakers")
 
+    def test_signer(self):
+        querys = {
+            'Signature': '',
+            'query': "query=title:'北京大学'",
+            'fetch_fields': {'title': 1},
+            'Version': 'v2',
+            'age': 36
+        }
+        expected = Signature().sign('secret', 'GET', dict(querys))
+        signer = Signer('secret')
+        self.assertEqual(signer.sign('GET', dict(querys)), expected)
+        self.assertEqual(signer.sign_many('GET', [dict(querys), dict(querys)]), [expected] * 2)
+
+    def test_signer_caches_short_values(self):
+        signer = Signer('secret')
+        querys = {'Version': 'v2', 'SignatureNonce': '123', 'items': '[]', 'query': 'x' * 1000}
+        self.assertEqual(signer.sign('POST', dict(querys)), Signature().sign('secret', 'POST', dict(querys)))
+        self.assertEqual(signer._pairs.keys(), [('Version', str, 'v2')])
+
+    def test_signer_equal_values(self):
+        signer = Signer('secret')
+        for value in (1, 1.0, True):
+            self.assertEqual(signer.sign('GET', {'hint': value}),
+                             Signature().sign('secret', 'GET', {'hint': value}))
@@ -0,0 +1,78 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import threading
+import time
+import unittest
+
+from opensearch.api import OpenSearchClient, Suggestion
+from opensearch.exception import HTTPError
+from opensearch.httpclient import HttpClient
+from opensearch.singleflight import SingleFlight
+
+
+class SlowHttpClient(HttpClient):
+
+    def __init__(self):
+        self.count = 0
+
+    def request(self, url, method, params):
+        self.count += 1
+        time.sleep(0.2)
+        return '{"status": "OK", "result": {"suggestions": []}}'
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_exception_shared(self):
+        flight = SingleFlight()
+        errors = []
+
+        def fail():
+            time.sleep(0.2)
+            raise HTTPError('down')
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except HTTPError, e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(flight.calls + flight.deduplicated, 5)
+        self.assertTrue(flight.deduplicated > 0)
+
+    def test_client_coalesce(self):
+        httpclient = SlowHttpClient()
+        client = OpenSearchClient('http://localhost', 'id', 'secret', httpclient=httpclient,
+                                  coalesce=True)
+        suggestion = Suggestion(client, 'app')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(suggestion.suggest('kobe', 'name')))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [{'suggestions': []}] * 10)
+        self.assertEqual(httpclient.count, client.singleflight.calls)
+        self.assertEqual(client.singleflight.deduplicated, 10 - httpclient.count)
+        self.assertTrue(httpclient.count < 10)
@@ -0,0 +1,131 @@
+#coding:utf8
+
+"""
+Copyright 2015 tufei
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from opensearch.api import Document
+from opensearch.exception import OpenSearchError
+from opensearch.fingerprint import FingerprintStore
+from opensearch.spool import Spool, SpoolConsumer, _segments
+from tests.test_bulk import RecordClient
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = RecordClient()
+        self.document = Document(self.client, 'app', 'main')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def pushed_ids(self):
+        return [item['fields']['id'] for items in self.client.pushed for item in items]
+
+    def test_spool_and_drain(self):
+        with Spool(self.document, self.directory, segment_bytes=200) as spool:
+            for i in range(10):
+                spool.add({'id': i, 'title': u'北京大学'})
+            spool.delete({'id': 3})
+        self.assertTrue(len(_segments(self.directory)) > 1)
+        consumer = SpoolConsumer(self.document, self.directory, max_items=4)
+        self.assertEqual(consumer.drain(), 11)
+        self.assertEqual(self.pushed_ids(), range(10) + [3])
+        self.assertTrue(all(len(items) <= 4 for items in self.client.pushed))
+        self.assertEqual(len(_segments(self.directory)), 1)
+
+    def test_failed_push_retried(self):
+        self.client.fail_ids = (1,)
+        with Spool(self.document, self.directory, wait_sync=True) as spool:
+            spool.add({'id': 1})
+            spool.add({'id': 2})
+        consumer = SpoolConsumer(self.document, self.directory)
+        self.assertEqual(consumer.drain(), 0)
+        self.client.fail_ids = ()
+        self.assertEqual(consumer.drain(), 2)
+        self.assertEqual(self.pushed_ids(), [1, 2, 1, 2])
+
+    def test_unexpected_error_counted(self):
+        def request(path, method='POST', **params):
+            raise ValueError('No JSON object could be decoded')
+
+        self.client.request = request
+        results = []
+        with Spool(self.document, self.directory, wait_sync=True) as spool:
+            spool.add({'id': 1})
+        consumer = SpoolConsumer(self.document, self.directory, max_attempts=2, callback=results.append)
+        self.assertEqual(consumer.drain(), 0)
+        self.assertEqual(consumer.drain(), 0)
+        self.assertEqual(consumer.items_dropped, 1)
+        self.assertIsInstance(results[0].error, ValueError)
+
+    def test_replay_after_crash(self):
+        spool = Spool(self.document, self.directory)
+        for i in range(3):
+            spool.add({'id': i})
+        spool.sync()
+        SpoolConsumer(self.document, self.directory, max_items=2).run_once()
+        spool.add({'id': 3})
+        spool.sync()
+        # a crash while an operation was being written
+        with open(os.path.join(self.directory, '%020d.log' % _segments(self.directory)[-1]), 'ab') as f:
+            f.write('0badc0de {"cmd": "ad')
+
+        Spool(self.document, self.directory).close()
+        SpoolConsumer(self.document, self.directory).drain()
+        self.assertEqual(self.pushed_ids(), [0, 1, 2, 3])
+
+    def test_fingerprints_recorded_when_pushed(self):
+        store = FingerprintStore(':memory:')
+        document = Document(self.client, 'app', 'main', fingerprints=store)
+        with Spool(document, self.directory) as spool:
+            spool.add({'id': 1, 'title': 'a'})
+            spool.sync()
+            self.assertEqual(len(store), 0)
+            self.client.fail_ids = (1,)
+            SpoolConsumer(document, self.directory, max_attempts=1).drain()
+            self.assertEqual(len(store), 0)
+            spool.add({'id': 1, 'title': 'a'})
+            spool.sync()
+            self.client.fail_ids = ()
+            SpoolConsumer(document, self.directory).drain()
+            self.assertEqual(len(store), 1)
+            spool.add({'id': 1, 'title': 'a'})
+        self.assertEqual(self.pushed_ids(), [1, 1])
+
+    def test_sync_failure_raised(self):
+        def fail(fd):
+            raise OSError(5, 'Input/output error')
+
+        spool = Spool(self.document, self.directory)
+        fsync, os.fsync = os.fsync, fail
+        try:
+            spool.add({'id': 1})
+            self.assertRaises(OpenSearchError, spool.sync)
+            self.assertRaises(OpenSearchError, spool.add, {'id': 2})
+        finally:
+            os.fsync = fsync
+            spool.close()
+        self.assertEqual(spool.syncs, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()